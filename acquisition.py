@@ -0,0 +1,268 @@
+################################################################################################
+# Acquisition of oedometer (no GUI)
+#
+# Owns HX711 bank (CH0-CH2), ADS1115 (CH3) and MCP4725 (DAC), runs acquisition process
+# and turns timestamped samples into filtered voltages. Used by GUI (main.py) and
+# headless daemon (headless.py). Hardware libraries are imported only when needed.
+# With replay (log file), samples of the log stand in for HX711 / ADS1115 (see replay.py).
+################################################################################################
+
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import multiprocessing as mp
+import time
+import numpy as np
+
+from filters import FilterChain
+from metrics import (QUEUE_DEPTH, RING_LOST, RING_OVERRUN, TRANSPORT, TRANSPORT_RECORDS, 
+                     Metrics)
+from ringbuffer import SAMPLE_DTYPE, SharedRingBuffer
+from timing import IntervalStatistics
+
+
+class SimulatedDAC():
+    # stand-in for MCP4725 (16 bit value property)
+    def __init__(self):
+        self.value = 0
+
+
+class LockedI2CDevice():
+    # value property of I2C device (AnalogIn, MCP4725) behind lock shared by processes on one bus
+    def __init__(self, device, lock):
+        self.device = device
+        self.lock = lock
+
+    @property
+    def value(self):
+        with self.lock:
+            return self.device.value
+
+    @value.setter
+    def value(self, value):
+        with self.lock:
+            self.device.value = value
+
+
+class Acquisition():
+    def __init__(self, pin_DT=(5, 16, 17), pin_SCK=6, ads_address=0x48, dac_address=0x60,
+                 ads_data_rate=128, hx711_timeout=0.5, ring_buffer_capacity=8192,
+                 filter_setting=(("median", 15),), simulate=False, replay=None, replay_speed=1.,
+                 sample_plan=None, hx711_rate=80, i2c_bus=1, i2c_lock=None):
+        
+        # CH0 - CH(n-1) : HX711 (channel A), CHn : ADS1115, CH(n+1) - CH(2n) : HX711 channel B
+        # when sample_plan (see MultiHX711) interleaves channel B
+        self.has_chB = sample_plan is not None and any(p[0] == "B" for p in sample_plan)
+        self.num_module = len(pin_DT) + 1 + (len(pin_DT) if self.has_chB else 0)
+        self.pin_DT = pin_DT
+        self.pin_SCK = pin_SCK
+        self.ads_address = ads_address
+        self.dac_address = dac_address
+        self.ads_data_rate = ads_data_rate
+        self.hx711_timeout = hx711_timeout
+        self.filter_setting = filter_setting
+        self.simulate = simulate
+        self.replay = replay
+        self.replay_speed = replay_speed
+        self.ads_channel = len(pin_DT)
+        self.sample_plan = sample_plan
+        self.hx711_rate = hx711_rate
+        
+        # i2c_lock (multiprocessing.Lock) serializes transactions of rigs sharing i2c_bus
+        self.i2c_bus = i2c_bus
+        self.i2c_lock = i2c_lock
+        
+        self.hx = None
+        self.ads = None
+        self.dac = None
+        self.startup_time = {}
+        self.is_running = mp.Value("i", 0)
+        self.is_replay_finished = mp.Value("i", 0)
+        self.process = None
+        
+        # timestamped per channel records shared with acquisition process
+        self.read_value = SharedRingBuffer(SAMPLE_DTYPE, capacity=ring_buffer_capacity)
+        self.read_value_ads = SharedRingBuffer(SAMPLE_DTYPE, capacity=ring_buffer_capacity)
+        self.interval_stats = IntervalStatistics(self.num_module)
+        self.metrics = Metrics()
+        self.filter_chain = [FilterChain(self.filter_setting) for i in range(self.num_module)]
+        self.is_ch_filtered = np.array([False] * self.num_module)
+        self.current_vol = [0.] * self.num_module
+        self.filtered_volts = np.zeros(0)
+        self.ch_num_rejected = np.zeros(self.num_module, dtype=np.int64)
+
+    def initialize_devices(self):
+        # GPIO (HX711) and I2C (ADS1115, MCP4725) are independent, set them up concurrently
+        print("initializing start (ADC/DAC)")
+        start = time.perf_counter()
+        
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            future_hx711 = executor.submit(self._timed, "hx711", self._initialize_hx711)
+            future_i2c = executor.submit(self._timed, "i2c", self._initialize_i2c)
+            future_hx711.result()
+            future_i2c.result()
+        
+        self.startup_time["total"] = time.perf_counter() - start
+        print("initializing end   (ADC/DAC) {:.3f} s (HX711 {:.3f} s, I2C {:.3f} s)".format(
+            self.startup_time["total"], self.startup_time["hx711"], self.startup_time["i2c"]))
+
+    def _timed(self, name, func):
+        start = time.perf_counter()
+        func()
+        self.startup_time[name] = time.perf_counter() - start
+
+    def _initialize_hx711(self):
+        if self.replay is not None:
+            return
+        
+        from multihx711 import MultiHX711
+        
+        backend = None
+        if self.simulate:
+            from hx711_simulator import create_simulated_bank
+            backend = create_simulated_bank(self.pin_DT, self.pin_SCK, rate=self.hx711_rate, noise_mV=0.001, seed=0)
+        
+        self.hx = MultiHX711(num_mod=len(self.pin_DT), pin_DT=self.pin_DT, pin_SCK=self.pin_SCK,
+                             backend=backend, acquisition_mode="edge", metrics=self.metrics,
+                             sample_plan=self.sample_plan, conversion_rate=self.hx711_rate)
+
+    def _i2c_locked(self):
+        return self.i2c_lock if self.i2c_lock is not None else contextlib.nullcontext()
+
+    def _initialize_i2c(self):
+        if self.simulate or self.replay is not None:
+            self.dac = SimulatedDAC()
+        else:
+            import adafruit_ads1x15.ads1115 as ADS
+            import adafruit_mcp4725 as MCP
+            
+            with self._i2c_locked():
+                if self.i2c_bus == 1:
+                    import board
+                    import busio
+                    self.i2c = busio.I2C(board.SCL, board.SDA)
+                else:
+                    from adafruit_extended_bus import ExtendedI2C
+                    self.i2c = ExtendedI2C(self.i2c_bus)
+                self.ads = ADS.ADS1115(self.i2c, address=self.ads_address)
+                self.dac = MCP.MCP4725(self.i2c, address=self.dac_address)
+        
+        if self.i2c_lock is not None:
+            self.dac = LockedI2CDevice(self.dac, self.i2c_lock)
+
+    def _create_ads_reader(self):
+        from ads_reader import ADS1115Reader, SimulatedAnalogIn, create_ads1115_reader
+        
+        if self.simulate:
+            reader = ADS1115Reader(SimulatedAnalogIn(data_rate=self.ads_data_rate), self.ads_channel,
+                                   self.read_value_ads, data_rate=self.ads_data_rate, metrics=self.metrics)
+        else:
+            import adafruit_ads1x15.ads1115 as ADS
+            with self._i2c_locked():
+                reader = create_ads1115_reader(self.ads, ADS.P0, self.ads_channel, self.read_value_ads,
+                                               data_rate=self.ads_data_rate, metrics=self.metrics)
+        
+        if self.i2c_lock is not None:
+            reader.analog_in = LockedI2CDevice(reader.analog_in, self.i2c_lock)
+        return reader
+
+    def start(self):
+        self.is_running.value = 1
+        self.process = mp.Process(target=self._read_adc)
+        self.process.start()
+
+    def stop(self):
+        self.is_running.value = 0
+        if self.process is not None:
+            self.process.join()
+            self.process = None
+
+    def close(self):
+        self.stop()
+        self.read_value.close()
+        self.read_value_ads.close()
+        self.metrics.close()
+
+    def _read_adc(self):
+        if self.replay is not None:
+            self._replay_adc()
+            return
+        
+        # CH3 is sampled by its own thread at ads_data_rate
+        ads_reader = self._create_ads_reader()
+        ads_reader.start()
+        
+        hx = self.hx
+        num_hx711 = len(self.pin_DT)
+        chB_offset = self.ads_channel + 1
+        
+        while self.is_running.value:
+            updated_mask, hx711_read_value = hx.wait_available(timeout=self.hx711_timeout)
+            for i in range(num_hx711):
+                if updated_mask[i]:
+                    channel = i if hx.ch_input[i] == 0 else chB_offset + i
+                    self.read_value.push((channel, hx.ch_seq[i], hx.ch_timestamp_ns[i],
+                                          hx.prev_raw_value[i], hx711_read_value[i], i, hx.ch_input[i], hx.ch_gain[i],
+                                          hx.ch_num_rejected[i]))
+        
+        ads_reader.stop()
+        hx.cleanup()
+
+    def _replay_adc(self):
+        # samples of log with original timestamps, released at replay_speed x log time
+        from replay import ReplaySource, push_records
+        
+        source = ReplaySource(self.replay)
+        start_ns = time.monotonic_ns()
+        
+        while self.is_running.value and not source.is_finished:
+            if self.replay_speed > 0:
+                push_records(self, source.read_until(
+                    source.start_t_ns + int((time.monotonic_ns() - start_ns) * self.replay_speed)))
+                time.sleep(0.001)
+            
+            # as fast as possible, but not faster than the consumer drains
+            elif max(len(self.read_value), len(self.read_value_ads)) < self.read_value.capacity // 2:
+                push_records(self, source.read_next())
+            else:
+                time.sleep(0.001)
+        
+        self.is_replay_finished.value = 1
+
+    def filter_variable(self):
+        # drain new samples and filter them per channel, returns new records
+        start = time.monotonic_ns()
+        metrics = self.metrics
+        metrics.set(QUEUE_DEPTH, len(self.read_value) + len(self.read_value_ads))
+        new_record = np.concatenate([self.read_value.read(), self.read_value_ads.read()])
+        metrics.set(RING_OVERRUN, self.read_value.num_overrun + self.read_value_ads.num_overrun)
+        metrics.set(RING_LOST, self.read_value.num_lost + self.read_value_ads.num_lost)
+        
+        # filtered volts of each record (NaN for decimated samples)
+        self.filtered_volts = np.full(len(new_record), np.nan)
+        if len(new_record) == 0:
+            return new_record
+        
+        self.interval_stats.update(new_record["channel"], new_record["t_ns"])
+        
+        # samples rejected by consistency check of HX711 so far, carried by records
+        np.maximum.at(self.ch_num_rejected, new_record["channel"], new_record["num_rejected"])
+        
+        for i in range(self.num_module):
+            is_channel = new_record["channel"] == i
+            current_queue_value = new_record["volts"][is_channel]
+            
+            if len(current_queue_value) != 0:
+                self.filtered_volts[is_channel] = self.filter_chain[i].filter_block(current_queue_value)
+                
+                if self.filter_chain[i].value is not None:
+                    self.current_vol[i] = self.filter_chain[i].value
+                    self.is_ch_filtered[i] = True
+        
+        metrics.add(TRANSPORT_RECORDS, len(new_record))
+        metrics.observe(TRANSPORT, time.monotonic_ns() - start)
+        return new_record
+
+    def print_interval_statistics(self):
+        for i, stats in enumerate(self.interval_stats.summary()):
+            print("CH{} interval mean {:.6f} s, jitter (std) {:.6f} s, min {:.6f} s, max {:.6f} s, rejected {}".format(
+                i, stats["mean"], stats["std"], stats["min"], stats["max"], self.ch_num_rejected[i]))
@@ -0,0 +1,114 @@
+################################################################################################
+# ADS1115 reader in continuous conversion mode
+#
+# ADS1115 converts continuously at data_rate and the reader thread only fetches the
+# conversion register once per conversion period (one I2C transaction, no trigger/wait),
+# pushing timestamped samples into its own ring buffer.
+################################################################################################
+
+import threading
+import time
+
+from metrics import ADS1115_READ, ADS1115_SAMPLES
+
+
+# full-scale range (V) of PGA gain, ADS1115 datasheet
+PGA_RANGE = {2 / 3: 6.144, 1: 4.096, 2: 2.048, 4: 1.024, 8: 0.512, 16: 0.256}
+
+
+class ADS1115Reader():
+    def __init__(self, analog_in, channel, read_value, data_rate=128, volt_factor=4.096 / 32767, metrics=None):
+        
+        # analog_in : object with raw code property "value" (AnalogIn or stand-in), reused every read
+        self.analog_in = analog_in
+        self.channel = channel
+        self.read_value = read_value
+        self.data_rate = data_rate
+        self.period_ns = int(1e9 / data_rate)
+        self.volt_factor = volt_factor
+        self.metrics = metrics
+        
+        self.seq = 0
+        self.num_missed_deadline = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._read_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _read_loop(self):
+        
+        # absolute deadlines keep the sampling rate locked to data_rate
+        deadline_ns = time.monotonic_ns()
+        
+        while not self._stop_event.is_set():
+            t_ns = time.monotonic_ns()
+            raw = self.analog_in.value
+            if self.metrics is not None:
+                self.metrics.observe(ADS1115_READ, time.monotonic_ns() - t_ns)
+                self.metrics.add(ADS1115_SAMPLES)
+            self.seq += 1
+            self.read_value.push((self.channel, self.seq, t_ns, raw, raw * self.volt_factor, -1, 0, 0, 0))
+            
+            deadline_ns += self.period_ns
+            wait_ns = deadline_ns - time.monotonic_ns()
+            if wait_ns > 0:
+                self._stop_event.wait(wait_ns * 1e-9)
+            else:
+                # skip conversions already missed instead of bursting to catch up
+                self.num_missed_deadline += 1
+                deadline_ns = time.monotonic_ns()
+
+
+def create_ads1115_reader(ads, pin, channel, read_value, data_rate=128, metrics=None):
+    # configure ADS1115 for continuous conversion and return reader of one input
+    from adafruit_ads1x15.ads1x15 import Mode
+    from adafruit_ads1x15.analog_in import AnalogIn
+    
+    ads.data_rate = data_rate
+    ads.mode = Mode.CONTINUOUS
+    analog_in = AnalogIn(ads, pin)
+    volt_factor = PGA_RANGE[ads.gain] / 32767
+    
+    return ADS1115Reader(analog_in, channel, read_value, data_rate=data_rate, volt_factor=volt_factor, metrics=metrics)
+
+
+class SimulatedAnalogIn():
+    # local stand-in for AnalogIn on ADS1115 with I2C transaction time
+    # single shot : every read triggers conversion and waits for it (like AnalogIn in single mode)
+    # continuous  : every read fetches the latest conversion register
+    def __init__(self, data_rate=128, continuous=True, i2c_time=0.0003, signal=0.):
+        self.data_rate = data_rate
+        self.continuous = continuous
+        self.i2c_time = i2c_time
+        self.signal = signal
+        self.start_time = time.perf_counter()
+        self.num_transaction = 0
+
+    def _transaction(self):
+        # busy wait models the CPU held by the blocking I2C driver call
+        self.num_transaction += 1
+        end = time.perf_counter() + self.i2c_time
+        while time.perf_counter() < end:
+            pass
+
+    def _code(self, now):
+        value = self.signal(now - self.start_time) if callable(self.signal) else self.signal
+        return max(-32768, min(32767, int(round(value / 4.096 * 32767))))
+
+    @property
+    def value(self):
+        if not self.continuous:
+            # write config (start conversion), wait conversion, read result
+            self._transaction()
+            time.sleep(1. / self.data_rate)
+        self._transaction()
+        return self._code(time.perf_counter())
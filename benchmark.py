@@ -0,0 +1,877 @@
+################################################################################################
+# Benchmark of acquisition hot path
+#
+# Usage : python benchmark.py
+################################################################################################
+
+import multiprocessing as mp
+import os
+import queue
+import time
+import numpy as np
+
+from ads_reader import ADS1115Reader, SimulatedAnalogIn
+from calibration import CalibrationSet, fit_profile
+from consolidation import analyze_log
+from datalogger import DataLogger
+from derived import DerivedEngine, compute_output_param, compute_specimen_parameter
+from filters import FilterChain
+from gpio_backend import SimulatedGPIOBackend
+from history import HistoryPyramid
+from metrics import HX711_READ, HX711_SAMPLES, NUM_BUCKET, Metrics
+from hx711_simulator import SimulatedHX711, create_simulated_bank
+from multihx711 import MultiHX711, decode_words, decode_bit_matrix
+from recording import AdaptiveRecorder
+from ringbuffer import SAMPLE_DTYPE, SharedRingBuffer
+from view_model import ViewModel
+
+
+def _legacy_capture(bits):
+    # string concatenation used before integer accumulation (kept as reference)
+    num_mod = bits.shape[1]
+    temp_binary_value = [""] * num_mod
+    
+    for i in range(24):
+        for j in range(num_mod):
+            temp_binary_value[j] += str(bits[i][j])
+    
+    return temp_binary_value
+
+
+def _legacy_decode(temp_binary_value, input_vol=5, chA_gain=128):
+    num_mod = len(temp_binary_value)
+    binary_max_value = "111111111111111111111111"
+    raw_value = [0.] * num_mod
+    vol_value = [0.] * num_mod
+    
+    for i in range(num_mod):
+        raw_value[i] = int(temp_binary_value[i][1:], 2) - int(int(temp_binary_value[i][0]) << (len(temp_binary_value[i]) - 1))
+        vol_value[i] = raw_value[i] / int(binary_max_value, 2) * (input_vol / chA_gain) * 1000
+    
+    return vol_value
+
+
+def _integer_capture(bits, word):
+    num_mod = bits.shape[1]
+    
+    for j in range(num_mod):
+        word[j] = 0
+    
+    for i in range(24):
+        for j in range(num_mod):
+            word[j] = (word[j] << 1) | bits[i][j]
+    
+    return word
+
+
+def _integer_decode(word, raw_value, vol_value, vol_factor):
+    decode_words(word, raw_value)
+    np.multiply(raw_value, vol_factor, out=vol_value)
+    
+    return vol_value
+
+
+def _matrix_capture(bits, bit_matrix):
+    num_mod = bits.shape[1]
+    
+    for i in range(24):
+        for j in range(num_mod):
+            bit_matrix[i, j] = bits[i][j]
+    
+    return bit_matrix
+
+
+def _matrix_decode(bit_matrix, raw_value, vol_value, vol_factor):
+    decode_bit_matrix(bit_matrix, raw_value)
+    np.multiply(raw_value, vol_factor, out=vol_value)
+    
+    return vol_value
+
+
+def _time_per_call(func, args, num_sample):
+    start = time.perf_counter()
+    for i in range(num_sample):
+        func(*args)
+    return (time.perf_counter() - start) / num_sample
+
+
+def bench_decode(num_mod=4, num_sample=20000, seed=0):
+    rng = np.random.default_rng(seed)
+    words = rng.integers(0, 1 << 24, size=num_mod)
+    bits_array = ((words[np.newaxis, :] >> np.arange(23, -1, -1)[:, np.newaxis]) & 1)
+    
+    # nested python lists mimic the cost of GPIO.input returning python int
+    bits = _ListMatrix(bits_array.tolist(), num_mod)
+    
+    vol_factor = (5 / 128) * 1000 / 0xFFFFFF
+    word = [0] * num_mod
+    raw_value = np.zeros(num_mod, dtype=np.int64)
+    vol_value = np.zeros(num_mod, dtype=np.float64)
+    bit_matrix = np.zeros((24, num_mod), dtype=np.int64)
+    
+    # check all decoders give identical results
+    temp_binary_value = _legacy_capture(bits)
+    expected = np.array(_legacy_decode(temp_binary_value))
+    _integer_capture(bits, word)
+    np.testing.assert_allclose(_integer_decode(word, raw_value, vol_value, vol_factor), expected)
+    _matrix_capture(bits, bit_matrix)
+    np.testing.assert_allclose(_matrix_decode(bit_matrix, raw_value, vol_value, vol_factor), expected)
+    
+    # (capture cost between SCK edges, decode cost after last edge)
+    result = {}
+    result["legacy (str)"] = (_time_per_call(_legacy_capture, (bits,), num_sample),
+                              _time_per_call(_legacy_decode, (temp_binary_value,), num_sample))
+    result["integer"] = (_time_per_call(_integer_capture, (bits, word), num_sample),
+                         _time_per_call(_integer_decode, (word, raw_value, vol_value, vol_factor), num_sample))
+    result["bit matrix"] = (_time_per_call(_matrix_capture, (bits, bit_matrix), num_sample),
+                            _time_per_call(_matrix_decode, (bit_matrix, raw_value, vol_value, vol_factor), num_sample))
+    
+    return result
+
+
+def bench_read_value(num_mod=4, rate=80, duration=2., metrics=None, **kwargs):
+    # poll simulated bank like Window._read_adc and measure throughput of read_value
+    pin_DT = tuple(range(2, 2 + num_mod))
+    pin_SCK = 1
+    input_mV = [0.1 * (i + 1) for i in range(num_mod)]
+    backend = create_simulated_bank(pin_DT, pin_SCK, rate=rate, input_mV=input_mV, seed=0, **kwargs)
+    hx = MultiHX711(num_mod=num_mod, pin_DT=pin_DT, pin_SCK=pin_SCK, backend=backend, metrics=metrics)
+    
+    num_read = 0
+    num_poll = 0
+    read_time = 0.
+    num_edge_start = backend.num_sck_edge
+    
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    while time.perf_counter() - wall_start < duration:
+        start = time.perf_counter()
+        is_updated, value = hx.read_value()
+        if is_updated:
+            read_time += time.perf_counter() - start
+            num_read += 1
+        num_poll += 1
+    wall_time = time.perf_counter() - wall_start
+    cpu_time = time.process_time() - cpu_start
+    
+    num_edge = backend.num_sck_edge - num_edge_start
+    
+    return {"num_mod": num_mod,
+            "rate": rate,
+            "reads_per_sec": num_read / wall_time,
+            "polls_per_sec": num_poll / wall_time,
+            "bit_latency_us": read_time / max(num_edge, 1) * 1e6,
+            "read_latency_us": read_time / max(num_read, 1) * 1e6,
+            "cpu_percent": cpu_time / wall_time * 100,
+            "last_value": np.array(value)}
+
+
+def bench_wait_value(num_mod=4, rate=80, duration=2., acquisition_mode="edge", **kwargs):
+    # latency from conversion ready (DOUT falling) to sample in hand and idle CPU usage
+    pin_DT = tuple(range(2, 2 + num_mod))
+    pin_SCK = 1
+    backend = create_simulated_bank(pin_DT, pin_SCK, rate=rate, seed=0, **kwargs)
+    hx = MultiHX711(num_mod=num_mod, pin_DT=pin_DT, pin_SCK=pin_SCK, backend=backend,
+                    acquisition_mode=acquisition_mode)
+    chips = [backend.chip_by_DT[pin] for pin in pin_DT]
+    
+    latency = []
+    
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    while time.perf_counter() - wall_start < duration:
+        is_updated, value = hx.wait_value(timeout=0.5)
+        ready_time = [chip.ready_time for chip in chips]
+        
+        # chip reset by preemption during clocking has no conversion yet
+        if is_updated and None not in ready_time:
+            latency.append(backend.clock() - max(ready_time))
+    wall_time = time.perf_counter() - wall_start
+    cpu_time = time.process_time() - cpu_start
+    
+    hx.cleanup()
+    latency = np.array(latency) * 1e6
+    
+    return {"num_mod": num_mod,
+            "acquisition_mode": acquisition_mode,
+            "reads_per_sec": len(latency) / wall_time,
+            "latency_mean_us": latency.mean(),
+            "latency_p99_us": np.percentile(latency, 99),
+            "latency_std_us": latency.std(),
+            "cpu_percent": cpu_time / wall_time * 100}
+
+
+def bench_read_available(rate=(80, 79.2, 80.8, 1e-9), duration=2., acquisition_mode="edge"):
+    # modules with slightly different oscillators and one dead module (rate ~ 0)
+    backend = SimulatedGPIOBackend()
+    pin_DT = tuple(range(2, 2 + len(rate)))
+    pin_SCK = 1
+    for i, pin in enumerate(pin_DT):
+        backend.attach(SimulatedHX711(rate=rate[i], input_mV=0.1 * (i + 1), seed=i), pin, pin_SCK)
+    
+    result = {}
+    for method in ("wait_value", "wait_available"):
+        hx = MultiHX711(num_mod=len(rate), pin_DT=pin_DT, pin_SCK=pin_SCK, backend=backend,
+                        acquisition_mode=acquisition_mode)
+        wait = getattr(hx, method)
+        seq_start = hx.ch_seq.copy()
+        
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        while time.perf_counter() - wall_start < duration:
+            wait(timeout=0.1)
+        wall_time = time.perf_counter() - wall_start
+        cpu_time = time.process_time() - cpu_start
+        
+        hx.cleanup()
+        result[method] = {"samples_per_sec": (hx.ch_seq - seq_start) / wall_time,
+                          "is_stale": hx.ch_is_stale.copy(),
+                          "cpu_percent": cpu_time / wall_time * 100}
+    
+    return result
+
+
+def bench_glitch(stall_probability=0.002, num_mod=4, rate=80, duration=2., is_checked=True, tolerance_mV=0.01):
+    # corrupted samples passed on when the reading process stalls with SCK high (simulated
+    # preemption of stall_time 100 us after some rising edges), with / without overrun and outlier
+    # test (saturated words are always dropped)
+    pin_DT = tuple(range(2, 2 + num_mod))
+    input_mV = [0.1 * (i + 1) for i in range(num_mod)]
+    backend = SimulatedGPIOBackend(stall_probability=stall_probability, seed=0)
+    create_simulated_bank(pin_DT, 1, backend=backend, rate=rate, input_mV=input_mV, seed=0)
+    check = {} if is_checked else {"max_sck_high": None, "outlier_factor": None}
+    hx = MultiHX711(num_mod=num_mod, pin_DT=pin_DT, pin_SCK=1, backend=backend, **check)
+    
+    num_sample = 0
+    num_corrupted = 0
+    wall_start = time.perf_counter()
+    while time.perf_counter() - wall_start < duration:
+        updated_mask, value = hx.wait_available(timeout=0.1)
+        num_sample += int(updated_mask.sum())
+        num_corrupted += int((np.abs(value - input_mV)[updated_mask] > tolerance_mV).sum())
+    wall_time = time.perf_counter() - wall_start
+    
+    return {"num_stall": backend.num_stall,
+            "samples_per_sec": num_sample / wall_time / num_mod,
+            "num_corrupted": num_corrupted,
+            "num_rejected": hx.num_rejected.sum(axis=0)}
+
+
+def bench_clock_group(num_mod=8, group_size=None, rate=80, spread=0.01, duration=2.):
+    # per-channel sample rate of modules with scattered oscillators (rate x (1 +- spread)),
+    # all on one SCK (group_size None) or group_size modules per SCK, and share of time spent clocking
+    rng = np.random.default_rng(0)
+    pin_DT = tuple(range(2, 2 + num_mod))
+    if group_size is None:
+        pin_SCK = 1
+    else:
+        pin_SCK = tuple(100 + i // group_size for i in range(num_mod))
+    chip_rate = list(rate * (1 + rng.uniform(-spread, spread, num_mod)))
+    backend = create_simulated_bank(pin_DT, pin_SCK, rate=chip_rate, seed=0)
+    metrics = Metrics()
+    hx = MultiHX711(num_mod=num_mod, pin_DT=pin_DT, pin_SCK=pin_SCK, backend=backend, metrics=metrics)
+    
+    hx.wait_available(timeout=0.1)
+    metrics.flush()
+    seq_start = hx.ch_seq.copy()
+    clock_ns_start = int(metrics.histogram[HX711_READ, NUM_BUCKET])
+    
+    wall_start = time.perf_counter()
+    while time.perf_counter() - wall_start < duration:
+        hx.wait_available(timeout=0.1)
+    wall_time = time.perf_counter() - wall_start
+    
+    metrics.flush()
+    clock_time = (int(metrics.histogram[HX711_READ, NUM_BUCKET]) - clock_ns_start) * 1e-9
+    metrics.close()
+    hx.cleanup()
+    samples_per_sec = (hx.ch_seq - seq_start) / wall_time
+    
+    return {"num_mod": num_mod,
+            "num_group": hx.num_group,
+            "mean_per_channel": samples_per_sec.mean(),
+            "min_per_channel": samples_per_sec.min(),
+            "bus_percent": clock_time / wall_time * 100}
+
+
+def bench_sample_plan(sample_plan=(("A", 128, 40), ("B", 32, 10)), burst=None, num_mod=4, rate=80, duration=2.):
+    # useful samples/s per input with channel A / B interleaved (burst overrides the plan)
+    pin_DT = tuple(range(2, 2 + num_mod))
+    pin_SCK = 1
+    backend = create_simulated_bank(pin_DT, pin_SCK, rate=rate, input_mV=0.1, input_B_mV=1., seed=0)
+    hx = MultiHX711(num_mod=num_mod, pin_DT=pin_DT, pin_SCK=pin_SCK, backend=backend,
+                    sample_plan=sample_plan, conversion_rate=rate)
+    if burst is not None:
+        hx.burst = list(burst)
+    
+    num_sample = np.zeros((num_mod, 2))
+    wall_start = time.perf_counter()
+    while time.perf_counter() - wall_start < duration:
+        updated_mask, value = hx.wait_available(timeout=0.1)
+        num_sample[updated_mask, hx.ch_input[updated_mask]] += 1
+    wall_time = time.perf_counter() - wall_start
+    
+    return {"burst": list(hx.burst),
+            "chA_per_sec": num_sample[:, 0].mean() / wall_time,
+            "chB_per_sec": num_sample[:, 1].mean() / wall_time,
+            "useful_percent": num_sample.sum(axis=1).mean() / wall_time / rate * 100}
+
+
+def bench_multi_rig(num_rig=2, duration=4., warmup=2.):
+    # per-rig sample rate of simulated rigs run by Supervisor (4 rigs per I2C bus)
+    from rig import DEFAULT_RIG, check_rig_config
+    from supervisor import Supervisor
+    
+    rigs = check_rig_config([dict(DEFAULT_RIG, name="rig{}".format(i), pin_DT=(4 * i + 2, 4 * i + 3, 4 * i + 4),
+                                  pin_SCK=4 * i + 5, i2c_bus=1 + i // 4, ads_address=0x48 + i % 4,
+                                  dac_address=0x60 + i % 4)
+                             for i in range(num_rig)])
+    supervisor = Supervisor(rigs, simulate=True)
+    session_start = time.perf_counter()
+    cpu_start = os.times()
+    supervisor.start()
+    
+    # count from steady state, after worker start-up
+    wall_start = time.perf_counter()
+    while time.perf_counter() - wall_start < warmup:
+        supervisor.drain()
+        time.sleep(0.1)
+    num_sample_start = [n.copy() for n in supervisor.num_sample]
+    
+    wall_start = time.perf_counter()
+    while time.perf_counter() - wall_start < duration:
+        supervisor.drain()
+        time.sleep(0.1)
+    supervisor.drain()
+    wall_time = time.perf_counter() - wall_start
+    
+    sample_rate = np.array([(n - s) / wall_time for n, s in zip(supervisor.num_sample, num_sample_start)])
+    supervisor.close()
+    
+    # CPU of supervisor and workers (counted once joined) over whole session
+    cpu_end = os.times()
+    cpu_time = sum(cpu_end[:4]) - sum(cpu_start[:4])
+    wall_time = time.perf_counter() - session_start
+    return {"num_rig": num_rig,
+            "hx711_per_channel": sample_rate[:, :3].mean(),
+            "hx711_min": sample_rate[:, :3].min(),
+            "ads1115_per_rig": sample_rate[:, 3].mean(),
+            "num_overrun": sum(supervisor.num_overrun),
+            "cpu_percent": cpu_time / wall_time * 100}
+
+
+def _produce_queue(read_value, num_record, num_channel):
+    for i in range(num_record):
+        for j in range(num_channel):
+            read_value[j].put(float(i))
+
+
+def _produce_ring_buffer(read_value, num_record, num_channel):
+    for i in range(num_record):
+        for j in range(num_channel):
+            read_value.push((j, i, time.monotonic_ns(), i, float(i), j, 0, 128, 0))
+
+
+def bench_transport(num_channel=4, num_record=20000, consumer_interval=0.05):
+    # producer process pushes records while consumer drains periodically (like GUI loop)
+    result = {}
+    
+    for name in ("mp.Queue", "SharedRingBuffer"):
+        if name == "mp.Queue":
+            read_value = [mp.Queue(maxsize=100) for i in range(num_channel)]
+            process = mp.Process(target=_produce_queue, args=(read_value, num_record, num_channel))
+        else:
+            read_value = SharedRingBuffer(SAMPLE_DTYPE, capacity=8192)
+            process = mp.Process(target=_produce_ring_buffer, args=(read_value, num_record, num_channel))
+        
+        num_received = 0
+        start = time.perf_counter()
+        process.start()
+        
+        while process.is_alive():
+            time.sleep(consumer_interval)
+            if name == "mp.Queue":
+                num_received += _drain_queue(read_value)
+            else:
+                num_received += len(read_value.read()) // num_channel
+        
+        process.join()
+        wall_time = time.perf_counter() - start
+        
+        if name == "mp.Queue":
+            num_received += _drain_queue(read_value)
+            num_overrun = 0
+        else:
+            num_received += len(read_value.read()) // num_channel
+            num_overrun = read_value.num_overrun
+            read_value.close()
+        
+        result[name] = {"records_per_sec": num_record / wall_time,
+                        "num_received": num_received,
+                        "num_overrun": num_overrun}
+    
+    return result
+
+
+def _drain_queue(read_value):
+    num_received = 0
+    for j in range(len(read_value)):
+        while True:
+            try:
+                read_value[j].get_nowait()
+            except queue.Empty:
+                break
+            num_received += (j == 0)
+    return num_received
+
+
+def bench_filter(num_sample=80, num_block=200, setting=(("median", 15),)):
+    # cost per sample of batch drain : np.append + np.median vs streaming filter chain
+    rng = np.random.default_rng(0)
+    block = rng.normal(size=num_sample)
+    chain = FilterChain(setting)
+    result = {}
+    
+    start = time.perf_counter()
+    for k in range(num_block):
+        current_queue_value = np.array([])
+        for x in block:
+            current_queue_value = np.append(current_queue_value, x)
+        np.median(current_queue_value)
+    result["np.append + median"] = (time.perf_counter() - start) / (num_sample * num_block)
+    
+    start = time.perf_counter()
+    for k in range(num_block):
+        chain.process_block(block)
+    result["filter chain"] = (time.perf_counter() - start) / (num_sample * num_block)
+    
+    return result
+
+
+def bench_calibration(num_channel=4, num_sample=80, num_block=200, degree=3, seed=0):
+    # cost per sample of calibrating blocks of samples (channels interleaved), CH0 / CH1 cubic,
+    # others linear; "+ table" adds hysteresis table on CH2 (no per-sample equivalent)
+    rng = np.random.default_rng(seed)
+    volts = np.linspace(0., 5., 11)
+    profiles = {0: fit_profile(volts, 3. * volts ** 3 - volts + 2., "p0", degree=degree),
+                1: fit_profile(volts, volts ** 3 + 5. * volts, "p1", degree=degree)}
+    table = fit_profile(np.r_[volts, volts[::-1]], np.r_[volts * 10., volts[::-1] * 10. + 1.], "t2",
+                        kind="table", direction=[1] * len(volts) + [-1] * len(volts))
+    slope = [1.] * num_channel
+    intercept = [0.] * num_channel
+    calibration = CalibrationSet(profiles, slope, intercept)
+    calibration_table = CalibrationSet({**profiles, 2: table}, slope, intercept)
+    
+    blocks = [(rng.integers(0, num_channel, num_sample), rng.uniform(0., 5., num_sample)) for i in range(num_block)]
+    
+    def per_sample(channel, volts):
+        # one polyval call per sample
+        out = []
+        for i, v in zip(channel.tolist(), volts.tolist()):
+            if i in profiles:
+                out.append(float(np.polyval(profiles[i]["coefficients"], v)) + intercept[i])
+            else:
+                out.append(slope[i] * v + intercept[i])
+        return out
+    
+    def per_channel(channel, volts):
+        # one vectorized call per channel
+        out = np.empty(len(volts))
+        for i in range(num_channel):
+            is_channel = channel == i
+            if i in profiles:
+                out[is_channel] = np.polyval(profiles[i]["coefficients"], volts[is_channel]) + intercept[i]
+            else:
+                out[is_channel] = slope[i] * volts[is_channel] + intercept[i]
+        return out
+    
+    result = {}
+    for name, func in (("per sample", per_sample), ("per channel", per_channel),
+                       ("CalibrationSet", calibration.apply), ("+ table", calibration_table.apply)):
+        start = time.perf_counter()
+        for channel, volts in blocks:
+            func(channel, volts)
+        result[name] = (time.perf_counter() - start) / (num_sample * num_block)
+    return result
+
+
+def bench_derived(num_channel=4, num_sample=80, num_block=200, seed=0):
+    # cost per sample of derived values at every sample time (channels held at last value)
+    rng = np.random.default_rng(seed)
+    specimen_parameter = compute_specimen_parameter(150., 150., 84., 2.69)
+    engine = DerivedEngine(specimen_parameter, num_channel=num_channel)
+    
+    # HX711 channels share sample times, ADS1115 channel on its own
+    blocks = []
+    t_ns = 0
+    for i in range(num_block):
+        channel = rng.integers(0, num_channel, num_sample)
+        t_ns += np.cumsum(rng.integers(0, 2, num_sample) * 1000000)
+        blocks.append((channel, t_ns, rng.uniform(0., 100., num_sample)))
+        t_ns = t_ns[-1] + 1000000
+    
+    def per_sample(channel, t_ns, value):
+        phi_val = [0.] * num_channel
+        output = []
+        for i, t, v in zip(channel.tolist(), t_ns.tolist(), value.tolist()):
+            phi_val[i] = v
+            if output and output[-1][0] == t:
+                output[-1] = (t, compute_output_param(phi_val, specimen_parameter))
+            else:
+                output.append((t, compute_output_param(phi_val, specimen_parameter)))
+        return output
+    
+    result = {}
+    for name, func in (("per sample", per_sample), ("DerivedEngine", engine.process_block)):
+        start = time.perf_counter()
+        for block in blocks:
+            func(*block)
+        result[name] = (time.perf_counter() - start) / (num_sample * num_block)
+    return result
+
+
+def _consolidation_record(stress, step_duration, offer_interval, t50=60., creep=0.002, noise=(0.05, 0.0002, 0.05, 0.005), seed=0):
+    # filtered derived records of load increments : Terzaghi settlement (Sivakugan approximation of U(Tv)),
+    # secondary compression per log cycle and gauge noise, offered every offer_interval
+    rng = np.random.default_rng(seed)
+    specimen_parameter = compute_specimen_parameter(150., 150., 84., 2.69)
+    t = np.arange(0., step_duration, offer_interval)
+    Tv = 0.197 * t / t50
+    degree = np.sqrt(4 * Tv / np.pi) / (1 + (4 * Tv / np.pi) ** 2.8) ** 0.179
+
+    time_list, phi_list = [], []
+    settlement = 0.
+    previous_stress = 0.
+    for i, s in enumerate(stress):
+        # settlement of increment grows with log of stress ratio
+        final = 0.8 * np.log10(s / previous_stress) if previous_stress > 0 else 0.5
+        curve = settlement + final * degree + creep * np.log10(1 + t / t50)
+        phi_val = np.empty((len(t), 4))
+        phi_val[:, 0] = s * specimen_parameter[2] / 1000
+        phi_val[:, 1] = specimen_parameter[0] - curve
+        phi_val[:, 2] = 10. + 0.5 * final * degree
+        phi_val[:, 3] = 2. + 0.1 * final * degree
+        phi_val += rng.normal(0., noise, phi_val.shape)
+        time_list.append(t + i * step_duration)
+        phi_list.append(phi_val)
+        settlement = curve[-1]
+        previous_stress = s
+    return specimen_parameter, np.concatenate(time_list), np.concatenate(phi_list)
+
+
+def bench_recording(stress=(50., 100., 200.), step_duration=14400., offer_interval=0.1, save_interval=1.,
+                    deadband=(0.5, 0.002, 0.5, 0.05), path="bench_recording"):
+    # fixed save_interval vs AdaptiveRecorder offered every offer_interval : records, file size,
+    # worst interpolation error per channel and Casagrande / Taylor results of consolidation.py
+    specimen_parameter, t, phi_val = _consolidation_record(stress, step_duration, offer_interval)
+    output_param = np.array([compute_output_param(x, specimen_parameter) for x in phi_val.tolist()])
+    dtype = np.dtype([("t_ns", np.int64), ("time", np.float64), ("vol", np.float64, (4,)),
+                      ("phi_val", np.float64, (4,)), ("output_param", np.float64, (5,))])
+    record = np.zeros(len(t), dtype=dtype)
+    record["t_ns"] = (t * 1e9).astype(np.int64)
+    record["time"] = t
+    record["phi_val"] = phi_val
+    record["output_param"] = output_param
+
+    recorder = AdaptiveRecorder(deadband, min_interval=offer_interval)
+    start = time.perf_counter()
+    kept = []
+    for i, (x, phi, stress_value) in enumerate(zip(t.tolist(), phi_val, output_param[:, 0].tolist())):
+        kept.extend(recorder.update(x, phi, stress_value, i))
+    kept.extend(recorder.flush())
+    offer_us = (time.perf_counter() - start) / len(t) * 1e6
+
+    step = int(round(save_interval / offer_interval))
+    selection = {"fixed {:g} s".format(save_interval): np.arange(0, len(t), step),
+                 "adaptive": np.array(kept)}
+    result = {}
+    for name, index in selection.items():
+        log_path = "{}_{}.odolog".format(path, name.split()[0])
+        logger = DataLogger(log_path, {"derived": dtype}, header_info={"specimen_parameter": specimen_parameter})
+        logger.log("derived", record[index])
+        logger.close()
+        analysis = analyze_log(log_path)
+        # reconstruction of every offered record by linear interpolation between written ones
+        error = np.max([np.abs(np.interp(t, t[index], phi_val[index, i]) - phi_val[:, i]) for i in range(4)], axis=1)
+        result[name] = {"num_record": len(index),
+                        "file_kb": os.path.getsize(log_path) / 1024,
+                        "max_error": error,
+                        "t50": analysis["increment"]["t50"],
+                        "t90": analysis["increment"]["t90"]}
+        os.remove(log_path)
+    result["adaptive"]["offer_us"] = offer_us
+    return result
+
+
+def bench_ads1115(data_rate=475, duration=1., i2c_time=0.0003):
+    # single shot read in the acquisition loop (legacy) vs continuous conversion reader thread
+    result = {}
+    
+    analog_in = SimulatedAnalogIn(data_rate=data_rate, continuous=False, i2c_time=i2c_time)
+    num_read = 0
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    while time.perf_counter() - wall_start < duration:
+        analog_in.value
+        num_read += 1
+    wall_time = time.perf_counter() - wall_start
+    result["single shot"] = {"samples_per_sec": num_read / wall_time,
+                             "cpu_percent": (time.process_time() - cpu_start) / wall_time * 100}
+    
+    read_value = SharedRingBuffer(SAMPLE_DTYPE, capacity=8192)
+    analog_in = SimulatedAnalogIn(data_rate=data_rate, continuous=True, i2c_time=i2c_time)
+    reader = ADS1115Reader(analog_in, 3, read_value, data_rate=data_rate)
+    
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    reader.start()
+    time.sleep(duration)
+    reader.stop()
+    wall_time = time.perf_counter() - wall_start
+    
+    samples = read_value.read()
+    interval = np.diff(samples["t_ns"]) * 1e-9
+    result["continuous"] = {"samples_per_sec": len(samples) / wall_time,
+                            "cpu_percent": (time.process_time() - cpu_start) / wall_time * 100,
+                            "interval_std_us": interval.std() * 1e6,
+                            "num_missed_deadline": reader.num_missed_deadline}
+    read_value.close()
+    
+    return result
+
+
+def bench_metrics(num_mod=4, rate=2000, duration=2., num_observe=100000):
+    # cost of observe() + add() and overhead on read_value of simulated bank
+    metrics = Metrics()
+    result = {}
+    
+    start = time.perf_counter()
+    for i in range(num_observe):
+        metrics.observe(HX711_READ, 100000)
+        metrics.add(HX711_SAMPLES, num_mod)
+    result["observe_us"] = (time.perf_counter() - start) / num_observe * 1e6
+    
+    result["read_us"] = bench_read_value(num_mod=num_mod, rate=rate, duration=duration)["read_latency_us"]
+    result["read_metrics_us"] = bench_read_value(num_mod=num_mod, rate=rate, duration=duration,
+                                                 metrics=metrics)["read_latency_us"]
+    result["overhead_percent"] = result["observe_us"] / result["read_us"] * 100
+    metrics.close()
+    
+    return result
+
+
+class _FakeElement():
+    # element whose Update() costs update_cost of CPU (Tk widget configure)
+    def __init__(self, update_cost):
+        self.update_cost = update_cost
+    
+    def Update(self, value=None):
+        end = time.perf_counter() + self.update_cost
+        while time.perf_counter() < end:
+            pass
+
+
+class _FakeWindow():
+    # window whose read() costs read_cost of CPU (one pass of Tk event loop), then sleeps timeout (ms)
+    def __init__(self, read_cost, update_cost):
+        self.read_cost = read_cost
+        self.element = _FakeElement(update_cost)
+    
+    def Element(self, key):
+        return self.element
+    
+    def read(self, timeout=None):
+        end = time.perf_counter() + self.read_cost
+        while time.perf_counter() < end:
+            pass
+        time.sleep(timeout / 1000)
+        return "__TIMEOUT__", {}
+
+
+def bench_gui_loop(duration=2., update_interval=0.1, num_element=16, num_changing=4, 
+                   read_cost=50e-6, update_cost=100e-6):
+    # 1 ms spin with Update() of every element vs blocking wait with change-only view model
+    values = np.zeros(num_element)
+    result = {}
+    
+    window = _FakeWindow(read_cost, update_cost)
+    num_update = 0
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    triggered_time = time.perf_counter()
+    while time.perf_counter() - wall_start < duration:
+        window.read(timeout=0.001)
+        if time.perf_counter() - triggered_time > update_interval:
+            values[:num_changing] += 1
+            for i in range(num_element):
+                window.Element(i).Update(value="{:.6f}".format(values[i]))
+                num_update += 1
+            triggered_time = time.perf_counter()
+    wall_time = time.perf_counter() - wall_start
+    result["spin + update all"] = {"cpu_percent": (time.thread_time() - cpu_start) / wall_time * 100,
+                                   "num_update": num_update}
+    
+    view = ViewModel(_FakeWindow(read_cost, update_cost))
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    triggered_time = time.perf_counter()
+    while time.perf_counter() - wall_start < duration:
+        timeout = max(0, int((triggered_time + update_interval - time.perf_counter()) * 1000))
+        view.window.read(timeout=timeout)
+        if time.perf_counter() - triggered_time >= update_interval:
+            values[:num_changing] += 1
+            for i in range(num_element):
+                view.set(i, values[i])
+            triggered_time = time.perf_counter()
+    wall_time = time.perf_counter() - wall_start
+    result["block + view model"] = {"cpu_percent": (time.thread_time() - cpu_start) / wall_time * 100,
+                                    "num_update": view.num_push}
+    
+    return result
+
+
+def bench_history(num_sample=100000, num_pixel=400, num_repeat=20):
+    # append cost and redraw (envelope over pixel columns) cost of history pyramid vs full scan
+    history = HistoryPyramid(2)
+    t = np.arange(num_sample) * 0.5
+    value = np.random.default_rng(0).normal(size=num_sample)
+    result = {}
+    
+    start = time.perf_counter()
+    for i in range(num_sample):
+        history.append(t[i], (value[i], t[i]))
+    result["append_us"] = (time.perf_counter() - start) / num_sample * 1e6
+    
+    edges = np.linspace(t[0], t[-1], num_pixel + 1)
+    start = time.perf_counter()
+    for k in range(num_repeat):
+        history.envelope(0, edges)
+    result["pyramid_ms"] = (time.perf_counter() - start) / num_repeat * 1e3
+    
+    start = time.perf_counter()
+    for k in range(num_repeat):
+        index = np.searchsorted(t, edges[:-1])
+        np.minimum.reduceat(value, index)
+        np.maximum.reduceat(value, index)
+    result["full_scan_ms"] = (time.perf_counter() - start) / num_repeat * 1e3
+    
+    return result
+
+
+class _ListMatrix(list):
+    # list of rows with shape attribute like numpy array
+    def __init__(self, rows, num_col):
+        super().__init__(rows)
+        self.shape = (len(rows), num_col)
+
+
+def main():
+    print("---- decode cost per sample (capture / decode / total) ----")
+    for num_mod in (1, 4, 16):
+        result = bench_decode(num_mod=num_mod)
+        base = sum(result["legacy (str)"])
+        for key, (capture, decode) in result.items():
+            print("num_mod={:2d} {:14s} {:8.2f} us {:8.2f} us {:8.2f} us  (x{:.2f})".format(
+                num_mod, key, capture * 1e6, decode * 1e6, (capture + decode) * 1e6, base / (capture + decode)))
+    
+    # fast conversion (period still longer than one read) stresses the clocking cost itself
+    for rate in (80, 2000):
+        print("---- read_value on simulated bank (rate {:g} Hz) ----".format(rate))
+        for num_mod in (1, 2, 4, 8, 16):
+            result = bench_read_value(num_mod=num_mod, rate=rate, duration=1.)
+            print("num_mod={:2d} reads/s {:9.1f}  per-bit {:6.2f} us  per-read {:8.2f} us  CPU {:5.1f} %".format(
+                num_mod, result["reads_per_sec"], result["bit_latency_us"], result["read_latency_us"], result["cpu_percent"]))
+    
+    print("---- consistency check, simulated 100 us stalls with SCK high (4 modules, 80 Hz) ----")
+    for stall_probability in (0., 0.001, 0.005):
+        for is_checked in (False, True):
+            result = bench_glitch(stall_probability=stall_probability, is_checked=is_checked)
+            print("stall p={:5.3f} check {:5s} stalls {:3d}  samples/s {:5.1f}  corrupted {:3d}  rejected (overrun, saturated, outlier) {}".format(
+                stall_probability, str(is_checked), result["num_stall"], result["samples_per_sec"],
+                result["num_corrupted"], result["num_rejected"].tolist()))
+    
+    print("---- wait_value, ready-to-sample latency (rate 80 Hz) ----")
+    for acquisition_mode in ("poll", "edge"):
+        for num_mod in (1, 4, 16):
+            result = bench_wait_value(num_mod=num_mod, rate=80, duration=1., acquisition_mode=acquisition_mode)
+            print("{:4s} num_mod={:2d} reads/s {:6.1f}  latency mean {:8.1f} us  p99 {:8.1f} us  std {:8.1f} us  CPU {:5.1f} %".format(
+                acquisition_mode, num_mod, result["reads_per_sec"], result["latency_mean_us"],
+                result["latency_p99_us"], result["latency_std_us"], result["cpu_percent"]))
+    
+    print("---- all-or-nothing vs per-module readiness (rates 80/79.2/80.8 Hz + dead module) ----")
+    for method, result in bench_read_available(duration=2.).items():
+        print("{:14s} samples/s {}  stale {}  CPU {:5.1f} %".format(
+            method, np.round(result["samples_per_sec"], 1), result["is_stale"], result["cpu_percent"]))
+    
+    # one SCK : modules ready at other times are clocked mid-conversion and lose samples
+    for rate in (80, 640):
+        print("---- clock groups, per-channel samples/s (rate {:g} Hz +- 1 %) ----".format(rate))
+        for num_mod in (1, 4, 8, 16):
+            for group_size in (None, 4, 1):
+                result = bench_clock_group(num_mod=num_mod, group_size=group_size, rate=rate, duration=1.)
+                print("num_mod={:2d} groups {:2d}  mean {:6.1f}  min {:6.1f}  bus busy {:5.1f} %".format(
+                    num_mod, result["num_group"], result["mean_per_channel"], result["min_per_channel"],
+                    result["bus_percent"]))
+    
+    print("---- channel A / B interleaving, target A 40 Hz / B 10 Hz (conversion 80 Hz, switch loses 4) ----")
+    for name, burst in (("planned bursts", None), ("switch every sample", (1, 1))):
+        result = bench_sample_plan(burst=burst, duration=2.)
+        print("{:20s} burst {}  A {:5.1f}/s  B {:5.1f}/s  useful {:5.1f} % of conversions".format(
+            name, result["burst"], result["chA_per_sec"], result["chB_per_sec"], result["useful_percent"]))
+    
+    print("---- multi-rig supervisor, simulated rigs (HX711 80 Hz, ADS1115 128 SPS), {} cores ----".format(os.cpu_count()))
+    for num_rig in (1, 2, 4, 8):
+        result = bench_multi_rig(num_rig=num_rig)
+        print("rigs {:2d}  HX711 samples/s per channel {:5.1f} (min {:5.1f})  ADS1115 {:6.1f}  overrun {}  CPU (session) {:5.1f} %".format(
+            num_rig, result["hx711_per_channel"], result["hx711_min"], result["ads1115_per_rig"],
+            result["num_overrun"], result["cpu_percent"]))
+    
+    print("---- transport, producer throughput with consumer draining every 50 ms ----")
+    for name, result in bench_transport().items():
+        print("{:16s} records/s {:10.1f}  received {:6d}  overrun {:6d}".format(
+            name, result["records_per_sec"], result["num_received"], result["num_overrun"]))
+    
+    print("---- per-channel filtering cost per sample ----")
+    for num_sample in (10, 80, 800):
+        for name, value in bench_filter(num_sample=num_sample, num_block=max(20, 16000 // num_sample)).items():
+            print("batch {:4d} {:20s} {:6.2f} us".format(num_sample, name, value * 1e6))
+    
+    print("---- calibration cost per sample (4 channels, 2 cubic + 2 linear) ----")
+    for num_sample in (4, 80, 800):
+        for name, value in bench_calibration(num_sample=num_sample, num_block=max(20, 16000 // num_sample)).items():
+            print("batch {:4d} {:16s} {:6.3f} us".format(num_sample, name, value * 1e6))
+    
+    print("---- derived values at every sample time, cost per sample (5 outputs, 4 channels) ----")
+    for num_sample in (4, 80, 800):
+        for name, value in bench_derived(num_sample=num_sample, num_block=max(20, 16000 // num_sample)).items():
+            print("batch {:4d} {:16s} {:6.3f} us".format(num_sample, name, value * 1e6))
+    
+    print("---- recording of 3 load increments of 4 h (σ_a 50 / 100 / 200 kPa, t50 60 s) ----")
+    for name, result in bench_recording().items():
+        print("{:10s} records {:7d}  file {:8.1f} kB  max error {}  t50 {} s  t90 {} s{}".format(
+            name, result["num_record"], result["file_kb"], np.round(result["max_error"], 4),
+            np.round(result["t50"], 1), np.round(result["t90"], 1),
+            "  {:.1f} us per offered record".format(result["offer_us"]) if "offer_us" in result else ""))
+    
+    print("---- ADS1115 (simulated I2C, 475 SPS) ----")
+    for name, result in bench_ads1115().items():
+        print("{:12s} samples/s {:7.1f}  CPU {:5.1f} %".format(name, result["samples_per_sec"], result["cpu_percent"]))
+    
+    print("---- plot history, min/max envelope over 400 pixel columns ----")
+    for num_sample in (10000, 100000, 1000000):
+        result = bench_history(num_sample=num_sample)
+        print("samples {:8d}  append {:5.2f} us  pyramid {:7.3f} ms  full scan {:7.3f} ms".format(
+            num_sample, result["append_us"], result["pyramid_ms"], result["full_scan_ms"]))
+    
+    print("---- metrics, cost per observation and overhead on read_value (4 modules) ----")
+    result = bench_metrics()
+    print("observe + add {:5.2f} us  read_value {:7.2f} us  with metrics {:7.2f} us  overhead {:4.2f} %".format(
+        result["observe_us"], result["read_us"], result["read_metrics_us"], result["overhead_percent"]))
+    
+    print("---- GUI loop (modelled Tk cost : read 50 us, Update 100 us, 4 of 16 elements changing, 10 Hz) ----")
+    for name, result in bench_gui_loop().items():
+        print("{:20s} CPU {:5.1f} %  element updates {:6d}".format(name, result["cpu_percent"], result["num_update"]))
+
+
+if __name__ == "__main__":
+    main()
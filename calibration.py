@@ -0,0 +1,288 @@
+################################################################################################
+# Multi-point calibration of transducers
+#
+# Profile (dict) of one transducer serial, fitted from a recorded calibration run :
+#   kind "poly"  : physical = polyval(coefficients, volts), highest power first (degree 1 = linear)
+#   kind "table" : piecewise linear tables of loading (up) and unloading (down) branches,
+#                  branch chosen by direction of signal (hysteresis aware)
+# CalibrationStore keeps versioned profiles as JSON, <directory>/<serial>/v<NNN>.json.
+#
+# CalibrationSet applies profiles to blocks of samples of all channels at once : polynomials
+# are one Horner pass over a (channel x power) coefficient matrix indexed by the channel of
+# each sample, tables one np.interp per branch. Channels without profile use slope / intercept
+# lists (read on every call, so edits and tare in GUI apply); for channels with profile,
+# intercept is an offset added to the profile (tare).
+#
+# Usage : python calibration.py fit run.odolog --channel 0 --steps steps.csv --serial LC-1234 [--kind poly --degree 2]
+#         python calibration.py list [--dir calibration]
+################################################################################################
+
+import argparse
+import csv
+import json
+import os
+import time
+import numpy as np
+
+from datalogger import iter_chunks
+
+
+def calibration_points(path, channel, steps, stream="raw"):
+    # mean volts of channel over each step (t_start, t_end (s from first sample), reference),
+    # direction +1 when reference rises from previous step (loading), -1 otherwise
+    t_ns = []
+    volts = []
+    for header, name, data in iter_chunks(path):
+        if name == stream:
+            is_channel = data["channel"] == channel
+            t_ns.append(data["t_ns"][is_channel])
+            volts.append(data["volts"][is_channel])
+    if not t_ns:
+        raise ValueError("No {} records in {}".format(stream, path))
+    t_ns = np.concatenate(t_ns)
+    volts = np.concatenate(volts)
+    if len(t_ns) == 0:
+        raise ValueError("No samples of CH{} in {}".format(channel, path))
+    t = (t_ns - t_ns.min()) * 1e-9
+
+    point_volts = []
+    reference = []
+    direction = []
+    for t_start, t_end, value in steps:
+        is_step = (t >= t_start) & (t < t_end)
+        if not np.any(is_step):
+            raise ValueError("No samples of CH{} in step {} - {} s".format(channel, t_start, t_end))
+        point_volts.append(volts[is_step].mean())
+        direction.append(1 if not reference or value >= reference[-1] else -1)
+        reference.append(value)
+
+    return np.array(point_volts), np.array(reference, dtype=float), np.array(direction)
+
+
+def fit_profile(volts, reference, serial, kind="poly", degree=1, direction=None, unit="", source=None):
+    volts = np.asarray(volts, dtype=float)
+    reference = np.asarray(reference, dtype=float)
+
+    if kind == "poly":
+        if len(np.unique(volts)) < degree + 1:
+            raise ValueError("Polynomial of degree {} needs {} points of distinct volts or more".format(degree, degree + 1))
+        coefficients = np.polyfit(volts, reference, degree)
+        residual = reference - np.polyval(coefficients, volts)
+        profile = {"kind": "poly", "coefficients": coefficients.tolist()}
+
+    elif kind == "table":
+        if direction is None:
+            direction = np.ones(len(volts), dtype=int)
+        direction = np.asarray(direction)
+
+        # a missing branch (monotonic run) is served by the other one
+        table = {}
+        for name, sign in (("up", 1), ("down", -1)):
+            is_branch = direction == sign
+            if np.count_nonzero(is_branch) < 2:
+                is_branch = direction == -sign
+            if np.count_nonzero(is_branch) < 2:
+                raise ValueError("Table needs 2 points or more per branch")
+            order = np.argsort(volts[is_branch])
+            table[name] = [volts[is_branch][order].tolist(), reference[is_branch][order].tolist()]
+        profile = {"kind": "table", "table": table}
+        residual = reference - _table_value(table, volts, direction > 0)
+
+    else:
+        raise ValueError("Kind of calibration should be 'poly' or 'table'")
+
+    profile.update({"serial": serial,
+                    "unit": unit,
+                    "created": time.time(),
+                    "source": source,
+                    "num_point": len(volts),
+                    "volts_range": [float(volts.min()), float(volts.max())],
+                    "rms_residual": float(np.sqrt(np.mean(residual ** 2))),
+                    "max_residual": float(np.max(np.abs(residual)))})
+    return profile
+
+
+def _table_value(table, volts, is_up):
+    # interpolation in branch of each sample, one branch only when all samples share it
+    if is_up.all():
+        return np.interp(volts, table["up"][0], table["up"][1])
+    up = np.interp(volts, table["up"][0], table["up"][1])
+    down = np.interp(volts, table["down"][0], table["down"][1])
+    return np.where(is_up, up, down)
+
+
+class CalibrationStore():
+    def __init__(self, directory="calibration"):
+        self.directory = directory
+
+    def versions(self, serial):
+        path = os.path.join(self.directory, serial)
+        if not os.path.isdir(path):
+            return []
+        return sorted(int(name[1:-5]) for name in os.listdir(path) if name.startswith("v") and name.endswith(".json"))
+
+    def serials(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if self.versions(name))
+
+    def save(self, profile):
+        # profiles are never overwritten, every save is a new version
+        versions = self.versions(profile["serial"])
+        profile = dict(profile, version=(versions[-1] + 1) if versions else 1)
+
+        path = os.path.join(self.directory, profile["serial"])
+        os.makedirs(path, exist_ok=True)
+        temp_path = os.path.join(path, "v{:03d}.json.tmp".format(profile["version"]))
+        with open(temp_path, "w") as f:
+            json.dump(profile, f, indent=1)
+        os.replace(temp_path, os.path.join(path, "v{:03d}.json".format(profile["version"])))
+        return profile
+
+    def load(self, serial, version=None):
+        # latest version unless given
+        versions = self.versions(serial)
+        if not versions:
+            raise ValueError("No calibration profile of {} in {}".format(serial, self.directory))
+        if version is None:
+            version = versions[-1]
+        elif version not in versions:
+            raise ValueError("No version {} of calibration profile of {}".format(version, serial))
+        with open(os.path.join(self.directory, serial, "v{:03d}.json".format(version))) as f:
+            return json.load(f)
+
+
+def load_calibration_set(directory, spec, slope, intercept):
+    # spec : {channel: "serial" or "serial@version"}, e.g. from rig configuration
+    store = CalibrationStore(directory)
+    profiles = {}
+    for channel, name in spec.items():
+        serial, _, version = str(name).partition("@")
+        profiles[int(channel)] = store.load(serial, int(version) if version else None)
+    return CalibrationSet(profiles, slope, intercept)
+
+
+class CalibrationSet():
+    def __init__(self, profiles, slope, intercept, deadband=0.):
+        # profiles : {channel: profile}, slope / intercept : shared per channel lists
+        self.profiles = profiles
+        self.slope = slope
+        self.intercept = intercept
+        self.num_channel = len(slope)
+        self.deadband = deadband                # volts, smaller moves keep table branch
+
+        # polynomial channels and linear fallback share one coefficient matrix (power x channel),
+        # rebuilt when slope / intercept change
+        degree = max([len(p["coefficients"]) - 1 for p in profiles.values() if p["kind"] == "poly"] + [1])
+        self.profile_coefficients = np.zeros((degree + 1, self.num_channel))
+        for channel, profile in profiles.items():
+            if profile["kind"] == "poly":
+                self.profile_coefficients[degree + 1 - len(profile["coefficients"]):, channel] = profile["coefficients"]
+        self.is_linear = np.array([i not in profiles for i in range(self.num_channel)])
+        self.table_channel = [i for i, p in sorted(profiles.items()) if p["kind"] == "table"]
+        self.coefficients = None
+        self._linear = None
+
+        self.table = {i: {name: np.array(branch) for name, branch in profiles[i]["table"].items()}
+                      for i in self.table_channel}
+
+        # last volts and branch of table channels
+        self.last_volts = np.full(self.num_channel, np.nan)
+        self.last_is_up = np.ones(self.num_channel, dtype=bool)
+
+    def version(self):
+        # serial and version of each calibrated channel, for log headers
+        return {i: "{}@{}".format(p["serial"], p.get("version")) for i, p in sorted(self.profiles.items())}
+
+    def _update_coefficients(self):
+        linear = (list(self.slope), list(self.intercept))
+        if linear == self._linear:
+            return
+        self._linear = linear
+        slope, intercept = np.array(linear)
+        
+        # intercept is offset (tare) of profiled channels
+        coefficients = self.profile_coefficients.copy()
+        coefficients[-2, self.is_linear] = slope[self.is_linear]
+        coefficients[-1] += intercept
+        self.coefficients = coefficients
+        self.offset = intercept
+
+    def apply(self, channel, volts, out=None):
+        # physical values of samples (channel, volts) of any channels, in one pass
+        channel = np.asarray(channel)
+        volts = np.asarray(volts, dtype=float)
+        self._update_coefficients()
+
+        coefficients = self.coefficients
+        out = np.take(coefficients[0], channel, out=out)
+        for k in range(1, len(coefficients)):
+            out *= volts
+            out += coefficients[k].take(channel)
+
+        for i in self.table_channel:
+            is_channel = channel == i
+            if is_channel.any():
+                out[is_channel] = self._apply_table(i, volts[is_channel]) + self.offset[i]
+        return out
+
+    def _apply_table(self, i, volts):
+        # branch of each sample follows the last move beyond deadband
+        step = np.diff(volts, prepend=volts[0] if np.isnan(self.last_volts[i]) else self.last_volts[i])
+        is_moving = np.abs(step) > self.deadband
+        if is_moving.all():
+            is_up = step > 0
+        else:
+            index = np.maximum.accumulate(np.where(is_moving, np.arange(len(volts)), -1))
+            is_up = np.where(index >= 0, step[index] > 0, self.last_is_up[i])
+
+        self.last_volts[i] = volts[-1]
+        self.last_is_up[i] = is_up[-1]
+        return _table_value(self.table[i], volts, is_up)
+
+
+def read_steps(path):
+    # CSV rows : t_start (s), t_end (s), reference
+    with open(path, newline="") as f:
+        return [(float(row[0]), float(row[1]), float(row[2])) for row in csv.reader(f)
+                if row and not row[0].startswith("#")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="fit and store transducer calibration profiles")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    fit_parser = subparsers.add_parser("fit", help="fit profile from recorded calibration run")
+    fit_parser.add_argument("path", help="log file of calibration run (.odolog)")
+    fit_parser.add_argument("--channel", type=int, required=True)
+    fit_parser.add_argument("--steps", required=True, help="CSV of t_start, t_end (s from first sample), reference")
+    fit_parser.add_argument("--serial", required=True, help="serial number of transducer")
+    fit_parser.add_argument("--kind", default="poly", choices=("poly", "table"))
+    fit_parser.add_argument("--degree", type=int, default=1)
+    fit_parser.add_argument("--unit", default="")
+    fit_parser.add_argument("--dir", default="calibration")
+
+    list_parser = subparsers.add_parser("list", help="list stored profiles")
+    list_parser.add_argument("--dir", default="calibration")
+    args = parser.parse_args(argv)
+
+    store = CalibrationStore(args.dir)
+    if args.command == "fit":
+        volts, reference, direction = calibration_points(args.path, args.channel, read_steps(args.steps))
+        profile = fit_profile(volts, reference, args.serial, kind=args.kind, degree=args.degree,
+                              direction=direction, unit=args.unit, source=os.path.abspath(args.path))
+        profile = store.save(profile)
+        print("{} v{} : {} points, rms residual {:.6g} {}, max {:.6g} {}".format(
+            profile["serial"], profile["version"], profile["num_point"], profile["rms_residual"], profile["unit"],
+            profile["max_residual"], profile["unit"]))
+    else:
+        for serial in store.serials():
+            for version in store.versions(serial):
+                profile = store.load(serial, version)
+                print("{:16s} v{:<3d} {:5s} {:3d} points  rms {:.6g}  {}".format(
+                    serial, version, profile["kind"], profile["num_point"], profile["rms_residual"],
+                    time.strftime("%Y-%m-%d %H:%M", time.localtime(profile["created"]))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+################################################################################################
+# Consolidation analysis of recorded logs (derived stream of datalogger.py)
+#
+# Log is read chunk by chunk and split into load increments (runs of constant σ_a).
+# Settlement of each increment is kept on log-spaced time grid, so memory is bounded by
+# number of increments, not by length of test.
+#
+# Per increment : σ_a, ɛ_a and void ratio e at end, t50 / cv (Casagrande log-time),
+#                 t90 / cv (Taylor root-time)
+# Per test      : e - log σ' curve and compression index Cc between increments
+#
+# σ' is taken as σ_a at the end of increment (drained, pore pressure not measured).
+# e needs dry mass of specimen or initial void ratio.
+#
+# Usage : python consolidation.py (log file or directory) [--dry-mass g] [--e0 e0] [--csv file]
+################################################################################################
+
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import csv
+import functools
+import glob
+import os
+import numpy as np
+
+from datalogger import iter_chunks
+
+
+INCREMENT_DTYPE = np.dtype([("stress", np.float64),            # σ_a mean (kPa)
+                            ("start_time", np.float64),        # (s) from start of log
+                            ("duration", np.float64),          # (s)
+                            ("strain", np.float64),            # ɛ_a at end (%)
+                            ("void_ratio", np.float64),        # e at end
+                            ("settlement", np.float64),        # settlement of increment (mm)
+                            ("t50", np.float64),               # Casagrande (s)
+                            ("cv_casagrande", np.float64),     # (mm2/s)
+                            ("t90", np.float64),               # Taylor (s)
+                            ("cv_taylor", np.float64)])        # (mm2/s)
+
+
+def compute_void_ratio(strain, specimen_parameter, dry_mass=None, initial_void_ratio=None):
+    # strain : ɛ_a (%) array, dry_mass (g), returns nan without dry mass or initial void ratio
+    strain = np.asarray(strain, dtype=float)
+
+    if dry_mass is not None:
+        # height of solids = volume of solids (mm3) / area (mm2)
+        solid_height = dry_mass / specimen_parameter[6] * 1000 / specimen_parameter[2]
+        return specimen_parameter[0] * (1 - strain / 100) / solid_height - 1
+    elif initial_void_ratio is not None:
+        return initial_void_ratio - (1 + initial_void_ratio) * strain / 100
+
+    return np.full(strain.shape, np.nan)
+
+
+def casagrande_t50(t, settlement):
+    # d0 by parabola (t1, 4 t1), d100 by tangents at inflection and at last log cycle
+    if len(t) < 10:
+        return np.nan
+    log_t = np.log10(t)
+
+    # moving mean over 5 points, ends padded with edge values (zero padding pulls them to 0)
+    smoothed = np.convolve(np.pad(settlement, 2, mode="edge"), np.ones(5) / 5, mode="valid")
+    slope = np.gradient(smoothed, log_t)
+    inflection = int(np.argmax(slope[2:-2])) + 2
+
+    is_tail = log_t >= log_t[-1] - 1
+    if np.count_nonzero(is_tail) < 3 or inflection >= np.flatnonzero(is_tail)[0]:
+        return np.nan
+    tail_slope, tail_intercept = np.polyfit(log_t[is_tail], settlement[is_tail], 1)
+    if slope[inflection] <= tail_slope:
+        return np.nan
+
+    log_t100 = (smoothed[inflection] - slope[inflection] * log_t[inflection] - tail_intercept) / (tail_slope - slope[inflection])
+    d100 = tail_intercept + tail_slope * log_t100
+
+    log_t1 = max(log_t[0], log_t[inflection] - np.log10(8))
+    d0 = 2 * np.interp(log_t1, log_t, smoothed) - np.interp(log_t1 + np.log10(4), log_t, smoothed)
+
+    # first crossing of d50
+    d50 = (d0 + d100) / 2
+    index = np.flatnonzero(smoothed >= d50)
+    if len(index) == 0 or index[0] == 0:
+        return np.nan
+    i = index[0]
+    return 10 ** np.interp(d50, smoothed[i - 1:i + 1], log_t[i - 1:i + 1])
+
+
+def taylor_t90(t, settlement):
+    # initial line on settlement - √t, t90 where curve meets line with 1.15 times abscissa
+    if len(t) < 10:
+        return np.nan
+    root_t = np.sqrt(t)
+
+    is_early = (settlement >= 0.1 * settlement[-1]) & (settlement <= 0.5 * settlement[-1])
+    if np.count_nonzero(is_early) < 3:
+        return np.nan
+    slope, intercept = np.polyfit(root_t[is_early], settlement[is_early], 1)
+    if slope <= 0:
+        return np.nan
+
+    offset = settlement - (intercept + slope / 1.15 * root_t)
+    index = np.flatnonzero((offset <= 0) & (root_t > root_t[is_early][-1]))
+    if len(index) == 0:
+        return np.nan
+    i = index[0]
+    return np.interp(0., offset[[i, i - 1]], root_t[[i, i - 1]]) ** 2
+
+
+class _IncrementTracker():
+    # splits stream into runs of constant σ_a and keeps settlement on log-spaced time grid
+    def __init__(self, specimen_parameter, stress_tolerance, relative_tolerance, point_per_decade, min_time):
+        self.specimen_parameter = specimen_parameter
+        self.stress_tolerance = stress_tolerance
+        self.relative_tolerance = relative_tolerance
+        self.point_per_decade = point_per_decade
+        self.min_time = min_time
+        self.finished = []
+        self.current = None
+
+    def update(self, t, stress, strain):
+        position = 0
+        while position < len(t):
+            if self.current is None:
+                self._start(t[position], stress[position], strain[position])
+
+            reference = self.current["reference"]
+            tolerance = max(self.stress_tolerance, self.relative_tolerance * abs(reference))
+            index = np.flatnonzero(np.abs(stress[position:] - reference) > tolerance)
+            end = position + index[0] if len(index) else len(t)
+
+            self._accumulate(t[position:end], stress[position:end], strain[position:end])
+            if end < len(t):
+                self.finish()
+            position = end
+
+    def _start(self, t, stress, strain):
+        self.current = {"reference": stress, "start_time": t, "start_strain": strain,
+                        "end_time": t, "end_strain": strain, "stress_sum": 0., "num_record": 0,
+                        "last_grid": -np.inf, "t": [], "settlement": []}
+
+    def _accumulate(self, t, stress, strain):
+        if len(t) == 0:
+            return
+        current = self.current
+        current["stress_sum"] += stress.sum()
+        current["num_record"] += len(t)
+        current["end_time"] = t[-1]
+        current["end_strain"] = strain[-1]
+
+        # first sample of every new grid cell of log time
+        elapsed = t - current["start_time"]
+        grid = np.floor(np.log10(np.maximum(elapsed, self.min_time)) * self.point_per_decade)
+        is_new = (grid > current["last_grid"]) & (elapsed > 0)
+        grid, index = np.unique(grid[is_new], return_index=True)
+        if len(grid):
+            current["last_grid"] = grid[-1]
+            current["t"].append(elapsed[is_new][index])
+            current["settlement"].append((strain[is_new][index] - current["start_strain"]) / 100 * self.specimen_parameter[0])
+
+    def finish(self):
+        if self.current is not None and self.current["num_record"]:
+            self.finished.append(self.current)
+        self.current = None
+
+
+def analyze_log(path, dry_mass=None, initial_void_ratio=None, stress_tolerance=2., relative_tolerance=0.02,
+                min_increment_duration=60., num_drainage_face=2, point_per_decade=50, specimen_parameter=None):
+    # returns dict of increments (INCREMENT_DTYPE), e - log σ' pairs and compression index
+    tracker = None
+    num_record = 0
+
+    for header, name, data in iter_chunks(path):
+        if name != "derived":
+            continue
+        if tracker is None:
+            if specimen_parameter is None:
+                specimen_parameter = header["info"]["specimen_parameter"]
+            tracker = _IncrementTracker(specimen_parameter, stress_tolerance, relative_tolerance,
+                                        point_per_decade, min_time=0.1)
+
+        tracker.update(data["time"], data["output_param"][:, 0], data["output_param"][:, 1])
+        num_record += len(data)
+
+    if tracker is None:
+        raise ValueError("No derived records in {}".format(path))
+    tracker.finish()
+
+    increments = [x for x in tracker.finished if x["end_time"] - x["start_time"] >= min_increment_duration]
+    result = np.zeros(len(increments), dtype=INCREMENT_DTYPE)
+
+    for i, increment in enumerate(increments):
+        t = np.concatenate(increment["t"]) if increment["t"] else np.zeros(0)
+        settlement = np.concatenate(increment["settlement"]) if increment["settlement"] else np.zeros(0)
+
+        # drainage path of mean height during increment
+        mean_strain = (increment["start_strain"] + increment["end_strain"]) / 2
+        drainage_path = specimen_parameter[0] * (1 - mean_strain / 100) / num_drainage_face
+
+        t50 = casagrande_t50(t, settlement)
+        t90 = taylor_t90(t, settlement)
+        result[i] = (increment["stress_sum"] / increment["num_record"],
+                     increment["start_time"],
+                     increment["end_time"] - increment["start_time"],
+                     increment["end_strain"],
+                     np.nan,
+                     settlement[-1] if len(settlement) else 0.,
+                     t50, 0.197 * drainage_path ** 2 / t50,
+                     t90, 0.848 * drainage_path ** 2 / t90)
+
+    result["void_ratio"] = compute_void_ratio(result["strain"], specimen_parameter, dry_mass, initial_void_ratio)
+
+    # Cc between consecutive increments under loading (σ' increasing)
+    stress = result["stress"]
+    is_loading = (stress[1:] > stress[:-1]) & (stress[:-1] > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        compression_index = -np.diff(result["void_ratio"]) / np.diff(np.log10(np.maximum(stress, 1e-12)))
+    compression_index = np.where(is_loading, compression_index, np.nan)
+
+    return {"path": path,
+            "num_record": num_record,
+            "increment": result,
+            "compression_index": compression_index,
+            "max_compression_index": np.nanmax(compression_index) if np.any(is_loading & ~np.isnan(compression_index)) else np.nan}
+
+
+def analyze_directory(directory, pattern="*.odolog", max_workers=None, **kwargs):
+    # every log of directory on process pool, returns list of results (or exception per file)
+    path_list = sorted(glob.glob(os.path.join(directory, pattern)))
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        future_list = [executor.submit(functools.partial(analyze_log, path, **kwargs)) for path in path_list]
+        result_list = []
+        for path, future in zip(path_list, future_list):
+            try:
+                result_list.append(future.result())
+            except Exception as e:
+                print("{} : {}".format(path, e))
+
+    return result_list
+
+
+def print_result(result):
+    print("{} ({} records)".format(result["path"], result["num_record"]))
+    print("{:>10} {:>10} {:>9} {:>8} {:>10} {:>10} {:>12} {:>10} {:>12}".format(
+        "σ (kPa)", "time (s)", "ɛ (%)", "e", "δ (mm)", "t50 (s)", "cv_C (mm2/s)", "t90 (s)", "cv_T (mm2/s)"))
+    for row in result["increment"]:
+        print("{:10.2f} {:10.1f} {:9.4f} {:8.4f} {:10.4f} {:10.1f} {:12.4g} {:10.1f} {:12.4g}".format(
+            row["stress"], row["duration"], row["strain"], row["void_ratio"], row["settlement"],
+            row["t50"], row["cv_casagrande"], row["t90"], row["cv_taylor"]))
+    print("Cc {}  max {:.4f}".format(np.round(result["compression_index"], 4), result["max_compression_index"]))
+
+
+def write_csv(result_list, csv_path):
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(("path",) + INCREMENT_DTYPE.names + ("compression_index",))
+        for result in result_list:
+            compression_index = np.concatenate([[np.nan], result["compression_index"]])
+            for row, cc in zip(result["increment"].tolist(), compression_index.tolist()):
+                writer.writerow((result["path"],) + row + (cc,))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="consolidation analysis of recorded logs")
+    parser.add_argument("path", help="log file or directory of log files")
+    parser.add_argument("--dry-mass", type=float, default=None, help="dry mass of specimen (g)")
+    parser.add_argument("--e0", type=float, default=None, help="initial void ratio (without dry mass)")
+    parser.add_argument("--stress-tolerance", type=float, default=2., help="(kPa) for splitting increments")
+    parser.add_argument("--min-duration", type=float, default=60., help="shortest increment (s)")
+    parser.add_argument("--drainage-face", type=int, default=2, choices=(1, 2))
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--csv", default=None)
+    args = parser.parse_args()
+
+    kwargs = {"dry_mass": args.dry_mass, "initial_void_ratio": args.e0, "stress_tolerance": args.stress_tolerance,
+              "min_increment_duration": args.min_duration, "num_drainage_face": args.drainage_face}
+    if os.path.isdir(args.path):
+        result_list = analyze_directory(args.path, max_workers=args.workers, **kwargs)
+    else:
+        result_list = [analyze_log(args.path, **kwargs)]
+
+    for result in result_list:
+        print_result(result)
+    if args.csv is not None:
+        write_csv(result_list, args.csv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+################################################################################################
+# Loading control through DAC (MCP4725)
+#
+# control_option : 0 No Control, 1 Creep, 2 Monotonic Loading, 3 Cyclic Loading
+# control_param  : 8 x 4 array, column = control option (see layout of Window)
+#
+# Cyclic loading (and creep / monotonic loading with use_pid_engine) compiles the stage
+# into setpoint trajectory (trajectory.py) tracked by PID with feedforward of the setpoint.
+################################################################################################
+
+import threading
+import time
+import numpy as np
+
+from calibration import CalibrationSet
+from derived import compute_output_param
+from metrics import CONTROL_LAW, CONTROL_TICK, MISSED_DEADLINE
+from timing import LoopStatistics
+from trajectory import STRAIN, STRESS, Cycle, Hold, Ramp, compile_program
+
+
+class PID():
+    # PID with conditional integration anti-windup and output saturation
+    def __init__(self, kp=0.5, ki=0.2, kd=0., output_min=-np.inf, output_max=np.inf):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.output_min = output_min
+        self.output_max = output_max
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.
+        self.prev_error = None
+        self.is_saturated = False
+
+    def update(self, error, dt, feedforward=0.):
+        derivative = 0.
+        if self.prev_error is not None and dt > 0:
+            derivative = (error - self.prev_error) / dt
+        self.prev_error = error
+        
+        integral = self.integral + self.ki * error * dt
+        output = feedforward + self.kp * error + integral + self.kd * derivative
+        
+        # stop integrating while saturated in the direction of error
+        self.is_saturated = True
+        if output > self.output_max:
+            output = self.output_max
+            if error < 0:
+                self.integral = integral
+        elif output < self.output_min:
+            output = self.output_min
+            if error > 0:
+                self.integral = integral
+        else:
+            self.integral = integral
+            self.is_saturated = False
+        
+        return output
+
+
+class LoadingController():
+    def __init__(self, dac, vol_out_interval=0.5, adc_amp_factor=100, base_elastic_modulus=10000,
+                 use_pid_engine=False, pid_gain=(0.5, 0.2, 0.), clock=time.monotonic):
+        self.dac = dac
+        self.clock = clock
+        self.vol_out_interval = vol_out_interval
+        self.control_param = np.zeros((8, 4))
+        self.is_controling = False
+        self.adc_amp_factor = adc_amp_factor                 # N/Voltage
+        self.current_control_option = 0
+        self.start_time_cur_step = self.clock()
+        self.current_output_vol = 0
+        self.base_elastic_modulus = base_elastic_modulus
+        
+        # variables for trajectory tracking
+        self.use_pid_engine = use_pid_engine
+        self.pid = PID(*pid_gain)
+        self.trajectory = None
+        self.start_time_trajectory = 0.
+        self.feedforward_bias = 0.
+
+    def start(self):
+        self.is_controling = True
+        self.start_time_cur_step = self.clock()
+        self.trajectory = None
+
+    def stop(self):
+        self.is_controling = False
+
+    def set_control_option(self, control_option):
+        self.current_control_option = control_option
+        self.start_time_cur_step = self.clock()
+        self.trajectory = None
+
+    def current_setpoint(self):
+        # (setpoint, quantity) being tracked, nan if no target
+        temp_control_param = self.control_param[:, self.current_control_option]
+        
+        if self.trajectory is not None:
+            setpoint, quantity, is_finished = self.trajectory.lookup(self.clock() - self.start_time_trajectory)
+            return setpoint, quantity
+        elif self.current_control_option == 1:
+            return temp_control_param[2], STRESS if temp_control_param[0] == 0. else STRAIN
+        elif self.current_control_option == 2:
+            return temp_control_param[1], STRESS
+        
+        return np.nan, STRESS
+
+    def build_program(self, current_output_param):
+        # stages of current control option from control_param
+        temp_control_param = self.control_param[:, self.current_control_option]
+        
+        # Creep : ramp to target σ/ɛ at stress rate, then hold for time
+        if self.current_control_option == 1:
+            quantity = STRESS if temp_control_param[0] == 0. else STRAIN
+            rate = self._rate(temp_control_param[5], quantity)
+            return [Ramp(temp_control_param[2], rate, quantity), 
+                    Hold(temp_control_param[1], quantity)]
+        
+        # Monotonic Loading : ramp to target σ at stress rate
+        elif self.current_control_option == 2:
+            return [Ramp(temp_control_param[1], self._rate(temp_control_param[3], STRESS), STRESS)]
+        
+        # Cyclic Loading : ramp to mean, then Nc triangular cycles between min and max at rate
+        elif self.current_control_option == 3:
+            quantity = STRESS if temp_control_param[0] == 0. else STRAIN
+            rate = self._rate(temp_control_param[4], quantity)
+            max_value = temp_control_param[2]
+            min_value = temp_control_param[3]
+            mean = (max_value + min_value) / 2
+            amplitude = (max_value - min_value) / 2
+            period = max(4 * amplitude / rate, self.vol_out_interval)
+            return [Ramp(mean, rate, quantity), 
+                    Cycle(mean, amplitude, period, temp_control_param[5], "triangle", quantity)]
+        
+        return [Hold(0.)]
+
+    def _rate(self, stress_rate, quantity):
+        # stress rate (kPa/s) of control_param to rate of quantity (kPa/s or %/s)
+        rate = abs(stress_rate)
+        if quantity == STRAIN:
+            rate = rate / self.base_elastic_modulus * 100
+        return max(rate, 1e-9)
+
+    def load_program(self, stages, current_output_param, specimen_parameter):
+        self.trajectory = compile_program(stages, current_output_param[0], current_output_param[1], 
+                                          self.vol_out_interval)
+        self.start_time_trajectory = self.clock()
+        self.pid.reset()
+        
+        # feedforward starts from current DAC output
+        self.feedforward_bias = self.current_output_vol / self._kPa_to_dac(specimen_parameter) - current_output_param[0]
+
+    def _kPa_to_dac(self, specimen_parameter):
+        # σ_a (kPa) -> load (N) -> DAC input (V) -> DAC value
+        return specimen_parameter[2] / 1000 / self.adc_amp_factor / 5 * 65536
+
+    def _track_trajectory(self, current_output_param, specimen_parameter, dt):
+        # Monotonic Loading keeps limit of ɛ of legacy law (Target ɛ + tolerance), DAC output is held
+        if self.current_control_option == 2:
+            temp_control_param = self.control_param[:, 2]
+            if current_output_param[1] - temp_control_param[2] > temp_control_param[5]:
+                self.current_control_option = 0
+                self.trajectory = None
+                return
+
+        if self.trajectory is None:
+            self.load_program(self.build_program(current_output_param), current_output_param, specimen_parameter)
+        
+        setpoint, quantity, is_finished = self.trajectory.lookup(self.clock() - self.start_time_trajectory)
+        if is_finished:
+            self.current_control_option = 0
+            self.trajectory = None
+            return
+        
+        # error in stress, strain error converted with base elastic modulus
+        if quantity == STRESS:
+            error = setpoint - current_output_param[0]
+            feedforward = setpoint + self.feedforward_bias
+        else:
+            error = (setpoint - current_output_param[1]) / 100 * self.base_elastic_modulus
+            feedforward = current_output_param[0] + self.feedforward_bias
+        
+        kPa_to_dac = self._kPa_to_dac(specimen_parameter)
+        self.pid.output_min = 0.
+        self.pid.output_max = 65535 / kPa_to_dac
+        self.current_output_vol = int(self.pid.update(error, dt, feedforward) * kPa_to_dac)
+
+    def set_output_vol(self, output_vol):
+        # output voltage (0 - 5 V) to 16 bit DAC value
+        temp = output_vol / 5
+        
+        if temp > 1:
+            temp = 1
+        elif temp < 0:
+            temp = 0
+        
+        self.current_output_vol = int(temp * 65536)
+
+    def control_adc_output(self, current_output_param, specimen_parameter, dt=None):
+        
+        # dt : actual time since previous tick (s), nominal vol_out_interval if not given
+        if dt is None:
+            dt = self.vol_out_interval
+        
+        ellapsed_time_cur_step = self.clock() - self.start_time_cur_step
+        
+        if self.current_control_option == 0:
+            pass
+        
+        # trajectory tracking by PID
+        elif self.use_pid_engine or self.current_control_option == 3:
+            self._track_trajectory(current_output_param, specimen_parameter, dt)
+        
+        # Creep
+        elif self.current_control_option == 1:
+            temp_control_param = self.control_param[:, 1]
+            
+            if ellapsed_time_cur_step > temp_control_param[1]:
+                self.current_control_option = 0
+            else:
+                # the designated threshold value is σ
+                if temp_control_param[0] == 0.:
+                    temp_offset_stress = current_output_param[0] - temp_control_param[2]
+                
+                # the designated threshold value is ɛ, offset as stress by base elastic modulus
+                else:
+                    temp_offset_strain = current_output_param[1] - temp_control_param[2]
+                    temp_offset_stress = temp_offset_strain / 100 * self.base_elastic_modulus
+                
+                # load follows sign of offset in both cases (more load, more σ and ɛ)
+                if abs(temp_offset_stress) > temp_control_param[4]:
+                    self.current_output_vol -= int(sign_with_abs(temp_offset_stress) * temp_control_param[5] * dt / 1000 * specimen_parameter[2] / self.adc_amp_factor / 5 * 65536)
+
+                elif abs(temp_offset_stress) > temp_control_param[3]:
+                    self.current_output_vol -= int(sign_with_abs(temp_offset_stress) * temp_control_param[5] * dt * (abs(temp_offset_stress) - temp_control_param[3]) / (temp_control_param[4] - temp_control_param[3]) / 1000 * specimen_parameter[2] / self.adc_amp_factor / 5 * 65536)
+        
+        # Monotic Loading
+        elif self.current_control_option == 2:
+            temp_control_param = self.control_param[:, 2]
+            temp_offset_stress = current_output_param[0] - temp_control_param[1]
+            temp_offset_strain = current_output_param[1] - temp_control_param[2]
+            
+            if (temp_offset_stress > temp_control_param[4]) or (temp_offset_strain > temp_control_param[5]):
+                self.current_control_option = 0
+            else:
+                # increment is defined per nominal interval, scaled by actual one
+                temp_increment = int(temp_control_param[3] * dt / self.vol_out_interval / self.adc_amp_factor / 5 * 65536)
+                if temp_control_param[0] == 0.:
+                    self.current_output_vol += temp_increment
+                else:
+                    self.current_output_vol -= temp_increment
+    
+        if self.current_output_vol > 65535:
+            self.current_output_vol = 65535
+        elif self.current_output_vol < 0:
+            self.current_output_vol = 0
+        
+        self.dac.value = self.current_output_vol
+
+
+class ControlLoop():
+    # fixed-rate loop on absolute deadlines (no drift), draining acquisition stream and
+    # executing control law with actual elapsed time of every tick
+    def __init__(self, controller, acquisition, slope, intercept, specimen_parameter,
+                 current_phi_val, current_output_param, period=0.5, on_record=None, history=None,
+                 metrics=None, channel_map=None, calibration=None, derived_engine=None, on_derived=None):
+        
+        # slope ... current_output_param are shared lists, updated in place
+        self.controller = controller
+        self.acquisition = acquisition
+        self.slope = slope
+        self.intercept = intercept
+        self.specimen_parameter = specimen_parameter
+        self.current_phi_val = current_phi_val
+        self.current_output_param = current_output_param
+        self.period = period
+        self.on_record = on_record
+        
+        # HistoryPyramid of output_param + phi_val per tick (for plots), optional
+        self.history = history
+        self.metrics = metrics
+        
+        # channel of each slot of phi_val in compute_output_param (see rig.py), None : CH0 - CH3
+        self.channel_map = channel_map
+        
+        # CalibrationSet (calibration.py) of multi-point profiles, None : slope / intercept
+        self.calibration = calibration
+        
+        # DerivedEngine (derived.py) of filtered samples at acquisition rate, rows to on_derived, optional
+        self.derived_engine = derived_engine
+        self.on_derived = on_derived
+        if derived_engine is not None:
+            # own table branch state, samples of blocks are not the per-tick values
+            profiles = {} if calibration is None else calibration.profiles
+            deadband = 0. if calibration is None else calibration.deadband
+            self.block_calibration = CalibrationSet(profiles, slope, intercept, deadband)
+        
+        self.loop_stats = LoopStatistics()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        period_ns = int(self.period * 1e9)
+        deadline_ns = time.monotonic_ns() + period_ns
+        prev_tick_ns = time.monotonic_ns()
+        
+        while True:
+            wait_ns = deadline_ns - time.monotonic_ns()
+            if wait_ns > 0 and self._stop_event.wait(wait_ns * 1e-9):
+                break
+            if self._stop_event.is_set():
+                break
+            
+            now_ns = time.monotonic_ns()
+            
+            # missed deadlines are skipped, not executed in a burst
+            num_missed = max(0, (now_ns - deadline_ns) // period_ns)
+            self.loop_stats.update(now_ns, now_ns - deadline_ns, num_missed)
+            
+            self.tick((now_ns - prev_tick_ns) * 1e-9)
+            if self.metrics is not None:
+                self.metrics.observe(CONTROL_TICK, time.monotonic_ns() - now_ns)
+                self.metrics.add(MISSED_DEADLINE, num_missed)
+            prev_tick_ns = now_ns
+            
+            deadline_ns += (num_missed + 1) * period_ns
+
+    def tick(self, dt):
+        new_record = self.acquisition.filter_variable()
+        if self.on_record is not None and len(new_record) != 0:
+            self.on_record(new_record)
+        if self.derived_engine is not None and len(new_record) != 0:
+            self._derive_block(new_record)
+        
+        current_vol = self.acquisition.current_vol
+        if self.calibration is not None:
+            self.current_phi_val[:] = self.calibration.apply(range(len(current_vol)), current_vol).tolist()
+        else:
+            for i in range(len(current_vol)):
+                self.current_phi_val[i] = self.slope[i] * current_vol[i] + self.intercept[i]
+        phi_val = self.current_phi_val
+        if self.channel_map is not None:
+            phi_val = [phi_val[i] for i in self.channel_map]
+        compute_output_param(phi_val, self.specimen_parameter, self.current_output_param)
+        if self.history is not None:
+            self.history.append(self.controller.clock(), self.current_output_param + self.current_phi_val)
+        
+        if self.controller.is_controling:
+            start = time.monotonic_ns()
+            self.controller.control_adc_output(self.current_output_param, self.specimen_parameter, dt)
+            if self.metrics is not None:
+                self.metrics.observe(CONTROL_LAW, time.monotonic_ns() - start)
+
+    def _derive_block(self, new_record):
+        filtered_volts = self.acquisition.filtered_volts
+        is_valid = ~np.isnan(filtered_volts)
+        channel = new_record["channel"][is_valid]
+        physical = self.block_calibration.apply(channel, filtered_volts[is_valid])
+        derived = self.derived_engine.process_block(channel, new_record["t_ns"][is_valid], physical)
+        if self.on_derived is not None and len(derived) != 0:
+            self.on_derived(derived)
+
+    def print_loop_statistics(self):
+        stats = self.loop_stats.summary()
+        print("control loop {} ticks, period mean {:.6f} s, jitter (std) {:.6f} s, lateness mean {:.6f} s, max {:.6f} s, missed {}".format(
+            stats["num_tick"], stats["period_mean"], stats["period_std"], stats["lateness_mean"],
+            stats["lateness_max"], stats["num_missed_deadline"]))
+
+
+def sign_with_abs(x):
+    return 0.0 if abs(x) == 0 else x / abs(x)
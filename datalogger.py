@@ -0,0 +1,206 @@
+################################################################################################
+# Buffered background data logger
+#
+# File format (append only, little endian)
+#   magic "ODOLOG01" | uint32 header length | JSON header
+#   chunk* : uint8 stream id | uint32 number of records | records (fixed dtype of the stream)
+#
+# JSON header holds dtype of each stream and any user information
+# (channels, calibration, specimen parameters, ...).
+# A chunk cut by power loss is ignored when reading.
+#
+# Usage : python datalogger.py (log file) (csv file) [stream]
+################################################################################################
+
+import csv
+import json
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+import numpy as np
+
+
+MAGIC = b"ODOLOG01"
+_CHUNK_HEADER = struct.Struct("<BI")
+_HEADER_LENGTH = struct.Struct("<I")
+
+
+class DataLogger():
+    def __init__(self, path, streams, header_info=None, flush_interval=1., fsync_interval=10.,
+                 max_batch_record=4096):
+        
+        # streams : dict of stream name and numpy dtype of its records
+        self.path = path
+        self.streams = {name: np.dtype(dtype) for name, dtype in streams.items()}
+        self.stream_id = {name: i for i, name in enumerate(self.streams)}
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.max_batch_record = max_batch_record
+        
+        self.num_record = {name: 0 for name in self.streams}
+        self.num_chunk = 0
+        self.num_fsync = 0
+        
+        header = {"streams": {name: dtype.descr for name, dtype in self.streams.items()},
+                  "created": time.time(),
+                  "created_monotonic_ns": time.monotonic_ns(),
+                  "info": header_info or {}}
+        header = json.dumps(header).encode()
+        
+        self.file = open(self.path, "wb")
+        self.file.write(MAGIC + _HEADER_LENGTH.pack(len(header)) + header)
+        self.file.flush()
+        
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def log(self, stream, records):
+        # records : structured array, single record or tuple matching dtype of stream
+        records = np.array(records, dtype=self.streams[stream], ndmin=1)
+        self.queue.put((stream, records))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def _write_loop(self):
+        pending = {name: [] for name in self.streams}
+        num_pending = 0
+        last_flush_time = time.monotonic()
+        last_fsync_time = time.monotonic()
+        is_running = True
+        
+        while is_running:
+            timeout = max(0., self.flush_interval - (time.monotonic() - last_flush_time))
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = ()
+            
+            if item is None:
+                is_running = False
+            elif item:
+                stream, records = item
+                pending[stream].append(records)
+                num_pending += len(records)
+            
+            now = time.monotonic()
+            is_flush_time = now - last_flush_time >= self.flush_interval
+            
+            if num_pending >= self.max_batch_record or is_flush_time or not is_running:
+                self._write_chunk(pending)
+                num_pending = 0
+                self.file.flush()
+                last_flush_time = now
+            
+            if now - last_fsync_time >= self.fsync_interval or not is_running:
+                os.fsync(self.file.fileno())
+                self.num_fsync += 1
+                last_fsync_time = now
+        
+        self.file.close()
+
+    def _write_chunk(self, pending):
+        for name, records in pending.items():
+            if not records:
+                continue
+            
+            data = np.concatenate(records) if len(records) > 1 else records[0]
+            self.file.write(_CHUNK_HEADER.pack(self.stream_id[name], len(data)))
+            self.file.write(data.tobytes())
+            
+            self.num_record[name] += len(data)
+            self.num_chunk += 1
+            records.clear()
+
+
+def read_header(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a data log file")
+    (length,) = _HEADER_LENGTH.unpack(f.read(_HEADER_LENGTH.size))
+    header = json.loads(f.read(length))
+    header["streams"] = {name: np.dtype([tuple(field) for field in descr])
+                         for name, descr in header["streams"].items()}
+    return header
+
+
+def iter_chunks(path):
+    # yield (header, stream name, records) chunk by chunk (bounded memory)
+    with open(path, "rb") as f:
+        header = read_header(f)
+        names = list(header["streams"])
+        
+        while True:
+            chunk_header = f.read(_CHUNK_HEADER.size)
+            if len(chunk_header) < _CHUNK_HEADER.size:
+                break
+            stream_id, num_record = _CHUNK_HEADER.unpack(chunk_header)
+            name = names[stream_id]
+            dtype = header["streams"][name]
+            
+            data = f.read(num_record * dtype.itemsize)
+            if len(data) < num_record * dtype.itemsize:
+                break
+            
+            yield header, name, np.frombuffer(data, dtype=dtype)
+
+
+def read_log(path):
+    # whole log as (header, dict of stream name and records)
+    with open(path, "rb") as f:
+        header = read_header(f)
+    
+    records = {name: [] for name in header["streams"]}
+    for temp_header, name, data in iter_chunks(path):
+        records[name].append(data)
+    
+    return header, {name: (np.concatenate(data) if data else np.zeros(0, dtype=header["streams"][name]))
+                    for name, data in records.items()}
+
+
+def _flatten_field_name(dtype):
+    names = []
+    for name in dtype.names:
+        shape = dtype.fields[name][0].shape
+        if shape:
+            names += ["{}_{}".format(name, i) for i in range(int(np.prod(shape)))]
+        else:
+            names.append(name)
+    return names
+
+
+def export_csv(path, csv_path, stream="derived"):
+    # write one stream of log file as csv, chunk by chunk
+    with open(path, "rb") as f:
+        header = read_header(f)
+    dtype = header["streams"][stream]
+    
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(_flatten_field_name(dtype))
+        
+        for temp_header, name, data in iter_chunks(path):
+            if name != stream:
+                continue
+            # column by column keeps integer fields (t_ns) exact
+            columns = []
+            for field in dtype.names:
+                columns += data[field].reshape(len(data), -1).T.tolist()
+            writer.writerows(zip(*columns))
+
+
+def main():
+    if len(sys.argv) < 3:
+        print("Usage : python datalogger.py (log file) (csv file) [stream]")
+        return
+    
+    stream = sys.argv[3] if len(sys.argv) > 3 else "derived"
+    export_csv(sys.argv[1], sys.argv[2], stream)
+
+
+if __name__ == "__main__":
+    main()
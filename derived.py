@@ -0,0 +1,165 @@
+################################################################################################
+# Derived quantities of oedometer test
+#
+# specimen_parameter : [height (mm), diameter (mm), area (mm2), volume (mm3),
+#                       drain tank diameter (mm), drain tank area (mm2), ρ_s (g/cm3)]
+# phi_val            : [CH0 load cell odo (N), CH1 displacement gauge (mm),
+#                       CH2 load cell tank (N), CH3 pressure gauge tank (kPa)]
+# output_param       : [σ_a (kPa), ɛ_a (%), discharged volume (mm3),
+#                       discharged water (mm3), volume (%)]
+#
+# DerivedEngine evaluates the same formulas (and user-defined ones) as numpy expressions over
+# blocks of samples, one row per sample time with channels held at their last value.
+# Expressions name channels by role (load, displacement, tank_load, tank_pressure) or ch0 - chN,
+# specimen_parameter by SPECIMEN_NAME and earlier outputs by name. Parts depending on specimen
+# only are folded into constants, recomputed when specimen_parameter changes.
+################################################################################################
+
+import ast
+import math
+import numpy as np
+
+
+def compute_specimen_parameter(specimen_height, specimen_diameter, drain_tank_diameter, rho_s):
+    return [specimen_height,
+            specimen_diameter, 
+            specimen_diameter ** 2 / 4 * math.pi,
+            specimen_diameter ** 2 / 4 * math.pi * specimen_height,
+            drain_tank_diameter,
+            drain_tank_diameter ** 2 / 4 * math.pi,
+            rho_s]
+
+
+def compute_output_param(phi_val, specimen_parameter, output_param=None):
+    if output_param is None:
+        output_param = [0.] * 5
+    
+    output_param[0] = phi_val[0] / specimen_parameter[2] * 1000
+    output_param[1] = (specimen_parameter[0] - phi_val[1]) / specimen_parameter[0] * 100
+    output_param[2] = (phi_val[2] - phi_val[3] * specimen_parameter[5] / 1000) / 9.81 * 1000 / specimen_parameter[6] / 1000
+    output_param[3] = phi_val[3] * specimen_parameter[5] / 1000 / 9.81 / 0.998223
+    if output_param[3] != 0:
+        output_param[4] = (output_param[2] - output_param[3]) / output_param[3] * 100
+    else:
+        output_param[4] = 0.
+    
+    return output_param
+
+
+SPECIMEN_NAME = ("height", "diameter", "area", "volume", "tank_diameter", "tank_area", "rho_s")
+ROLE_NAME = ("load", "displacement", "tank_load", "tank_pressure")
+
+# (name, expression) in order of evaluation, same as compute_output_param with specimen factors grouped
+OUTPUT_EXPRESSION = (
+    ("sigma_a", "load * (1000 / area)"),
+    ("epsilon_a", "(height - displacement) * (100 / height)"),
+    ("discharged_volume", "(tank_load - tank_pressure * (tank_area / 1000)) * (1 / 9.81 / rho_s)"),
+    ("discharged_water", "tank_pressure * (tank_area / 1000 / 9.81 / 0.998223)"),
+    ("volume_percent", "where(discharged_water != 0, (discharged_volume - discharged_water) / discharged_water * 100, 0.)"),
+)
+
+FUNCTION = {"where": np.where, "abs": np.abs, "sqrt": np.sqrt, "log": np.log, "log10": np.log10, "exp": np.exp,
+            "minimum": np.minimum, "maximum": np.maximum, "clip": np.clip, "pi": math.pi}
+
+
+class _FoldSpecimen(ast.NodeTransformer):
+    # replaces largest subtrees free of sample variables by names of constants
+    def __init__(self, sample_name, constant):
+        self.sample_name = sample_name
+        self.constant = constant
+
+    def is_sample(self, node):
+        return any(isinstance(n, ast.Name) and n.id in self.sample_name for n in ast.walk(node))
+
+    def visit(self, node):
+        if isinstance(node, ast.expr) and not isinstance(node, (ast.Constant, ast.Name)) and not self.is_sample(node):
+            name = "_k{}".format(len(self.constant))
+            self.constant.append((name, compile(ast.Expression(node), "<specimen>", "eval")))
+            return ast.copy_location(ast.Name(id=name, ctx=ast.Load()), node)
+        return self.generic_visit(node)
+
+
+class DerivedEngine():
+    def __init__(self, specimen_parameter, num_channel=4, channel_map=None, expression=OUTPUT_EXPRESSION):
+        # specimen_parameter : shared list, channel_map : channel of each role (see rig.py), None : CH0 - CH3
+        self.specimen_parameter = specimen_parameter
+        self.num_channel = num_channel
+        self.channel_map = list(range(len(ROLE_NAME))) if channel_map is None else list(channel_map)
+        self.expression = tuple(expression)
+        self.name = [name for name, text in expression]
+        self.dtype = np.dtype([("t_ns", np.int64)] + [(name, np.float64) for name in self.name])
+
+        channel_name = [("ch{}".format(i), i) for i in range(num_channel)] + list(zip(ROLE_NAME, self.channel_map))
+        self.channel_name = channel_name
+        sample_name = set(name for name, i in channel_name) | set(self.name)
+        for name in sample_name & (set(SPECIMEN_NAME) | set(FUNCTION)):
+            raise ValueError("Name {} of derived expression is reserved".format(name))
+
+        self.constant = []
+        self.code = []
+        fold = _FoldSpecimen(sample_name, self.constant)
+        for name, text in expression:
+            tree = fold.visit(ast.parse(text, mode="eval"))
+            self.code.append(compile(ast.fix_missing_locations(tree), "<{}>".format(name), "eval"))
+
+        self._specimen = None
+        self.namespace = dict(FUNCTION)
+
+        # last value of each channel (held until next sample)
+        self.last_value = np.full(num_channel, np.nan)
+
+    def _update_constant(self):
+        specimen = list(self.specimen_parameter)
+        if specimen == self._specimen:
+            return
+        self._specimen = specimen
+        self.namespace.update(zip(SPECIMEN_NAME, specimen))
+        for name, code in self.constant:
+            self.namespace[name] = eval(code, {"__builtins__": {}}, self.namespace)
+
+    def evaluate(self, phi):
+        # phi : values of channels, (num_channel,) or (num_channel, n), returns outputs in order of expression
+        self._update_constant()
+        namespace = self.namespace
+        for name, i in self.channel_name:
+            namespace[name] = phi[i]
+
+        output = []
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for name, code in zip(self.name, self.code):
+                value = eval(code, {"__builtins__": {}}, namespace)
+                namespace[name] = value
+                output.append(value)
+        return output
+
+    def process_block(self, channel, t_ns, value):
+        # samples (channel, t_ns, physical value, NaN = dropped) to one row per distinct sample time
+        is_valid = (~np.isnan(value)) & (channel < self.num_channel)
+        channel = channel[is_valid]
+        value = value[is_valid]
+        t_ns = t_ns[is_valid]
+        if len(t_ns) == 0:
+            return np.zeros(0, dtype=self.dtype)
+
+        # rows of sorted distinct times (blocks are HX711 then ADS1115 samples, each in order)
+        order = np.argsort(t_ns, kind="stable")
+        t_ns = t_ns[order]
+        is_new = np.empty(len(t_ns), dtype=bool)
+        is_new[0] = True
+        np.not_equal(t_ns[1:], t_ns[:-1], out=is_new[1:])
+        row = np.cumsum(is_new) - 1
+        num_row = row[-1] + 1
+
+        # zero-order hold of every channel over rows, carried over blocks
+        phi = np.full((self.num_channel, num_row), np.nan)
+        phi[channel[order], row] = value[order]
+        index = np.maximum.accumulate(np.where(np.isnan(phi), -1, np.arange(num_row)), axis=1)
+        phi = np.where(index >= 0, phi.ravel()[np.maximum(index, 0) + np.arange(0, phi.size, num_row)[:, None]],
+                       self.last_value[:, None])
+        self.last_value = phi[:, -1].copy()
+
+        derived = np.empty(num_row, dtype=self.dtype)
+        derived["t_ns"] = t_ns[is_new]
+        for name, output in zip(self.name, self.evaluate(phi)):
+            derived[name] = output
+        return derived
@@ -0,0 +1,146 @@
+################################################################################################
+# Streaming filters applied per channel at acquisition rate
+#
+# Each filter keeps its own state and is updated sample by sample
+#   RunningMedian    : median over sliding window (sorted list : O(log w) search, O(w) shift
+#                      of insert / delete, one memmove, fast for windows of a few tens)
+#   MovingAverage    : mean over sliding window (O(1), running sum)
+#   EMA              : exponential moving average (O(1))
+#   Decimator        : passes every n-th sample, returns None otherwise
+################################################################################################
+
+from bisect import bisect_left, insort
+from collections import deque
+import numpy as np
+
+
+class RunningMedian():
+    def __init__(self, window=15):
+        if window <= 0:
+            raise ValueError("Window length (window) should be positive")
+        self.window = window
+        self.history = deque()
+        self.sorted_value = []
+
+    def update(self, x):
+        # bisect finds the slot, del / insort shift the list (O(w))
+        if len(self.history) == self.window:
+            del self.sorted_value[bisect_left(self.sorted_value, self.history.popleft())]
+        self.history.append(x)
+        insort(self.sorted_value, x)
+        
+        n = len(self.sorted_value)
+        if n % 2:
+            return self.sorted_value[n // 2]
+        return (self.sorted_value[n // 2 - 1] + self.sorted_value[n // 2]) / 2
+
+    def reset(self):
+        self.history.clear()
+        self.sorted_value.clear()
+
+
+class MovingAverage():
+    def __init__(self, window=15):
+        if window <= 0:
+            raise ValueError("Window length (window) should be positive")
+        self.window = window
+        self.history = deque()
+        self.total = 0.
+
+    def update(self, x):
+        if len(self.history) == self.window:
+            self.total -= self.history.popleft()
+        self.history.append(x)
+        self.total += x
+        return self.total / len(self.history)
+
+    def reset(self):
+        self.history.clear()
+        self.total = 0.
+
+
+class EMA():
+    def __init__(self, alpha=0.1):
+        if not 0 < alpha <= 1:
+            raise ValueError("Smoothing factor (alpha) should be in (0, 1]")
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, x):
+        if self.value is None:
+            self.value = x
+        else:
+            self.value += self.alpha * (x - self.value)
+        return self.value
+
+    def reset(self):
+        self.value = None
+
+
+class Decimator():
+    def __init__(self, factor=10):
+        if factor <= 0:
+            raise ValueError("Decimation factor (factor) should be positive")
+        self.factor = factor
+        self.count = 0
+
+    def update(self, x):
+        self.count += 1
+        if self.count < self.factor:
+            return None
+        self.count = 0
+        return x
+
+    def reset(self):
+        self.count = 0
+
+
+FILTER_BY_NAME = {"median": RunningMedian,
+                  "average": MovingAverage,
+                  "ema": EMA,
+                  "decimate": Decimator}
+
+
+class FilterChain():
+    def __init__(self, setting=(("median", 15),)):
+        # setting : sequence of (filter name, parameter), applied in order
+        self.setting = tuple(setting)
+        self.filters = []
+        for name, param in self.setting:
+            if name not in FILTER_BY_NAME:
+                raise ValueError("Unknown filter name: {}".format(name))
+            self.filters.append(FILTER_BY_NAME[name](param))
+        
+        self.value = None
+        self.num_sample = 0
+
+    def update(self, x):
+        self.num_sample += 1
+        for f in self.filters:
+            x = f.update(x)
+            if x is None:
+                return None
+        self.value = x
+        return x
+
+    def process_block(self, values):
+        # filter a block of samples, returns outputs (decimated samples removed)
+        output = []
+        update = self.update
+        for x in np.asarray(values, dtype=np.float64).tolist():
+            y = update(x)
+            if y is not None:
+                output.append(y)
+        return np.array(output)
+
+    def filter_block(self, values):
+        # filter a block of samples, outputs aligned with samples (NaN for decimated samples)
+        update = self.update
+        return np.array([np.nan if y is None else y
+                         for y in map(update, np.asarray(values, dtype=np.float64).tolist())])
+
+    def reset(self):
+        for f in self.filters:
+            f.reset()
+        self.value = None
+        self.num_sample = 0
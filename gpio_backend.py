@@ -0,0 +1,151 @@
+################################################################################################
+# GPIO backends used by MultiHX711
+#
+# RPiGPIOBackend       : RPi.GPIO on Raspberry Pi (imported lazily)
+# SimulatedGPIOBackend : software HX711 bank (see hx711_simulator.py) for any Linux box
+################################################################################################
+
+import random
+import threading
+import time
+
+
+class RPiGPIOBackend():
+    def __init__(self):
+        import RPi.GPIO as GPIO
+        
+        self.GPIO = GPIO
+        
+        # bind hot path functions directly to avoid extra call overhead
+        self.output = GPIO.output
+        self.output_many = GPIO.output          # list of channels
+        self.input = GPIO.input
+
+    def setmode(self):
+        self.GPIO.setmode(self.GPIO.BCM)
+
+    def setup_input(self, pin):
+        self.GPIO.setup(pin, self.GPIO.IN)
+
+    def setup_output(self, pin):
+        self.GPIO.setup(pin, self.GPIO.OUT)
+
+    def add_falling_callback(self, pin, callback):
+        self.GPIO.add_event_detect(pin, self.GPIO.FALLING, callback=callback)
+
+    def remove_callback(self, pin):
+        self.GPIO.remove_event_detect(pin)
+
+    def cleanup(self):
+        self.GPIO.cleanup()
+
+
+class SimulatedGPIOBackend():
+    def __init__(self, clock=time.perf_counter, stall_probability=0., stall_time=100e-6, seed=None):
+        self.clock = clock
+        
+        # preemption of reading process right after SCK rising edge (busy wait of stall_time s)
+        self.stall_probability = stall_probability
+        self.stall_time = stall_time
+        self.num_stall = 0
+        self.random = random.Random(seed)
+        
+        self.chip_by_DT = {}
+        self.chip_by_SCK = {}
+        self.sck_level = {}
+        self.num_sck_edge = 0
+        
+        # emulation of edge detection interrupt
+        self.callback_by_DT = {}
+        self.max_event_wait = 0.01
+        self._event_thread = None
+        self._event_wake = threading.Event()
+
+    def attach(self, chip, pin_DT, pin_SCK):
+        # connect simulated chip to DT and SCK pins
+        chip.clock = self.clock
+        self.chip_by_DT[pin_DT] = chip
+        self.chip_by_SCK.setdefault(pin_SCK, []).append(chip)
+        self.sck_level.setdefault(pin_SCK, False)
+        return chip
+
+    def setmode(self):
+        pass
+
+    def setup_input(self, pin):
+        if pin not in self.chip_by_DT:
+            raise ValueError("No simulated HX711 is attached to DT pin {}".format(pin))
+
+    def setup_output(self, pin):
+        if pin not in self.chip_by_SCK:
+            raise ValueError("No simulated HX711 is attached to SCK pin {}".format(pin))
+
+    def output(self, pin, value):
+        value = bool(value)
+        if self.sck_level[pin] == value:
+            return
+        self.sck_level[pin] = value
+        
+        now = self.clock()
+        if value:
+            self.num_sck_edge += 1
+            for chip in self.chip_by_SCK[pin]:
+                chip.sck_rise(now)
+            if self.stall_probability and self.random.random() < self.stall_probability:
+                self.num_stall += 1
+                end = self.clock() + self.stall_time
+                while self.clock() < end:
+                    pass
+        else:
+            for chip in self.chip_by_SCK[pin]:
+                chip.sck_fall(now)
+
+    def output_many(self, pins, value):
+        for pin in pins:
+            self.output(pin, value)
+
+    def input(self, pin):
+        return self.chip_by_DT[pin].dout(self.clock())
+
+    def add_falling_callback(self, pin, callback):
+        if pin not in self.chip_by_DT:
+            raise ValueError("No simulated HX711 is attached to DT pin {}".format(pin))
+        self.callback_by_DT[pin] = callback
+        
+        if self._event_thread is None:
+            self._event_wake.clear()
+            self._event_thread = threading.Thread(target=self._watch_edge, daemon=True)
+            self._event_thread.start()
+
+    def remove_callback(self, pin):
+        self.callback_by_DT.pop(pin, None)
+
+    def _watch_edge(self):
+        # fire callback when DOUT of a chip falls (conversion becomes ready)
+        # chip state is only inspected here so that the reading thread keeps ownership of it
+        notified_time = {}
+        
+        while self.callback_by_DT:
+            now = self.clock()
+            wait_time = self.max_event_wait
+            
+            for pin, callback in list(self.callback_by_DT.items()):
+                chip = self.chip_by_DT[pin]
+                ready_time = chip.next_ready_time
+                
+                if chip.is_ready or chip.sck_high:
+                    continue
+                if now >= ready_time:
+                    if notified_time.get(pin) != ready_time:
+                        notified_time[pin] = ready_time
+                        callback(pin)
+                else:
+                    wait_time = min(wait_time, ready_time - now)
+            
+            self._event_wake.wait(wait_time)
+        
+        self._event_thread = None
+
+    def cleanup(self):
+        self.callback_by_DT.clear()
+        self._event_wake.set()
@@ -0,0 +1,310 @@
+################################################################################################
+# Headless acquisition daemon (no GUI)
+#
+# Runs acquisition, loading control and logging without PySimpleGUI, e.g. on a Pi without
+# display or right after a power blip. Hardware libraries are imported on demand and
+# ADC/DAC devices are initialized concurrently.
+#
+# Station (pins, I2C addresses, channel roles) comes from a rig configuration (rig.py), options
+# not given on the command line take the values of the rig.
+#
+# Usage : python headless.py --log test.odolog [--rig rigs.json [--rig-name rig1]] [--simulate] ...
+#         python headless.py --help
+################################################################################################
+
+import time
+_start_time = time.perf_counter()
+
+import argparse
+import json
+import signal
+import numpy as np
+
+from acquisition import Acquisition
+from calibration import load_calibration_set
+from control import ControlLoop, LoadingController
+from datalogger import DataLogger
+from derived import OUTPUT_EXPRESSION, DerivedEngine, compute_specimen_parameter
+from metrics import SAVE_DATA, SAVED_RECORDS, MetricsExporter
+from recording import AdaptiveRecorder
+from rig import DEFAULT_RIG, load_rig_config, rig_channel_map
+from ringbuffer import SAMPLE_DTYPE
+
+_import_time = time.perf_counter() - _start_time
+
+
+def _float_list(text):
+    return [float(x) for x in text.split(",")]
+
+
+# (option, key of rig) taken from rig when not given
+_RIG_OPTION = (("save_interval", "save_interval"), ("ads_data_rate", "ads_data_rate"), ("filter", "filter_setting"),
+               ("slope", "slope"), ("intercept", "intercept"), ("specimen", "specimen"),
+               ("control_option", "control_option"), ("vol_out_interval", "vol_out_interval"),
+               ("adc_amp_factor", "adc_amp_factor"), ("sample_plan", "sample_plan"), ("hx711_rate", "hx711_rate"),
+               ("calibration", "calibration"), ("calibration_dir", "calibration_dir"))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Headless oedometer acquisition")
+    parser.add_argument("--rig", default=None, help="JSON of rigs (see rig.py), default : rig.DEFAULT_RIG")
+    parser.add_argument("--rig-name", default=None, help="rig of --rig to run, default : first one")
+    parser.add_argument("--simulate", action="store_true", help="use simulated HX711/ADS1115/DAC")
+    parser.add_argument("--duration", type=float, default=None, help="run time (s), default until Ctrl-C")
+    parser.add_argument("--log", default=None, help="path of log file (.odolog)")
+    parser.add_argument("--no-raw", action="store_true", help="do not log raw samples")
+    parser.add_argument("--save-interval", type=float, default=None, help="interval of derived record (s)")
+    parser.add_argument("--print-interval", type=float, default=5., help="interval of status print (s)")
+    parser.add_argument("--loop-interval", type=float, default=0.1, help="interval of save/print loop (s)")
+    parser.add_argument("--ads-data-rate", type=int, default=None)
+    parser.add_argument("--filter", type=json.loads, default=None, help='filter setting as JSON, e.g. [["median", 15]]')
+    parser.add_argument("--slope", type=_float_list, default=None)
+    parser.add_argument("--intercept", type=_float_list, default=None)
+    parser.add_argument("--specimen", type=_float_list, default=None,
+                        help="height, diameter, drain tank diameter (mm), rho_s (g/cm3)")
+    parser.add_argument("--control-option", type=int, default=None, help="0 none, 1 creep, 2 monotonic, 3 cyclic")
+    parser.add_argument("--control-param", default=None, help="JSON file of 8 x 4 control_param")
+    parser.add_argument("--vol-out-interval", type=float, default=None, help="period of control loop (s)")
+    parser.add_argument("--adc-amp-factor", type=float, default=None)
+    parser.add_argument("--replay", default=None, help="log file replayed instead of HX711 / ADS1115")
+    parser.add_argument("--replay-speed", type=float, default=1., help="x log time, 0 = as fast as possible")
+    parser.add_argument("--metrics-port", type=int, default=9108, help="Prometheus text on localhost, 0 = off")
+    parser.add_argument("--metrics-summary", default=None, help="JSON summary file (default : log file + .metrics.json)")
+    parser.add_argument("--metrics-interval", type=float, default=60., help="interval of summary file (s)")
+    parser.add_argument("--pid-engine", action="store_true", help="track creep / monotonic loading by PID")
+    parser.add_argument("--pid-gain", type=_float_list, default=[0.5, 0.2, 0.], help="kp, ki, kd")
+    parser.add_argument("--sample-plan", type=json.loads, default=None,
+                        help='HX711 inputs interleaved as JSON (input, gain, rate Hz), e.g. [["A", 128, 40], ["B", 32, 10]]')
+    parser.add_argument("--hx711-rate", type=float, default=None, help="HX711 conversion rate (10 or 80 Hz)")
+    parser.add_argument("--calibration", type=json.loads, default=None,
+                        help='calibration profiles per channel as JSON, e.g. {"0": "LC-1234", "1": "LVDT-77@2"}')
+    parser.add_argument("--calibration-dir", default=None, help="directory of calibration profiles")
+    parser.add_argument("--full-rate", action="store_true", help="log derived values of every sample (stream derived_full)")
+    parser.add_argument("--derived-expression", default=None,
+                        help='extra derived values as JSON [name, expression], e.g. [["load_kN", "load / 1000"]]')
+    parser.add_argument("--adaptive-deadband", type=_float_list, default=None,
+                        help="allowed error of phi_val per channel, enables adaptive recording of derived records "
+                             "(default : adaptive_save of rig)")
+    parser.add_argument("--adaptive-min-interval", type=float, default=0.1, help="interval of offered records (s)")
+    parser.add_argument("--adaptive-max-interval", type=float, default=600., help="longest interval of log-time points (s)")
+    parser.add_argument("--points-per-decade", type=float, default=50., help="log-time points per decade after load increment")
+    args = parser.parse_args(argv)
+
+    rig = dict(DEFAULT_RIG)
+    if args.rig is not None:
+        rigs = {x["name"]: x for x in load_rig_config(args.rig)}
+        if args.rig_name is None:
+            args.rig_name = next(iter(rigs))
+        if args.rig_name not in rigs:
+            raise ValueError("No rig {} in {}".format(args.rig_name, args.rig))
+        rig = rigs[args.rig_name]
+    args.rig = rig
+    for name, key in _RIG_OPTION:
+        if getattr(args, name) is None:
+            setattr(args, name, rig[key])
+    return args
+
+
+class HeadlessRunner():
+    def __init__(self, args):
+        self.args = args
+        self.is_running = True
+        
+        self.rig = args.rig
+        self.channel_map = rig_channel_map(self.rig)
+        self.specimen_parameter = compute_specimen_parameter(*args.specimen)
+        self.filter_setting = [tuple(x) for x in args.filter]
+        self.sample_plan = None if args.sample_plan is None else [tuple(x) for x in args.sample_plan]
+        
+        pin_SCK = self.rig["pin_SCK"] if isinstance(self.rig["pin_SCK"], int) else tuple(self.rig["pin_SCK"])
+        self.acquisition = Acquisition(pin_DT=tuple(self.rig["pin_DT"]), pin_SCK=pin_SCK,
+                                       ads_address=self.rig["ads_address"], dac_address=self.rig["dac_address"],
+                                       i2c_bus=self.rig["i2c_bus"],
+                                       ads_data_rate=args.ads_data_rate,
+                                       filter_setting=self.filter_setting,
+                                       simulate=args.simulate,
+                                       replay=args.replay,
+                                       replay_speed=args.replay_speed,
+                                       sample_plan=self.sample_plan,
+                                       hx711_rate=args.hx711_rate)
+        self.acquisition.initialize_devices()
+        self.num_module = self.acquisition.num_module
+        
+        # channel B inputs are extra channels, uncalibrated unless given
+        self.slope = list(args.slope) + [1.] * (self.num_module - len(args.slope))
+        self.intercept = list(args.intercept) + [0.] * (self.num_module - len(args.intercept))
+        self.calibration = None
+        if args.calibration:
+            self.calibration = load_calibration_set(args.calibration_dir, args.calibration,
+                                                    self.slope, self.intercept)
+        self.current_vol = self.acquisition.current_vol
+        self.current_phi_val = [0.] * self.num_module
+        self.current_output_param = [0.] * 5
+        
+        self.controller = LoadingController(self.acquisition.dac,
+                                            vol_out_interval=args.vol_out_interval,
+                                            adc_amp_factor=args.adc_amp_factor,
+                                            use_pid_engine=args.pid_engine or self.rig["use_pid_engine"],
+                                            pid_gain=args.pid_gain)
+        if args.control_param is not None:
+            with open(args.control_param) as f:
+                self.controller.control_param[:] = json.load(f)
+        elif self.rig["control_param"] is not None:
+            self.controller.control_param[:] = self.rig["control_param"]
+        if args.control_option:
+            self.controller.set_control_option(args.control_option)
+            self.controller.start()
+        
+        self.derived_engine = None
+        if args.full_rate:
+            expression = OUTPUT_EXPRESSION
+            if args.derived_expression is not None:
+                expression += tuple(tuple(x) for x in json.loads(args.derived_expression))
+            self.derived_engine = DerivedEngine(self.specimen_parameter, num_channel=self.num_module,
+                                                channel_map=self.channel_map, expression=expression)
+        
+        # log-time + swinging door recording instead of every save_interval, channel B inputs unbounded unless given
+        self.recorder = None
+        if args.adaptive_deadband is not None:
+            deadband = list(args.adaptive_deadband) + [float("inf")] * (self.num_module - len(args.adaptive_deadband))
+            self.recorder = AdaptiveRecorder(deadband, min_interval=args.adaptive_min_interval,
+                                             points_per_decade=args.points_per_decade,
+                                             max_interval=args.adaptive_max_interval)
+        elif self.rig["adaptive_save"] is not None:
+            self.recorder = AdaptiveRecorder(**self.rig["adaptive_save"])
+        
+        self.logger = None
+        if args.log is not None:
+            self.logger = self._create_logger(args.log)
+        
+        self.control_loop = ControlLoop(self.controller, self.acquisition, 
+                                        self.slope, self.intercept, self.specimen_parameter,
+                                        self.current_phi_val, self.current_output_param,
+                                        period=args.vol_out_interval, on_record=self._save_raw_data,
+                                        metrics=self.acquisition.metrics, channel_map=self.channel_map,
+                                        calibration=self.calibration, derived_engine=self.derived_engine,
+                                        on_derived=self._save_full_derived)
+        
+        summary_path = args.metrics_summary
+        if summary_path is None and args.log is not None:
+            summary_path = args.log + ".metrics.json"
+        self.metrics = self.acquisition.metrics
+        self.metrics_exporter = MetricsExporter(self.metrics, port=args.metrics_port, summary_path=summary_path,
+                                                summary_interval=args.metrics_interval)
+
+    def _create_logger(self, path):
+        self.derived_dtype = np.dtype([("t_ns", np.int64),
+                                       ("time", np.float64),
+                                       ("vol", np.float64, (self.num_module,)),
+                                       ("phi_val", np.float64, (self.num_module,)),
+                                       ("output_param", np.float64, (5,))])
+        self.start_time = time.time()
+        header_info = {"slope": list(self.slope),
+                       "intercept": list(self.intercept),
+                       "specimen_parameter": list(self.specimen_parameter),
+                       "filter_setting": list(self.filter_setting),
+                       "sample_plan": self.sample_plan,
+                       "calibration": None if self.calibration is None else self.calibration.version(),
+                       "calibration_dir": self.args.calibration_dir,
+                       "pin_DT": list(self.acquisition.pin_DT),
+                       "channel_map": self.channel_map,
+                       "rig": self.rig,
+                       "adaptive_save": None if self.recorder is None else self.recorder.setting(),
+                       "start_time": self.start_time,
+                       "headless": True}
+        streams = {"raw": SAMPLE_DTYPE, "derived": self.derived_dtype}
+        if self.derived_engine is not None:
+            header_info["derived_expression"] = [list(x) for x in self.derived_engine.expression]
+            streams["derived_full"] = self.derived_engine.dtype
+        return DataLogger(path, streams, header_info=header_info)
+
+    def _save_raw_data(self, new_record):
+        if self.logger is not None and not self.args.no_raw:
+            self.logger.log("raw", new_record)
+
+    def _save_full_derived(self, derived):
+        if self.logger is not None:
+            self.logger.log("derived_full", derived)
+
+    def _save_data(self):
+        # number of derived records written
+        record = (time.monotonic_ns(), time.time() - self.start_time,
+                  list(self.current_vol), list(self.current_phi_val), list(self.current_output_param))
+        if self.recorder is None:
+            self.logger.log("derived", record)
+            return 1
+        records = self.recorder.update(record[1], record[3], record[4][0], record)
+        if records:
+            self.logger.log("derived", records)
+        return len(records)
+
+    def run(self):
+        args = self.args
+        self.acquisition.start()
+        self.control_loop.start()
+        self.metrics_exporter.start()
+        
+        start = time.monotonic()
+        temp_save_triggered_time = start
+        temp_print_triggered_time = start
+        save_interval = args.save_interval if self.recorder is None else self.recorder.min_interval
+        
+        while self.is_running:
+            now = time.monotonic()
+            if args.duration is not None and now - start > args.duration:
+                break
+            if (self.acquisition.is_replay_finished.value and len(self.acquisition.read_value) == 0
+                    and len(self.acquisition.read_value_ads) == 0):
+                break
+            
+            if self.logger is not None and now - temp_save_triggered_time >= save_interval:
+                temp_start = time.monotonic_ns()
+                num_record = self._save_data()
+                self.metrics.observe(SAVE_DATA, time.monotonic_ns() - temp_start)
+                self.metrics.add(SAVED_RECORDS, num_record)
+                temp_save_triggered_time = now
+            
+            if now - temp_print_triggered_time > args.print_interval:
+                print("t={:8.1f} s  vol={}  σ_a={:.3f} kPa  ɛ_a={:.4f} %  DAC={}".format(
+                    now - start, ["{:.6f}".format(v) for v in self.current_vol],
+                    self.current_output_param[0], self.current_output_param[1], self.controller.current_output_vol))
+                temp_print_triggered_time = now
+            
+            time.sleep(args.loop_interval)
+        
+        self.close()
+
+    def stop(self, *args):
+        self.is_running = False
+
+    def close(self):
+        self.control_loop.stop()
+        self.metrics_exporter.stop()
+        self.acquisition.close()
+        if self.logger is not None:
+            if self.recorder is not None:
+                records = self.recorder.flush()
+                if records:
+                    self.logger.log("derived", records)
+            self.logger.close()
+        self.acquisition.print_interval_statistics()
+        self.control_loop.print_loop_statistics()
+        if self.recorder is not None:
+            self.recorder.print_statistics()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    
+    runner = HeadlessRunner(args)
+    signal.signal(signal.SIGINT, runner.stop)
+    signal.signal(signal.SIGTERM, runner.stop)
+    
+    print("startup {:.3f} s (imports {:.3f} s, devices {:.3f} s)".format(
+        time.perf_counter() - _start_time, _import_time, runner.acquisition.startup_time["total"]))
+    
+    runner.run()
+
+
+if __name__ == "__main__":
+    main()
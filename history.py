@@ -0,0 +1,138 @@
+################################################################################################
+# Multi-resolution history of derived values for live plots
+#
+# Level 0 holds every appended point, level k+1 holds one bucket (first / min / max) per
+# fanout entries of level k. Plots ask for min/max envelope over bins (linear or log time)
+# and every bin is served from the coarsest level that still resolves it, so the cost of
+# redraw depends on the number of bins (pixels), not on the number of samples.
+################################################################################################
+
+import threading
+import numpy as np
+
+
+class _Level():
+    # growable arrays of bucket time, first, min and max value
+    def __init__(self, num_field, capacity, is_raw=False):
+        self.is_raw = is_raw
+        self.size = 0
+        self.t = np.zeros(capacity)
+        self.first = np.zeros((capacity, num_field))
+
+        # raw level : min and max are the values themselves
+        self.min = self.first if is_raw else np.zeros((capacity, num_field))
+        self.max = self.first if is_raw else np.zeros((capacity, num_field))
+
+    def append(self, t, first, min_value, max_value):
+        # one slot beyond size is kept for reduceat in envelope
+        if self.size + 1 == len(self.t):
+            self._grow()
+        self.t[self.size] = t
+        self.first[self.size] = first
+        if not self.is_raw:
+            self.min[self.size] = min_value
+            self.max[self.size] = max_value
+        self.size += 1
+
+    def _grow(self):
+        capacity = 2 * len(self.t)
+        self.t = np.resize(self.t, capacity)
+        self.first = np.resize(self.first, (capacity, self.first.shape[1]))
+        if self.is_raw:
+            self.min = self.max = self.first
+        else:
+            self.min = np.resize(self.min, (capacity, self.min.shape[1]))
+            self.max = np.resize(self.max, (capacity, self.max.shape[1]))
+
+
+class HistoryPyramid():
+    def __init__(self, num_field, fanout=8, num_level=8, capacity=4096):
+        if fanout < 2:
+            raise ValueError("Fanout should be 2 or more")
+
+        self.num_field = num_field
+        self.fanout = fanout
+        self.levels = [_Level(num_field, capacity, is_raw=(i == 0)) for i in range(num_level)]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.levels[0].size
+
+    def append(self, t, values):
+        # t : time (s), values : num_field values
+        with self._lock:
+            self.levels[0].append(t, values, None, None)
+
+            # close bucket of next level whenever fanout new entries are complete
+            for k in range(1, len(self.levels)):
+                lower = self.levels[k - 1]
+                start = self.levels[k].size * self.fanout
+                if lower.size - start < self.fanout:
+                    break
+                end = start + self.fanout
+                self.levels[k].append(lower.t[start], lower.first[start],
+                                      lower.min[start:end].min(axis=0), lower.max[start:end].max(axis=0))
+
+    def time_range(self):
+        level = self.levels[0]
+        if level.size == 0:
+            return None
+        return level.t[0], level.t[level.size - 1]
+
+    def envelope(self, field, edges):
+        # min / max of field per bin [edges[i], edges[i + 1]), nan for empty bins
+        edges = np.asarray(edges, dtype=float)
+        width = np.diff(edges)
+        num_bin = len(width)
+        min_value = np.full(num_bin, np.nan)
+        max_value = np.full(num_bin, np.nan)
+
+        with self._lock:
+            is_done = np.zeros(num_bin, dtype=bool)
+
+            for k in range(len(self.levels) - 1, -1, -1):
+                level = self.levels[k]
+                if level.size < 2:
+                    continue
+
+                # coarse level serves bins holding fanout or more of its buckets (straddling bucket
+                # blurs edge by less than 1 / fanout of bin), and bins it fully covers
+                spacing = (level.t[level.size - 1] - level.t[0]) / (level.size - 1)
+                covered_end = level.t[level.size - 1] + spacing
+                is_used = ~is_done & (edges[1:] <= covered_end)
+                if k != 0:
+                    is_used &= width >= self.fanout * spacing
+                if not np.any(is_used):
+                    continue
+
+                # one reduceat over [start, end) pairs of non-empty bins (end may be size, one extra slot)
+                index = np.searchsorted(level.t[:level.size], edges)
+                bin_index = np.flatnonzero(is_used & (index[1:] > index[:-1]))
+                is_done |= is_used
+                if len(bin_index) == 0:
+                    continue
+                pair = np.column_stack([index[bin_index], index[bin_index + 1]]).ravel()
+                min_value[bin_index] = np.minimum.reduceat(level.min[:level.size + 1, field], pair)[::2]
+                max_value[bin_index] = np.maximum.reduceat(level.max[:level.size + 1, field], pair)[::2]
+
+        return min_value, max_value
+
+    def sample(self, max_point):
+        # representative (first) values of the finest level holding at most max_point entries
+        with self._lock:
+            for level in self.levels:
+                if level.size <= max_point:
+                    return level.t[:level.size].copy(), level.first[:level.size].copy()
+
+            level = self.levels[-1]
+            step = int(np.ceil(level.size / max_point))
+            return level.t[:level.size:step].copy(), level.first[:level.size:step].copy()
+
+
+def envelope_polyline(edges, min_value, max_value):
+    # min / max envelope to polyline (x, y), two points per non-empty bin
+    center = (edges[1:] + edges[:-1]) / 2
+    is_valid = ~np.isnan(min_value)
+    x = np.repeat(center[is_valid], 2)
+    y = np.column_stack([min_value[is_valid], max_value[is_valid]]).ravel()
+    return x, y
@@ -0,0 +1,158 @@
+################################################################################################
+# Software model of HX711 (24 bit ADC for load cell)
+#
+# Bit exact model of the serial interface
+#   - DOUT goes low when conversion is ready and stays low until read
+#   - each SCK rising edge shifts out one bit (MSB first, two's complement)
+#   - 25 / 26 / 27 pulses select channel A gain 128 / channel B gain 32 / channel A gain 64
+#   - SCK high longer than 60 us powers down the chip, falling edge resets it
+#   - output settles 4 conversion periods after reset or channel/gain change
+################################################################################################
+
+import random
+import time
+
+
+# (channel, gain) selected by total number of SCK pulses in one read
+GAIN_BY_PULSE = {25: ("A", 128), 26: ("B", 32), 27: ("A", 64)}
+
+
+class SimulatedHX711():
+    def __init__(self, rate=10, input_mV=0., input_B_mV=0., noise_mV=0., drift_mV=0.,
+                 input_vol=5, power_down_time=60e-6, settling_periods=4, seed=None, clock=time.perf_counter):
+        
+        if rate <= 0:
+            raise ValueError("Conversion rate (rate) should be positive")
+        
+        self.rate = rate
+        self.period = 1. / rate
+        
+        # differential input of channel A/B (mV), float or callable of time (s)
+        self.input_mV = input_mV
+        self.input_B_mV = input_B_mV
+        self.noise_mV = noise_mV
+        self.drift_mV = drift_mV                   # mV/s
+        self.input_vol = input_vol
+        self.power_down_time = power_down_time
+        self.settling_periods = settling_periods
+        self.random = random.Random(seed)
+        self.clock = clock
+        
+        self.channel = "A"
+        self.gain = 128
+        self.num_conversion = 0
+        self.num_power_down = 0
+        self.sck_rise_time = None
+        self._reset(self.clock())
+
+    def _reset(self, now):
+        # start conversion with default channel A gain 128 after power-up
+        self.sck_high = False
+        self.channel = "A"
+        self.gain = 128
+        self.start_time = now
+        self._restart_conversion(now)
+
+    def _restart_conversion(self, now):
+        self.next_ready_time = now + self.period * self.settling_periods
+        self.is_ready = False
+        self.num_pulse = 0
+        self.data = 0
+        self.bit = 1
+        self.ready_time = None
+
+    def _input(self, now):
+        source = self.input_mV if self.channel == "A" else self.input_B_mV
+        value = source(now) if callable(source) else source
+        value += self.drift_mV * (now - self.start_time)
+        if self.noise_mV:
+            value += self.random.gauss(0., self.noise_mV)
+        return value
+
+    def _convert(self, now):
+        full_scale_mV = self.input_vol / self.gain * 1000
+        code = int(round(self._input(now) / full_scale_mV * 0xFFFFFF))
+        code = max(-0x800000, min(0x7FFFFF, code))
+        self.num_conversion += 1
+        return code & 0xFFFFFF
+
+    def _update(self, now):
+        # latch new conversion result while not being read
+        if self.num_pulse == 0 and now >= self.next_ready_time:
+            num_skipped = int((now - self.next_ready_time) / self.period)
+            self.ready_time = self.next_ready_time + num_skipped * self.period
+            self.next_ready_time = self.ready_time + self.period
+            self.data = self._convert(self.ready_time)
+            self.is_ready = True
+
+    def _select_gain(self, now):
+        # gain of next conversion is fixed once pulses after 24th bit are over
+        channel, gain = GAIN_BY_PULSE[self.num_pulse]
+        self.num_pulse = 0
+        self.is_ready = False
+        
+        if (channel, gain) != (self.channel, self.gain):
+            self.channel = channel
+            self.gain = gain
+            self._restart_conversion(now)
+
+    def dout(self, now):
+        if self.sck_high and now - self.sck_rise_time > self.power_down_time:
+            return 1
+        if self.num_pulse >= 25:
+            self._select_gain(now)
+        self._update(now)
+        if self.num_pulse == 0:
+            return 0 if self.is_ready else 1
+        return self.bit
+
+    def sck_rise(self, now):
+        self.sck_rise_time = now
+        self.sck_high = True
+        
+        if self.num_pulse >= 25:
+            self.num_pulse += 1
+            return
+        
+        self._update(now)
+        if self.is_ready:
+            self.num_pulse += 1
+            if self.num_pulse <= 24:
+                self.bit = (self.data >> (24 - self.num_pulse)) & 1
+            else:
+                # DOUT goes high after 25th pulse
+                self.bit = 1
+                self.is_ready = False
+
+    def sck_fall(self, now):
+        self.sck_high = False
+        if self.sck_rise_time is not None and now - self.sck_rise_time > self.power_down_time:
+            # power down by long high pulse, falling edge resets chip
+            self.num_power_down += 1
+            self._reset(now)
+            return
+        
+        if self.num_pulse >= 27:
+            self._select_gain(now)
+
+
+def create_simulated_bank(pin_DT=(5, 16, 17), pin_SCK=6, backend=None, **kwargs):
+    # attach one simulated HX711 per DT pin, pin_SCK is one serial clock or one per DT pin
+    # (rate and input_mV may also be given per chip)
+    from gpio_backend import SimulatedGPIOBackend
+    
+    if backend is None:
+        backend = SimulatedGPIOBackend()
+    
+    seed = kwargs.pop("seed", None)
+    input_mV = kwargs.pop("input_mV", 0.)
+    rate = kwargs.pop("rate", 10)
+    
+    for i, pin in enumerate(pin_DT):
+        chip_seed = None if seed is None else seed + i
+        chip_input_mV = input_mV[i] if isinstance(input_mV, (list, tuple)) else input_mV
+        chip_rate = rate[i] if isinstance(rate, (list, tuple)) else rate
+        chip_SCK = pin_SCK if isinstance(pin_SCK, int) else pin_SCK[i]
+        backend.attach(SimulatedHX711(rate=chip_rate, input_mV=chip_input_mV, seed=chip_seed, **kwargs), pin, chip_SCK)
+    
+    return backend
@@ -1,80 +1,129 @@
-from multihx711 import MultiHX711
-import adafruit_ads1x15.ads1115 as ADS
-import adafruit_mcp4725 as MCP
-from adafruit_ads1x15.analog_in import AnalogIn
-import asyncio
-import board
-import busio
-from collections import deque
-import copy
-import csv
+from acquisition import Acquisition
+from calibration import load_calibration_set
+from control import ControlLoop, LoadingController
+from datalogger import DataLogger
+from derived import DerivedEngine, compute_specimen_parameter
+from history import HistoryPyramid, envelope_polyline
+from metrics import SAVE_DATA, SAVED_RECORDS, UPDATE_VARIABLE, MetricsExporter
+from recording import AdaptiveRecorder
+from rig import DEFAULT_RIG, load_rig_config, rig_channel_map, rig_num_channel
+from ringbuffer import SAMPLE_DTYPE
+from view_model import ViewModel
 import numpy as np
-import math
-import multiprocessing as mp
 import PySimpleGUI as sg
 import sys
 import time
 
 
 class Window():
-    def __init__(self):
+    def __init__(self, rig=None):
+        # station (pins, I2C addresses, channel roles, calibration, specimen), see rig.py
+        self.rig = dict(DEFAULT_RIG) if rig is None else rig
+        if rig_num_channel(self.rig) != 4:
+            raise ValueError("Window shows 4 channels (3 HX711 + ADS1115), rig {} has {}".format(
+                self.rig["name"], rig_num_channel(self.rig)))
+        
         # variables for adc
-        self.max_num_queue_read = 100
+        self.ring_buffer_capacity = 8192
         self.num_module = 4
+        self.hx711_timeout = 0.5
+        self.ads_data_rate = self.rig["ads_data_rate"]
 
         # variables for dac and loading control
-        self.vol_out_interval = 0.5
-        self.control_param = np.zeros((8, 4))
-        self.is_controling = False
-        self.adc_amp_factor = 100                 # N/Voltage
-        self.current_control_option = 0
-        self.start_time_cur_step = time.time()
-        self.current_output_vol = 0
+        self.vol_out_interval = self.rig["vol_out_interval"]
+        self.adc_amp_factor = self.rig["adc_amp_factor"]   # N/Voltage
         self.base_elastic_modulus = 10000
         
-        # variables for updating window
+        # variables for updating window (GUI blocks between refreshes)
         self.update_window_interval = 1.
+        self.gui_cpu_time = 0.
+        self.gui_wall_time = 0.
+        
+        # variables for plots (history of output_param + phi_val, decimated to plot width)
+        self.plot_size = (400, 250)
+        self.plot_interval = 2.
+        self.is_plot_log_time = True
+        self.history = HistoryPyramid(5 + self.num_module)
+        
+        # variables for metrics (Prometheus text on localhost, summary next to save file)
+        self.metrics_port = 9108
+        self.metrics_summary_interval = 60.
 
+        # variables for filtering (applied per sample, see filters.py)
+        self.filter_setting = [tuple(x) for x in self.rig["filter_setting"]]
+        
         # variables for calibration
-        self.slope = [1., 1., 1., 1.]
-        self.intercept = [0., 0., 0., 0.]
+        self.slope = [float(x) for x in self.rig["slope"]]
+        self.intercept = [float(x) for x in self.rig["intercept"]]
+        
+        # multi-point profiles of rig, intercept of profiled channels is tare offset
+        self.calibration = None
+        if self.rig["calibration"]:
+            self.calibration = load_calibration_set(self.rig["calibration_dir"], self.rig["calibration"],
+                                                    self.slope, self.intercept)
         
         # specimen parameters
-        specimen_height = 150.
-        specimen_diameter = 150.
-        drain_tank_diameter = 84.
-        rho_s = 2.69
-        self.specimen_parameter = [specimen_height,
-                                   specimen_diameter, 
-                                   specimen_diameter ** 2 / 4 * math.pi,
-                                   specimen_diameter ** 2 / 4 * math.pi * specimen_height,
-                                   drain_tank_diameter,
-                                   drain_tank_diameter ** 2 / 4 * math.pi,
-                                   rho_s]
+        specimen_height, specimen_diameter, drain_tank_diameter, rho_s = self.rig["specimen"]
+        self.specimen_parameter = compute_specimen_parameter(specimen_height, specimen_diameter, drain_tank_diameter, rho_s)
 
         # varialbles related to saving and monitoring
         self.save_interval = 1
         self.save_dir = "(file path)"
         self.is_saving_allowed = False
-        self.is_avialable_window = mp.Value("i", 1)
+        self.is_raw_saving = True
+        self.logger = None
+        self.recorder = None                    # adaptive recording of rig, new one per log file
+        self.flush_interval = 1.
+        self.fsync_interval = 10.
+        self.ch_name = ["CH0_Load_Cell_(Odo)", "CH1_Displacement_Gauge", "CH2_Load_Cell_(Tank)", "CH3_Hydraulic_Pressure"]
+        self.output_param_name = ["sigma_a(kPa)", "epsilon_a(%)", "Discharged Volume(mm3)", "Discharged Water(mm3)", "Volume Percentage(%)"]
         self.is_ch_updated = np.array([True] * self.num_module)
 
-        self.read_value = [mp.Queue(maxsize=self.max_num_queue_read) for i in range(self.num_module)]
-        self.current_vol = [0.] * self.num_module
         self.current_phi_val = [0.] * self.num_module
         self.current_output_param = [0.] * 5
+        self.derived_dtype = np.dtype([("t_ns", np.int64),
+                                       ("time", np.float64),
+                                       ("vol", np.float64, (self.num_module,)),
+                                       ("phi_val", np.float64, (self.num_module,)),
+                                       ("output_param", np.float64, (5,))])
         
         self._initialize_ADC_DAC()
         self._intiialize_window()
         self._update_window()
 
     def _initialize_ADC_DAC(self):
-        print("initializing start (ADC/DAC)")
-        self.hx = MultiHX711()
-        self.i2c = busio.I2C(board.SCL, board.SDA)
-        self.ads = ADS.ADS1115(self.i2c, address=0x48)
-        self.dac = MCP.MCP4725(self.i2c, address=0x60)
-        print("initializing end   (ADC/DAC)")
+        pin_SCK = self.rig["pin_SCK"] if isinstance(self.rig["pin_SCK"], int) else tuple(self.rig["pin_SCK"])
+        self.acquisition = Acquisition(pin_DT=tuple(self.rig["pin_DT"]), pin_SCK=pin_SCK,
+                                       ads_address=self.rig["ads_address"], dac_address=self.rig["dac_address"],
+                                       i2c_bus=self.rig["i2c_bus"], hx711_rate=self.rig["hx711_rate"],
+                                       ads_data_rate=self.ads_data_rate,
+                                       hx711_timeout=self.hx711_timeout,
+                                       ring_buffer_capacity=self.ring_buffer_capacity,
+                                       filter_setting=self.filter_setting)
+        self.acquisition.initialize_devices()
+        self.current_vol = self.acquisition.current_vol
+        
+        # σ_a, ɛ_a, drainage of every filtered sample, logged as stream derived_full
+        self.derived_engine = DerivedEngine(self.specimen_parameter, num_channel=self.num_module,
+                                            channel_map=rig_channel_map(self.rig))
+        self.controller = LoadingController(self.acquisition.dac,
+                                            vol_out_interval=self.vol_out_interval,
+                                            adc_amp_factor=self.adc_amp_factor,
+                                            base_elastic_modulus=self.base_elastic_modulus,
+                                            use_pid_engine=self.rig["use_pid_engine"])
+        self.displayed_control_option = self.controller.current_control_option
+        
+        # drains acquisition and runs control law on fixed rate, independent of GUI
+        self.control_loop = ControlLoop(self.controller, self.acquisition, 
+                                        self.slope, self.intercept, self.specimen_parameter,
+                                        self.current_phi_val, self.current_output_param,
+                                        period=self.vol_out_interval, on_record=self._save_raw_data,
+                                        history=self.history, metrics=self.acquisition.metrics,
+                                        channel_map=rig_channel_map(self.rig), calibration=self.calibration,
+                                        derived_engine=self.derived_engine, on_derived=self._save_full_derived)
+        self.metrics = self.acquisition.metrics
+        self.metrics_exporter = MetricsExporter(self.metrics, port=self.metrics_port,
+                                                summary_interval=self.metrics_summary_interval)
         
     
     def _intiialize_window(self):
@@ -151,7 +200,7 @@ class Window():
                                                          sg.InputText(self.current_output_param[4], readonly=True, enable_events=True, key='current_output_param_4', size=(10, 1)),
                                                          sg.Text("(%)", size=(5, 1))],
                                                         [sg.Text("Output V", size=(19, 1)),
-                                                         sg.InputText(self.current_output_vol, readonly=False, enable_events=True, key='current_output_param_5', size=(10, 1)),
+                                                         sg.InputText(self.controller.current_output_vol, readonly=False, enable_events=True, key='current_output_param_5', size=(10, 1)),
                                                          sg.Text("(V)", size=(5, 1))]],
                                        vertical_alignment="top")
         layout_record = sg.Frame("Record and Output", [[sg.InputText(default_text="(file path)", enable_events=True, key="save_file_path", size=(25, 1), readonly=True)],
@@ -164,7 +213,7 @@ class Window():
                                             [sg.Text("ADC Output Rate", size=(12, 1)),
                                              sg.InputText(self.vol_out_interval, readonly=True, key='adc_output_interval', size=(5, 1)),
                                              sg.Text("(Hz)", size=(4, 1))],
-                                            [sg.FileSaveAs(button_text="Start Saving", key='start_saving', target="save_file_path", default_extension=".csv", size=(8, 1)), 
+                                            [sg.FileSaveAs(button_text="Start Saving", key='start_saving', target="save_file_path", default_extension=".odolog", size=(8, 1)), 
                                              sg.Button("Stop Saving", disabled=True, key='stop_saving', size=(8, 1))],
                                             [sg.Button("Start Control", key='start_control', size=(8, 1)), 
                                              sg.Button("Stop Control", disabled=True, key='stop_control', size=(8, 1))]],
@@ -217,113 +266,196 @@ class Window():
                                                       sg.InputText(0, size=(6, 1), key="control_param_5_3", enable_events=True)]],
                                   vertical_alignment="top")
         
-        layout_all =[[layout_calibration, layout_specimen_value], [layout_output_value, layout_output_param], [layout_record, layout_control]]
+        layout_plot = sg.Frame("Plot", [[sg.Graph(self.plot_size, (0, 0), self.plot_size, key="plot_stress_strain", background_color="white"),
+                                         sg.Graph(self.plot_size, (0, 0), self.plot_size, key="plot_time_history", background_color="white")],
+                                        [sg.Text("σ_a - ɛ_a", size=(52, 1)),
+                                         sg.Text("ɛ_a - time of current step", size=(30, 1)),
+                                         sg.Checkbox("log t", default=self.is_plot_log_time, key="plot_log_time", enable_events=True)]],
+                               vertical_alignment="top")
+        
+        layout_all =[[layout_calibration, layout_specimen_value], [layout_output_value, layout_output_param], [layout_record, layout_control], [layout_plot]]
         
         # create window
         self.window = sg.Window('DigitShowBasic Mini', layout_all, finalize=True)
+        self.view = ViewModel(self.window)
         print("initializing end (window)")
     
     def _update_window(self):
         # ------- initialize hx711 module --------
-        process_adc = mp.Process(target=self._read_adc)
-        process_adc.start()
-        
-        temp_save_triggered_time = time.time()
-        temp_update_variable_triggered_time = time.time()
-        temp_control_triggered_time = time.time()
+        self.acquisition.start()
+        self.control_loop.start()
+        self.metrics_exporter.start()
         
+        temp_save_triggered_time = time.monotonic()
+        temp_update_variable_triggered_time = time.monotonic()
+        temp_plot_triggered_time = time.monotonic()
+        temp_cpu_start = time.thread_time()
+        temp_wall_start = time.monotonic()
         
         while True:
             
-            event, values = self.window.read(timeout=0.001)
+            # block until next refresh (or save) is due instead of spinning the event loop
+            temp_next_time = min(temp_update_variable_triggered_time + self.update_window_interval,
+                                 temp_plot_triggered_time + self.plot_interval)
+            save_interval = self.save_interval if self.recorder is None else self.recorder.min_interval
+            if self.is_saving_allowed and np.prod(self.is_ch_updated):
+                temp_next_time = min(temp_next_time, temp_save_triggered_time + save_interval)
+            temp_timeout = max(0, int((temp_next_time - time.monotonic()) * 1000))
+            
+            event, values = self.window.read(timeout=temp_timeout)
             
             if event == sg.WIN_CLOSED or event == 'Cancel':
-                self.is_windowing.value = False
                 break
 
             if event != "__TIMEOUT__":
                 self._import_event(event, values)
             
-            is_update_ellapsed_time = (time.time() - temp_update_variable_triggered_time) > self.update_window_interval
+            is_update_ellapsed_time = (time.monotonic() - temp_update_variable_triggered_time) >= self.update_window_interval
             
             if is_update_ellapsed_time:
+                temp_start = time.monotonic_ns()
                 self._update_variable()
-                temp_update_variable_triggered_time = time.time() 
+                self.metrics.observe(UPDATE_VARIABLE, time.monotonic_ns() - temp_start)
+                temp_update_variable_triggered_time = time.monotonic() 
             
-            is_saving_ellapsed_time = (time.time() - temp_save_triggered_time) > self.save_interval
+            if (time.monotonic() - temp_plot_triggered_time) >= self.plot_interval:
+                self._update_plot()
+                temp_plot_triggered_time = time.monotonic()
+            
+            is_saving_ellapsed_time = (time.monotonic() - temp_save_triggered_time) >= save_interval
             is_all_ch_updated = np.prod(self.is_ch_updated)
             
             if self.is_saving_allowed and is_saving_ellapsed_time and is_all_ch_updated:
-                self._save_data()
+                temp_start = time.monotonic_ns()
+                num_record = self._save_data()
+                self.metrics.observe(SAVE_DATA, time.monotonic_ns() - temp_start)
+                self.metrics.add(SAVED_RECORDS, num_record)
                 self.is_ch_updated = np.array([False] * self.num_module)
-                temp_save_triggered_time = time.time()
-            
-            is_controling_ellapsed_time = (time.time() - temp_control_triggered_time) > self.vol_out_interval
-            if self.is_controling and is_controling_ellapsed_time:
-                self._control_adc_output()
-                temp_control_triggered_time = time.time()
+                temp_save_triggered_time = time.monotonic()
+        
+        self.gui_cpu_time = time.thread_time() - temp_cpu_start
+        self.gui_wall_time = time.monotonic() - temp_wall_start
         
-        process_hx711.join()
+        self.control_loop.stop()
+        self.metrics_exporter.stop()
+        self.acquisition.close()
+        
+        if self.logger is not None:
+            self._close_logger()
+        
+        self.acquisition.print_interval_statistics()
+        self.control_loop.print_loop_statistics()
+        print("GUI loop CPU {:.1f} %, {} element updates pushed, {} unchanged skipped".format(
+            self.gui_cpu_time / max(self.gui_wall_time, 1e-9) * 100, self.view.num_push, self.view.num_skip))
         
-        GPIO.cleanup()
         self.window.close()
         sys.exit()
         
         
-    def _read_adc(self):
-        
-        while self.is_avialable_window:
-            is_updated, hx711_read_value = self.hx.read_value()
-            if is_updated:
-                for i in range(3):
-                    temp_2 = hx711_read_value[i]
-                    self.read_value[i].put(temp_2)
-            
-            temp_1 = AnalogIn(self.ads, ADS.P0).voltage
-            self.read_value[3].put(temp_1)
+    def _save_raw_data(self, new_record):
+        # called from control loop with every drained block of samples
+        logger = self.logger
+        if self.is_saving_allowed and self.is_raw_saving and logger is not None:
+            logger.log("raw", new_record)
+    
+    def _save_full_derived(self, derived):
+        logger = self.logger
+        if self.is_saving_allowed and logger is not None:
+            logger.log("derived_full", derived)
     
     def _update_variable(self):
         for i in range(self.num_module):
-            queue_size = self.read_value[i].qsize()
-            
-            if queue_size != 0:
-                current_queue_value = np.array([])
-                for j in range(queue_size):
-                    temp_3 = self.read_value[i].get()
-                    current_queue_value = np.append(current_queue_value, temp_3)
+            if self.acquisition.is_ch_filtered[i]:
+                self.acquisition.is_ch_filtered[i] = False
                 
-                self.current_vol[i] = np.median(current_queue_value)
-                self.current_phi_val[i] = self.slope[i] * self.current_vol[i] + self.intercept[i]
-                
-                vol_element_key = "vol_CH" + str(i)
-                phi_val_element_key =  "phi_val_CH" + str(i)
-                
-                self.window.Element(vol_element_key).Update(value="{:.6f}".format(self.current_vol[i]))
-                self.window.Element(phi_val_element_key).Update(value="{:.6f}".format(self.current_phi_val[i]))
+                self.view.set("vol_CH" + str(i), self.current_vol[i])
+                self.view.set("phi_val_CH" + str(i), self.current_phi_val[i])
                 
                 self.is_ch_updated[i] = True
         
         
-        self.current_output_param[0] = self.current_phi_val[0] / self.specimen_parameter[2] * 1000
-        self.current_output_param[1] = (self.specimen_parameter[0] - self.current_phi_val[1]) / self.specimen_parameter[0] * 100
-        self.current_output_param[2] = (self.current_phi_val[2] - self.current_phi_val[3] * self.specimen_parameter[5] / 1000) / 9.81 * 1000 / self.specimen_parameter[6] / 1000
-        self.current_output_param[3] = self.current_phi_val[3] * self.specimen_parameter[5] / 1000 / 9.81 / 0.998223
-        self.current_output_param[4] = (self.current_output_param[2] - self.current_output_param[3]) / self.current_output_param[3] * 100
+        # phi_val and output_param are computed by control loop
+        for i in range(5):
+            self.view.set("current_output_param_" + str(i), self.current_output_param[i])
+        self.view.set("current_output_param_5", self.controller.current_output_vol * 5 / 65536)
         
-        self.window.Element("current_output_param_0").Update(value="{:.6f}".format(self.current_output_param[0]))
-        self.window.Element("current_output_param_1").Update(value="{:.6f}".format(self.current_output_param[1]))
-        self.window.Element("current_output_param_2").Update(value="{:.6f}".format(self.current_output_param[2]))
-        self.window.Element("current_output_param_3").Update(value="{:.6f}".format(self.current_output_param[3]))
-        self.window.Element("current_output_param_4").Update(value="{:.6f}".format(self.current_output_param[4]))
-        self.window.Element("current_output_param_5").Update(value="{:.6f}".format(self.current_output_vol * 5 / 65536))
+        # current step finished in control loop
+        if self.controller.current_control_option != self.displayed_control_option:
+            self.displayed_control_option = self.controller.current_control_option
+            self.view.element("control_option_" + str(self.displayed_control_option)).Update(value=True)
         
     
     
+    def _update_plot(self):
+        # redraw cost depends on plot width only (see history.py)
+        time_range = self.history.time_range()
+        if time_range is None:
+            return
+        
+        # σ_a - ɛ_a from representative samples
+        t, values = self.history.sample(2 * self.plot_size[0])
+        self._draw_series("plot_stress_strain", values[:, 1], values[:, 0], "ɛ_a (%)", "σ_a (kPa)")
+        
+        # ɛ_a - time since start of current control step (min / max envelope per pixel column)
+        origin = min(self.controller.start_time_cur_step, time_range[1])
+        if origin < time_range[0]:
+            origin = time_range[0]
+        end = time_range[1] - origin
+        if end <= 0:
+            return
+        if self.is_plot_log_time:
+            edges = np.logspace(np.log10(min(self.vol_out_interval, end / 2)), np.log10(end), self.plot_size[0] + 1)
+        else:
+            edges = np.linspace(0, end, self.plot_size[0] + 1)
+        min_value, max_value = self.history.envelope(1, edges + origin)
+        x, y = envelope_polyline(np.log10(edges) if self.is_plot_log_time else edges, min_value, max_value)
+        self._draw_series("plot_time_history", x, y, "log t (s)" if self.is_plot_log_time else "t (s)", "ɛ_a (%)", 
+                          is_y_inverted=True)
+    
+    def _draw_series(self, key, x, y, x_label, y_label, is_y_inverted=False):
+        graph = self.view.element(key)
+        graph.erase()
+        if len(x) < 2:
+            return
+        
+        # data range to pixels with margin for labels
+        margin = 20
+        x_min, x_max = np.min(x), np.max(x)
+        y_min, y_max = np.min(y), np.max(y)
+        x_pixel = margin + (x - x_min) / max(x_max - x_min, 1e-12) * (self.plot_size[0] - 2 * margin)
+        y_pixel = margin + (y - y_min) / max(y_max - y_min, 1e-12) * (self.plot_size[1] - 2 * margin)
+        if is_y_inverted:
+            y_pixel = self.plot_size[1] - y_pixel
+        
+        graph.draw_lines(list(zip(x_pixel.tolist(), y_pixel.tolist())), color="blue")
+        graph.draw_text("{} {:.4g} - {:.4g}".format(x_label, x_min, x_max), (self.plot_size[0] / 2, margin / 2), font="Any 8")
+        graph.draw_text("{} {:.4g} - {:.4g}".format(y_label, y_min, y_max), (margin, self.plot_size[1] - margin / 2), 
+                        font="Any 8", text_location=sg.TEXT_LOCATION_LEFT)
+    
     def _save_data(self):
-        with open(self.save_dir, "a", newline="") as f:
-            writer = csv.writer(f)
-            data = [time.time() - self.start_time] + list(self.current_vol) + list(self.current_phi_val) + list(self.current_output_param)
-            writer.writerow(data)
+        # number of derived records written
+        record = (time.monotonic_ns(), 
+                  time.time() - self.start_time, 
+                  list(self.current_vol), 
+                  list(self.current_phi_val), 
+                  list(self.current_output_param))
+        if self.recorder is None:
+            self.logger.log("derived", record)
+            return 1
+        records = self.recorder.update(record[1], record[3], record[4][0], record)
+        if records:
+            self.logger.log("derived", records)
+        return len(records)
+    
+    def _close_logger(self):
+        # last offered record closes the curve of adaptive recording
+        if self.recorder is not None:
+            records = self.recorder.flush()
+            if records:
+                self.logger.log("derived", records)
+            self.recorder.print_statistics()
+        self.logger.close()
+        self.logger = None
     
     
     def _import_event(self, event, values):    
@@ -353,7 +485,8 @@ class Window():
             self.intercept[ch_num] -= self.current_phi_val[ch_num]
             
             element_key_intercept = "intercept_change_CH" + str(ch_num)
-            self.window.Element(element_key_intercept).Update(value="{:.5f}".format(self.intercept[ch_num]))
+            self.view.invalidate(element_key_intercept)
+            self.view.set(element_key_intercept, self.intercept[ch_num], "{:.5f}")
             
             self.window.Element(event).Update(disabled=False)
         
@@ -371,46 +504,52 @@ class Window():
                 self.save_dir = values[event]
                 self.window.Element("start_saving").Update(disabled=True)
                 self.window.Element("stop_saving").Update(disabled=False)
-                self.is_saving_allowed = True
                 self.start_time = time.time()
-                with open(self.save_dir, "w", newline="") as f:
-                    writer = csv.writer(f)
-                    writer.writerow(["Time(s)", 
-                                     "CH0_Vol(V)", 
-                                     "CH1_Vol(V)",
-                                     "CH2_Vol(V)", 
-                                     "CH3_Vol(V)",  
-                                     "CH0_Load_Cell_(Odo)", 
-                                     "CH1_Displacement_Gauge", 
-                                     "CH2_Load_Cell_(Tank)", 
-                                     "CH3_Hydraulic_Pressure",
-                                     "sigma_a(kPa)",
-                                     "epsilon_a(%)",
-                                     "Discharged Volume(mm3)",
-                                     "Discharged Water(mm3)",
-                                     "Volume Percentage(%)"])
+                if self.rig["adaptive_save"] is not None:
+                    self.recorder = AdaptiveRecorder(**self.rig["adaptive_save"])
+                header_info = {"ch_name": self.ch_name,
+                               "output_param_name": self.output_param_name,
+                               "slope": list(self.slope),
+                               "intercept": list(self.intercept),
+                               "calibration": None if self.calibration is None else self.calibration.version(),
+                               "calibration_dir": self.rig["calibration_dir"],
+                               "pin_DT": list(self.rig["pin_DT"]),
+                               "channel_map": rig_channel_map(self.rig),
+                               "adaptive_save": None if self.recorder is None else self.recorder.setting(),
+                               "specimen_parameter": list(self.specimen_parameter),
+                               "filter_setting": list(self.filter_setting),
+                               "derived_expression": [list(x) for x in self.derived_engine.expression],
+                               "start_time": self.start_time}
+                self.logger = DataLogger(self.save_dir, 
+                                         {"raw": SAMPLE_DTYPE, "derived": self.derived_dtype,
+                                          "derived_full": self.derived_engine.dtype},
+                                         header_info=header_info,
+                                         flush_interval=self.flush_interval,
+                                         fsync_interval=self.fsync_interval)
+                self.metrics_exporter.summary_path = self.save_dir + ".metrics.json"
+                self.is_saving_allowed = True
         
         elif "stop_saving" in event:
             self.is_saving_allowed = False
+            self._close_logger()
             self.window.Element("start_saving").Update(disabled=False)
             self.window.Element("stop_saving").Update(disabled=True)
         
         
         elif "start_control" in event:
-            self.is_controling = True
+            self.controller.start()
             self.window.Element("stop_control").Update(disabled=False)
             self.window.Element("start_control").Update(disabled=True)
-            self.start_time_cur_step = time.time()
         
         
         elif "stop_control" in event:
-            self.is_controling = False
+            self.controller.stop()
             self.window.Element("start_control").Update(disabled=False)
             self.window.Element("stop_control").Update(disabled=True)
         
         elif "control_option" in event:
-            self.current_control_option = int(event[-1])
-            self.start_time_cur_step = time.time()
+            self.controller.set_control_option(int(event[-1]))
+            self.displayed_control_option = self.controller.current_control_option
         
         elif "control_param" in event:
             row_index = int(event[-3])
@@ -420,7 +559,7 @@ class Window():
             except ValueError as e:
                 print(e)
             else:
-                self.control_param[row_index, col_index] = float(values[event])
+                self.controller.control_param[row_index, col_index] = float(values[event])
     
         elif "specimen_parameter" in event:
             try:
@@ -429,107 +568,36 @@ class Window():
                 print(e)
             else:
                 param_id = int(event[-1])
-                self.specimen_parameter[param_id] = float(values[event])
-                
-                temp_specimen_area = self.specimen_parameter[1] ** 2 * math.pi / 4
-                temp_specimen_volume = temp_specimen_area * self.specimen_parameter[0]
-                self.window.Element("specimen_parameter_2").update(value=temp_specimen_area)
-                self.window.Element("specimen_parameter_3").update(value=temp_specimen_volume)
+                # area, volume and tank area are stored too (shared with control loop), in one assignment
+                specimen_parameter = list(self.specimen_parameter)
+                specimen_parameter[param_id] = float(values[event])
+                self.specimen_parameter[:] = compute_specimen_parameter(*[specimen_parameter[i] for i in (0, 1, 4, 6)])
                 
-                temp_tank_area = self.specimen_parameter[4] ** 2 * math.pi / 4
-                self.window.Element("specimen_parameter_5").update(value=temp_tank_area)
+                self.window.Element("specimen_parameter_2").update(value=self.specimen_parameter[2])
+                self.window.Element("specimen_parameter_3").update(value=self.specimen_parameter[3])
+                self.window.Element("specimen_parameter_5").update(value=self.specimen_parameter[5])
+        
+        elif "plot_log_time" in event:
+            self.is_plot_log_time = values[event]
+            self._update_plot()
         
         elif "current_output_param_5" in event:
+            self.view.invalidate(event)
             try:
                 float(values[event])
             except ValueError as e:
                 print(e)
             else:
-                temp = float(values[event]) / 5
-                print(temp)
-                
-                if temp > 1:
-                    temp = 1
-                elif temp < 0:
-                    temp = 0
-                
-                self.current_output_vol = int(temp * 65536)
-        
-
-    def _control_adc_output(self):
-        
-        ellapsed_time_cur_step = time.time() - self.start_time_cur_step
-        
-        if self.current_control_option == 0:
-            pass
+                self.controller.set_output_vol(float(values[event]))
         
-        # Creep
-        elif self.current_control_option == 1:
-            temp_control_param = self.control_param[:, 1]
-            
-            if ellapsed_time_cur_step > temp_control_param[1]:
-                self.current_control_option = 0
-                self.window.Element("control_option_0").Update(value=True)
-            else:
-                # the designated threshold value is σ
-                if temp_control_param[0] == 0.:
-                    temp_offset_stress = self.current_output_param[0] - temp_control_param[2]
-                    
-                    if abs(temp_offset_stress) > temp_control_param[4]:
-                        self.current_output_vol -= int(sign_with_abs(temp_offset_stress) * temp_control_param[5] * self.vol_out_interval / 1000 * self.specimen_parameter[2] / self.adc_amp_factor / 5 * 65536)
-
-                    elif abs(temp_offset_stress) > temp_control_param[3]:
-                        self.current_output_vol -= int(sign_with_abs(temp_offset_stress) * temp_control_param[5] * self.vol_out_interval * (abs(temp_offset_stress) - temp_control_param[3]) / (temp_control_param[4] - temp_control_param[3]) / 1000 * self.specimen_parameter[2] / self.adc_amp_factor / 5 * 65536)
-                
-                # the designated threshold value is ɛ
-                else:
-                    temp_offset_strain = self.current_output_param[1] - temp_control_param[2]
-                    temp_offset_stress = temp_offset_strain / 100 * self.base_elastic_modulus
-                    
-                    if abs(temp_offset_stress) > temp_control_param[4]:
-                        pass
-                    elif abs(temp_offset_stress) > temp_control_param[3]:
-                        pass
-                
-
-                
-        
-        # Monotic Loading
-        elif self.current_control_option == 2:
-            temp_control_param = self.control_param[:, 2]
-            temp_offset_stress = self.current_output_param[0] - temp_control_param[1]
-            temp_offset_strain = self.current_output_param[1] - temp_control_param[2]
-            
-            if (temp_offset_stress > temp_control_param[4]) or (temp_offset_strain > temp_control_param[5]):
-                self.current_control_option = 0
-                self.window.Element("control_option_0").Update(value=True)
-            else:
-                if temp_control_param[0] == 0.:
-                    self.current_output_vol += int(temp_control_param[3] / self.adc_amp_factor / 5 * 65536)
-                else:
-                    self.current_output_vol -= int(temp_control_param[3] / self.adc_amp_factor / 5 * 65536)
-                
-                self.dac.value = self.current_output_vol
-
-        # Cyclic Loading
-        elif self.current_control_option == 3:
-            temp_control_param = self.control_param[:, 3]
-            pass
-    
-        if self.current_output_vol > 65535:
-                self.current_output_vol = 65535
-        elif self.current_output_vol < 0:
-            self.current_output_vol = 0
-        
-        self.dac.value = self.current_output_vol
-
-            
-    
-def sign_with_abs(x):
-    return 0.0 if abs(x) == 0 else x / abs(x)
 
 def main():
-    Window()    
+    # optional rig configuration (JSON, see rig.py) and rig name : python main.py rigs.json [rig1]
+    rig = None
+    if len(sys.argv) > 1:
+        rigs = load_rig_config(sys.argv[1])
+        rig = rigs[0] if len(sys.argv) < 3 else {rig["name"]: rig for rig in rigs}[sys.argv[2]]
+    Window(rig)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
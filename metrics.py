@@ -0,0 +1,235 @@
+################################################################################################
+# Per-stage latency histograms and counters in shared memory
+#
+# Every stage has fixed log2 buckets (upper bound 1.024 us x 2^k, last = +Inf), sum and
+# count, written by one process only (acquisition process or GUI/headless process). Several
+# threads of a process share one Metrics (HX711 loop and ADS1115 reader, control loop and
+# GUI/headless loop), each stage and counter being written by one thread, so observe() and
+# add() need no lock; flush() takes the set of added counters before copying them, so
+# counters added meanwhile by another thread wait for the next flush.
+# observe() counts into a local list and copies the row to shared memory
+# every _FLUSH_COUNT observations, or at once for stages slower than _FLUSH_ELAPSED_NS,
+# keeping overhead well below 1 % of the stage. MetricsExporter serves Prometheus text
+# on localhost and writes a periodic JSON summary.
+#
+# Usage : start = time.monotonic_ns(); ... ; metrics.observe(HX711_READ, time.monotonic_ns() - start)
+################################################################################################
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import shared_memory
+import json
+import os
+import threading
+import time
+import numpy as np
+
+
+# stages
+HX711_READ = 0              # clocking out one sample of all ready modules (acquisition process)
+ADS1115_READ = 1            # one I2C read of conversion register (acquisition process)
+TRANSPORT = 2               # draining ring buffers and filtering (filter_variable)
+CONTROL_TICK = 3            # whole control loop tick
+CONTROL_LAW = 4             # control_adc_output
+UPDATE_VARIABLE = 5         # GUI refresh (_update_variable)
+SAVE_DATA = 6               # derived record to logger (_save_data)
+STAGE_NAME = ("hx711_read", "ads1115_read", "transport", "control_tick", "control_law",
+              "update_variable", "save_data")
+
+# counters (monotonic) and gauges (last value)
+HX711_SAMPLES = 0
+ADS1115_SAMPLES = 1
+TRANSPORT_RECORDS = 2
+RING_OVERRUN = 3
+RING_LOST = 4
+QUEUE_DEPTH = 5
+MISSED_DEADLINE = 6
+SAVED_RECORDS = 7
+HX711_SCK_OVERRUN = 8       # samples rejected by consistency check of HX711 words (multihx711.py)
+HX711_SATURATED = 9
+HX711_OUTLIER = 10
+COUNTER_NAME = ("hx711_samples", "ads1115_samples", "transport_records", "ring_overrun", "ring_lost",
+                "queue_depth", "missed_deadline", "saved_records", "hx711_sck_overrun", "hx711_saturated",
+                "hx711_outlier")
+GAUGE = (QUEUE_DEPTH, RING_OVERRUN, RING_LOST)
+
+NUM_BUCKET = 24
+BUCKET_BOUND = [(1024 << k) * 1e-9 for k in range(NUM_BUCKET - 1)] + [float("inf")]
+_ROW = NUM_BUCKET + 2       # buckets, sum (ns), count
+_FLUSH_COUNT = 32
+_FLUSH_ELAPSED_NS = 200000
+
+
+class Metrics():
+    def __init__(self, name=None, create=True):
+        self.num_stage = len(STAGE_NAME)
+        self.num_counter = len(COUNTER_NAME)
+        self.is_owner = create
+
+        size = (self.num_stage * _ROW + self.num_counter) * 8
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        self.name = self.shm.name
+
+        self.histogram = np.ndarray((self.num_stage, _ROW), dtype=np.int64, buffer=self.shm.buf)
+        self.counter = np.ndarray((self.num_counter,), dtype=np.int64, buffer=self.shm.buf,
+                                  offset=self.num_stage * _ROW * 8)
+        if create:
+            self.histogram[:] = 0
+            self.counter[:] = 0
+        
+        # rows of stages observed by this process, loaded from shared memory on first use
+        self._local = [None] * self.num_stage
+        self._num_unflushed = [0] * self.num_stage
+        self._local_counter = self.counter.tolist()
+        self._counter_added = set()
+
+    def __reduce__(self):
+        # attach to the same block when sent to another process
+        return (Metrics, (self.name, False))
+
+    def observe(self, stage, elapsed_ns):
+        row = self._local[stage]
+        if row is None:
+            row = self._local[stage] = self.histogram[stage].tolist()
+        row[min((elapsed_ns >> 10).bit_length(), NUM_BUCKET - 1)] += 1
+        row[NUM_BUCKET] += elapsed_ns
+        row[NUM_BUCKET + 1] += 1
+        
+        self._num_unflushed[stage] += 1
+        if self._num_unflushed[stage] >= _FLUSH_COUNT or elapsed_ns >= _FLUSH_ELAPSED_NS:
+            self.flush(stage)
+
+    def flush(self, stage=None):
+        for i in (range(self.num_stage) if stage is None else (stage,)):
+            if self._local[i] is not None and self._num_unflushed[i]:
+                self.histogram[i] = self._local[i]
+                self._num_unflushed[i] = 0
+        
+        added, self._counter_added = self._counter_added, set()
+        for i in added:
+            self.counter[i] = self._local_counter[i]
+
+    def add(self, counter, value=1):
+        # flushed with next flush of any stage
+        self._local_counter[counter] += value
+        self._counter_added.add(counter)
+
+    def set(self, counter, value):
+        self.counter[counter] = value
+
+    def quantile(self, stage, q):
+        # upper bound of bucket holding quantile q (s)
+        row = self.histogram[stage]
+        count = row[NUM_BUCKET + 1]
+        if count == 0:
+            return 0.
+        return BUCKET_BOUND[int(np.searchsorted(np.cumsum(row[:NUM_BUCKET]), q * count))]
+
+    def summary(self):
+        histogram = self.histogram.copy()
+        stages = {}
+        for i, name in enumerate(STAGE_NAME):
+            count = int(histogram[i, NUM_BUCKET + 1])
+            stages[name] = {"count": count,
+                            "mean": histogram[i, NUM_BUCKET] * 1e-9 / count if count else 0.,
+                            "p50": self.quantile(i, 0.5),
+                            "p99": self.quantile(i, 0.99),
+                            "max_bucket": BUCKET_BOUND[int(np.flatnonzero(histogram[i, :NUM_BUCKET])[-1])] if count else 0.}
+        return {"time": time.time(),
+                "stages": stages,
+                "counters": {name: int(self.counter[i]) for i, name in enumerate(COUNTER_NAME)}}
+
+    def prometheus_text(self):
+        histogram = self.histogram.copy()
+        lines = ["# TYPE oedometer_stage_latency_seconds histogram"]
+        for i, name in enumerate(STAGE_NAME):
+            cumulative = np.cumsum(histogram[i, :NUM_BUCKET])
+            for bound, count in zip(BUCKET_BOUND, cumulative):
+                lines.append('oedometer_stage_latency_seconds_bucket{{stage="{}",le="{}"}} {}'.format(
+                    name, "+Inf" if bound == float("inf") else "{:.9g}".format(bound), count))
+            lines.append('oedometer_stage_latency_seconds_sum{{stage="{}"}} {:.9f}'.format(name, histogram[i, NUM_BUCKET] * 1e-9))
+            lines.append('oedometer_stage_latency_seconds_count{{stage="{}"}} {}'.format(name, histogram[i, NUM_BUCKET + 1]))
+
+        for i, name in enumerate(COUNTER_NAME):
+            if i in GAUGE:
+                lines.append("# TYPE oedometer_{} gauge".format(name))
+                lines.append("oedometer_{} {}".format(name, self.counter[i]))
+            else:
+                lines.append("# TYPE oedometer_{}_total counter".format(name))
+                lines.append("oedometer_{}_total {}".format(name, self.counter[i]))
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        self.flush()
+        self.shm.close()
+        if self.is_owner:
+            self.shm.unlink()
+
+
+class MetricsExporter():
+    # Prometheus text on http://host:port/metrics and JSON summary file every summary_interval
+    def __init__(self, metrics, port=9108, host="127.0.0.1", summary_path=None, summary_interval=60.):
+        self.metrics = metrics
+        self.port = port
+        self.host = host
+        self.summary_path = summary_path
+        self.summary_interval = summary_interval
+        self.server = None
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._stop_event.clear()
+        if self.port:
+            metrics = self.metrics
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path != "/metrics":
+                        self.send_error(404)
+                        return
+                    body = metrics.prometheus_text().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            try:
+                self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+            except OSError as e:
+                print("metrics endpoint disabled : {}".format(e))
+            else:
+                self._threads.append(threading.Thread(target=self.server.serve_forever, daemon=True))
+
+        self._threads.append(threading.Thread(target=self._summary_loop, daemon=True))
+
+        for thread in self._threads:
+            thread.start()
+
+    def _summary_loop(self):
+        # summary_path may be set later (e.g. when saving starts)
+        while not self._stop_event.wait(self.summary_interval):
+            if self.summary_path is not None:
+                self.write_summary()
+
+    def write_summary(self):
+        # replace atomically, readers never see partial file
+        temp_path = self.summary_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.metrics.summary(), f, indent=1)
+        os.replace(temp_path, self.summary_path)
+
+    def stop(self):
+        self._stop_event.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self.summary_path is not None:
+            self.write_summary()
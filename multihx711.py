@@ -1,21 +1,40 @@
 ################################################################################################
-# Todo 
-# 1. Channel B
-# 2. Consistentcy Check
-# 3. Debug Mode Printing
-# 4.
-
+# Readout of several HX711 modules sharing serial clock (bit banging through GPIO backend)
+#
+# Modules are clocked together and decoded at once (24 bit two's complement words), input
+# and gain of channel B or A gain 64 follow sample_plan, samples failing consistency check
+# (SCK overrun, saturation, outlier) are rejected per module. debug_mode prints raw words.
 ################################################################################################
 
-import RPi.GPIO as GPIO
+import os
 import threading
 import time
 import numpy as np
 
+from metrics import HX711_OUTLIER, HX711_READ, HX711_SAMPLES, HX711_SATURATED, HX711_SCK_OVERRUN
+
+
+# weight of each bit of 24 bit word (MSB first)
+_BIT_WEIGHT = np.left_shift(1, np.arange(23, -1, -1, dtype=np.int64))
+
+# pulses after 24th bit selecting (input, gain) of next conversion
+PULSE_BY_INPUT = {("A", 128): 1, ("B", 32): 2, ("A", 64): 3}
+
+# words of input beyond range (clipped), two's complement
+SATURATED_WORD = (0x7FFFFF, 0x800000)
+
+# reasons of rejected samples (columns of num_rejected)
+REJECT_SCK_OVERRUN = 0
+REJECT_SATURATED = 1
+REJECT_OUTLIER = 2
+
 
 class MultiHX711():
-    def __init__(self, num_mod=3, pin_DT=(5, 16, 17), pin_SCK=6, chA_gain=128, existing_chB=False, 
-                 input_vol=5, output_vol_correction=True, debug_mode=False):
+    def __init__(self, num_mod=3, pin_DT=(5, 16, 17), pin_SCK=6, chA_gain=128,
+                 input_vol=5, output_vol_correction=True, debug_mode=False, backend=None,
+                 acquisition_mode="poll", poll_interval=0., max_skew=0.005, stale_timeout=1., metrics=None,
+                 sample_plan=None, conversion_rate=80, settling_periods=4, num_settling_discard=1,
+                 max_sck_high=60e-6, outlier_factor=10., outlier_floor=16384, max_consecutive_reject=2):
 
         # check consistency
         # Todo : Update
@@ -25,20 +44,127 @@ class MultiHX711():
             raise ValueError("Module's number (num_mod) should be integer")
         elif not isinstance(pin_DT, (int, tuple)):
             raise ValueError("Module's number (num_mod) should be integer")
+        elif not isinstance(pin_SCK, int) and len(pin_SCK) != num_mod:
+            raise ValueError("pin_SCK should be one pin or one pin per module (length of pin_DT)")
+        elif acquisition_mode not in ("poll", "edge"):
+            raise ValueError("Acquisition mode (acquisition_mode) should be 'poll' or 'edge'")
+        elif sample_plan is not None and any(len(p) != 3 for p in sample_plan):
+            raise ValueError("Entry of sample_plan should be (input, gain, rate Hz)")
+        elif sample_plan is not None and any((p[0], p[1]) not in PULSE_BY_INPUT for p in sample_plan):
+            raise ValueError("Input of sample_plan should be ('A', 128), ('B', 32) or ('A', 64)")
+        elif sample_plan is not None and any(not p[2] > 0 for p in sample_plan):
+            raise ValueError("Rate of sample_plan should be positive")
 
         # define variables
         self.num_mod = num_mod
         self.pin_DT = pin_DT
         self.pin_SCK = pin_SCK
-        self.existing_chB = existing_chB
         self.chA_gain = chA_gain
         self.input_vol = input_vol
         self.output_vol_correction = output_vol_correction
-        self.prev_raw_value = [0.,] * self.num_mod
-        self.prev_vol_value = [0.,] * self.num_mod
-        self.binary_max_value = "111111111111111111111111"
+        self.prev_raw_value = np.zeros(self.num_mod, dtype=np.int64)
+        self.prev_vol_value = np.zeros(self.num_mod, dtype=np.float64)
+        self.binary_max_value = 0xFFFFFF
         self.debug_mode = debug_mode
         self.is_ch_updated = [True] * self.num_mod
+        self.acquisition_mode = acquisition_mode
+        self.poll_interval = poll_interval
+        self.metrics = metrics
+
+        # modules sharing one SCK form a clock group, groups are clocked independently
+        sck_by_mod = (pin_SCK,) * num_mod if isinstance(pin_SCK, int) else tuple(pin_SCK)
+        self.pin_SCK_group = tuple(dict.fromkeys(sck_by_mod))
+        self.group_mod = [np.flatnonzero([pin == sck for pin in sck_by_mod]) for sck in self.pin_SCK_group]
+        self.num_group = len(self.pin_SCK_group)
+        self.mod_group = np.zeros(num_mod, dtype=np.int64)
+        for g, module in enumerate(self.group_mod):
+            self.mod_group[module] = g
+
+        # precomputed conversion factor from signed 24 bit word to mV
+        self.vol_factor = (self.input_vol / self.chA_gain) * 1000 / self.binary_max_value
+        
+        # number of trailing pulses selecting the gain of next conversion
+        if self.chA_gain == 128:
+            self.num_pulse = 1
+        elif self.chA_gain == 64:
+            self.num_pulse = 3
+        else:
+            self.num_pulse = 1
+        
+        # tag of last sample of each module (input 0 : A, 1 : B)
+        self.ch_input = np.zeros(num_mod, dtype=np.int8)
+        self.ch_gain = np.full(num_mod, self.chA_gain, dtype=np.int16)
+        
+        # interleaving of inputs : sample_plan is ((input, gain, rate (Hz)), ...). Modules of one
+        # clock group get the same trailing pulses, so every group runs bursts of each input in
+        # turn. A switch costs the settling conversions and num_settling_discard samples.
+        self.sample_plan = None if sample_plan is None or len(sample_plan) < 2 else [tuple(p) for p in sample_plan]
+        if self.sample_plan is not None:
+            self.num_settling_discard = num_settling_discard
+            self.burst = plan_bursts(self.sample_plan, conversion_rate, settling_periods - 1 + num_settling_discard)
+            self.plan_pulse = [PULSE_BY_INPUT[(p[0], p[1])] for p in self.sample_plan]
+            self.plan_vol_factor = [(self.input_vol / p[1]) * 1000 / self.binary_max_value for p in self.sample_plan]
+            
+            # modules start with channel A gain 128 after power-up (-1 : not in plan, discarded)
+            start = -1
+            for k, p in enumerate(self.sample_plan):
+                if (p[0], p[1]) == ("A", 128):
+                    start = k
+                    break
+            self.plan_start = start
+            self.group_config = [start] * self.num_group
+            self.group_burst_left = [self.burst[start] if start >= 0 else 0] * self.num_group
+            self.group_discard_left = [0] * self.num_group
+            self.group_pulse = [self.plan_pulse[start] if start >= 0 else 1] * self.num_group
+            self.ch_config = np.full(num_mod, start, dtype=np.int64)
+            self.ch_discard_left = np.zeros(num_mod, dtype=np.int64)
+            self.ch_valid_mask = np.zeros(num_mod, dtype=bool)
+        
+        # consistency check of words : a read whose SCK stays high beyond max_sck_high (s) may
+        # power chips down mid-word (HX711 : 60 us), saturated words are dropped, and a sample
+        # is an outlier when it jumps from the last accepted one of its module and input by more
+        # than outlier_factor x typical step (running mean of |step|) + outlier_floor (counts).
+        # A jump confirmed by the next sample, or kept beyond max_consecutive_reject samples,
+        # is accepted as new level (step of input). None disables overrun / outlier test.
+        self.max_sck_high_ns = None if max_sck_high is None else int(max_sck_high * 1e9)
+        self.sck_high_ns = 0
+        self.outlier_factor = outlier_factor
+        self.outlier_floor = outlier_floor
+        self.max_consecutive_reject = max_consecutive_reject
+        num_config = 1 if self.sample_plan is None else len(self.sample_plan)
+        self.ch_sample_config = np.zeros(num_mod, dtype=np.int64)
+        self._last_raw = [[None] * num_config for i in range(num_mod)]
+        self._step_scale = [[0.] * num_config for i in range(num_mod)]
+        self._rejected_raw = [[None] * num_config for i in range(num_mod)]
+        self._num_reject_run = [0] * num_mod
+        self._is_after_overrun = [False] * num_mod
+        self.ch_accepted_mask = np.zeros(num_mod, dtype=bool)
+        
+        # rejected samples per module and reason (REJECT_*), total per module for records
+        self.num_rejected = np.zeros((num_mod, 3), dtype=np.int64)
+        self.ch_num_rejected = np.zeros(num_mod, dtype=np.int64)
+        
+        # buffer for raw words accumulated bit by bit
+        self._word_buffer = [0] * self.num_mod
+        self._raw_buffer = np.zeros(self.num_mod, dtype=np.int64)
+        self._vol_buffer = np.zeros(self.num_mod, dtype=np.float64)
+        
+        # per module state (time.monotonic_ns) for independent readiness
+        self.max_skew = max_skew                       # s
+        self.stale_timeout = stale_timeout             # s
+        self.ch_seq = np.zeros(self.num_mod, dtype=np.int64)
+        self.ch_timestamp_ns = np.full(self.num_mod, time.monotonic_ns(), dtype=np.int64)
+        self.ch_ready_ns = np.zeros(self.num_mod, dtype=np.int64)
+        self.ch_interval_ns = np.zeros(self.num_mod, dtype=np.int64)
+        self.ch_ready_mask = np.zeros(self.num_mod, dtype=bool)
+        self.ch_updated_mask = np.zeros(self.num_mod, dtype=bool)
+        self.ch_is_stale = np.zeros(self.num_mod, dtype=bool)
+
+        # GPIO backend (RPi.GPIO by default, simulated bank for off-Pi use)
+        if backend is None:
+            from gpio_backend import RPiGPIOBackend
+            backend = RPiGPIOBackend()
+        self.gpio = backend
 
         # conduct initialization of module
         self._GPIO_initialize()
@@ -47,27 +173,51 @@ class MultiHX711():
     def _GPIO_initialize(self):
 
         # set specification method of pins
-        GPIO.setmode(GPIO.BCM)
+        self.gpio.setmode()
 
         # setup voltage reading channel (input to raspberry pi)
         for i in range(self.num_mod):
-            GPIO.setup(self.pin_DT[i], GPIO.IN)
+            self.gpio.setup_input(self.pin_DT[i])
         
         # setup serial clock  channel (output from raspberry pi)
-        # Todo : Support multi serial clock
-        GPIO.setup(self.pin_SCK, GPIO.OUT)
+        for pin in self.pin_SCK_group:
+            self.gpio.setup_output(pin)
 
         # something to be needed
         self.readLock = threading.Lock()
         self.power_down()
         self.power_up()
+        
+        # wake up waiting reader on falling edge of DT (conversion ready)
+        self._ready_event = threading.Event()
+        self._edge_pid = None
+
+
+    def _enable_edge_detection(self):
+        
+        # register in the process that waits (event threads do not survive fork)
+        if self._edge_pid is not None:
+            self._disable_edge_detection()
+        for i in range(self.num_mod):
+            self.gpio.add_falling_callback(self.pin_DT[i], self._on_DT_falling)
+        self._edge_pid = os.getpid()
+
+
+    def _disable_edge_detection(self):
+        for i in range(self.num_mod):
+            self.gpio.remove_callback(self.pin_DT[i])
+        self._edge_pid = None
+
+
+    def _on_DT_falling(self, pin):
+        self._ready_event.set()
 
 
     def power_down(self):
         
         self.readLock.acquire()
-        GPIO.output(self.pin_SCK, False)
-        GPIO.output(self.pin_SCK, True)
+        self.gpio.output_many(self.pin_SCK_group, False)
+        self.gpio.output_many(self.pin_SCK_group, True)
         time.sleep(0.0001)
         self.readLock.release()
     
@@ -75,19 +225,219 @@ class MultiHX711():
     def power_up(self):
         
         self.readLock.acquire()
-        GPIO.output(self.pin_SCK, False)
+        self.gpio.output_many(self.pin_SCK_group, False)
         time.sleep(0.0001)
         self.readLock.release()
 
         self.read_value()
+        
+        # word read right after power-up is no conversion, consistency check starts afresh
+        for j in range(self.num_mod):
+            self._last_raw[j] = [None] * len(self._last_raw[j])
+            self._rejected_raw[j] = [None] * len(self._rejected_raw[j])
+            self._num_reject_run[j] = 0
+    
+    
+    def _clock_out(self, group=None):
+        
+        # clock 24 bits out of modules of given clock groups (all by default) and decode them
+        # into self._raw_buffer / self._vol_buffer. Each edge is driven on the SCKs of all
+        # groups before DT are read, so bus time does not grow with the number of groups.
+        word = self._word_buffer
+        gpio_input = self.gpio.input
+        
+        if group is None or len(group) == self.num_group:
+            group = range(self.num_group)
+            pin_SCK = self.pin_SCK_group
+            module = range(self.num_mod)
+        else:
+            pin_SCK = [self.pin_SCK_group[g] for g in group]
+            module = np.sort(np.concatenate([self.group_mod[g] for g in group])).tolist()
+        pin_DT = [self.pin_DT[j] for j in module]
+        
+        # one SCK is written directly, several at once (RPi.GPIO accepts list of channels)
+        gpio_output_many = self.gpio.output_many
+        if len(pin_SCK) == 1:
+            pin_SCK = pin_SCK[0]
+            gpio_output = self.gpio.output
+        else:
+            gpio_output = gpio_output_many
+        
+        for j in module:
+            word[j] = 0
+        
+        # longest SCK high time (bounded by the clock reads around each pulse)
+        clock = time.monotonic_ns
+        sck_high_ns = 0
+        
+        for i in range(24):
+            start = clock()
+            gpio_output(pin_SCK, True)
+            gpio_output(pin_SCK, False)
+            high_ns = clock() - start
+            if high_ns > sck_high_ns:
+                sck_high_ns = high_ns
+            
+            for j, pin in zip(module, pin_DT):
+                word[j] = (word[j] << 1) | gpio_input(pin)
+
+        if self.sample_plan is None:
+            for i in range(self.num_pulse):
+                start = clock()
+                gpio_output(pin_SCK, True)
+                gpio_output(pin_SCK, False)
+                high_ns = clock() - start
+                if high_ns > sck_high_ns:
+                    sck_high_ns = high_ns
+        else:
+            # groups may select different inputs, pulse i goes to groups needing more than i
+            self._advance_plan(group)
+            for i in range(max(self.plan_pulse)):
+                pulsed_SCK = [self.pin_SCK_group[g] for g in group if self.group_pulse[g] > i]
+                if pulsed_SCK:
+                    start = clock()
+                    gpio_output_many(pulsed_SCK, True)
+                    gpio_output_many(pulsed_SCK, False)
+                    high_ns = clock() - start
+                    if high_ns > sck_high_ns:
+                        sck_high_ns = high_ns
+        self.sck_high_ns = sck_high_ns
+
+        if self.debug_mode:
+            print(["{:024b}".format(w) for w in word])
+        
+        decode_words(word, self._raw_buffer)
+        np.multiply(self._raw_buffer, self.vol_factor, out=self._vol_buffer)
+    
+    
+    def _advance_plan(self, group):
+        
+        # count sample being read in burst of each group and pick input of next conversion
+        for g in group:
+            if self.group_discard_left[g] > 0:
+                self.group_discard_left[g] -= 1
+            else:
+                self.group_burst_left[g] -= 1
+            
+            if self.group_burst_left[g] <= 0:
+                k = (self.group_config[g] + 1) % len(self.sample_plan)
+                self.group_config[g] = k
+                self.group_burst_left[g] = self.burst[k]
+                self.group_discard_left[g] = self.num_settling_discard
+                self.group_pulse[g] = self.plan_pulse[k]
+    
+    
+    def _tag_samples(self, read_mask):
+        
+        # tag samples just read with input / gain of their conversion and keep valid ones in
+        # self.ch_valid_mask (samples of unknown input or settling after a switch are dropped)
+        valid_mask = self.ch_valid_mask
+        valid_mask[:] = False
+        
+        for j in np.flatnonzero(read_mask):
+            k = self.ch_config[j]
+            self.ch_sample_config[j] = k
+            if k < 0 or self.ch_discard_left[j] > 0:
+                self.ch_discard_left[j] = max(self.ch_discard_left[j] - 1, 0)
+            else:
+                channel, gain = self.sample_plan[k][:2]
+                self.ch_input[j] = 0 if channel == "A" else 1
+                self.ch_gain[j] = gain
+                self._vol_buffer[j] = self._raw_buffer[j] * self.plan_vol_factor[k]
+                valid_mask[j] = True
+            
+            # next conversion of module follows the pulses of its group
+            next_k = self.group_config[self.mod_group[j]]
+            if next_k != k:
+                self.ch_config[j] = next_k
+                self.ch_discard_left[j] = self.num_settling_discard
+        
+        return valid_mask
+    
+    
+    def _check_samples(self, read_mask, valid_mask):
+        
+        # reject suspect words among valid samples of modules just read (read_mask), returns
+        # mask of accepted samples in self.ch_accepted_mask
+        accepted_mask = self.ch_accepted_mask
+        np.copyto(accepted_mask, valid_mask)
+        module = np.flatnonzero(read_mask).tolist()
+        
+        if self.max_sck_high_ns is not None and self.sck_high_ns > self.max_sck_high_ns:
+            # chips may have been reset mid-read : words are lost, next conversion is channel A
+            # gain 128 whatever the trailing pulses, so the next sample is dropped too
+            for j in module:
+                self._is_after_overrun[j] = True
+                if self.sample_plan is not None:
+                    self.ch_config[j] = self.plan_start
+                    self.ch_discard_left[j] = self.num_settling_discard
+            for j in np.flatnonzero(accepted_mask).tolist():
+                self._reject(j, REJECT_SCK_OVERRUN, HX711_SCK_OVERRUN)
+            return accepted_mask
+        
+        # plain lists, cheaper than numpy scalars for a few modules
+        word = self._word_buffer
+        is_valid = valid_mask.tolist()
+        sample_config = self.ch_sample_config.tolist()
+        outlier_factor = self.outlier_factor
+        
+        for j in module:
+            if self._is_after_overrun[j]:
+                self._is_after_overrun[j] = False
+                if is_valid[j]:
+                    self._reject(j, REJECT_SCK_OVERRUN, HX711_SCK_OVERRUN)
+                continue
+            if not is_valid[j]:
+                continue
+            
+            w = word[j]
+            if w in SATURATED_WORD:
+                self._reject(j, REJECT_SATURATED, HX711_SATURATED)
+                continue
+            
+            if outlier_factor is None:
+                continue
+            k = sample_config[j]
+            raw = w - ((w & 0x800000) << 1)
+            last_raw = self._last_raw[j][k]
+            if last_raw is not None:
+                step = abs(raw - last_raw)
+                limit = outlier_factor * self._step_scale[j][k] + self.outlier_floor
+                if step > limit:
+                    rejected_raw = self._rejected_raw[j][k]
+                    is_confirmed = rejected_raw is not None and abs(raw - rejected_raw) <= limit
+                    if not is_confirmed and self._num_reject_run[j] < self.max_consecutive_reject:
+                        self._rejected_raw[j][k] = raw
+                        self._num_reject_run[j] += 1
+                        self._reject(j, REJECT_OUTLIER, HX711_OUTLIER)
+                        continue
+                else:
+                    self._step_scale[j][k] += (step - self._step_scale[j][k]) * 0.0625
+            self._last_raw[j][k] = raw
+            self._rejected_raw[j][k] = None
+            self._num_reject_run[j] = 0
+        
+        return accepted_mask
+    
+    
+    def _reject(self, j, reason, counter):
+        self.ch_accepted_mask[j] = False
+        self.num_rejected[j, reason] += 1
+        self.ch_num_rejected[j] += 1
+        if self.metrics is not None:
+            self.metrics.add(counter)
     
     
     def read_value(self):
         
+        # is_updated : some module has a new sample, ch_updated_mask tells which ones (modules
+        # rejected by interleaving or consistency check keep their last good value)
+        self.ch_updated_mask[:] = False
+        
         # confirm updating
         for i in range(self.num_mod):
             if not self.is_ch_updated[i]:
-                self.is_ch_updated[i] = (GPIO.input(self.pin_DT[i]) == 0)
+                self.is_ch_updated[i] = (self.gpio.input(self.pin_DT[i]) == 0)
 
         # read value
         is_updated = True
@@ -97,36 +447,27 @@ class MultiHX711():
         if is_updated:
             self.readLock.acquire()
             
-            temp_binary_value = [""] * self.num_mod
-            
-            for i in range(24):
-                GPIO.output(self.pin_SCK, True)
-                GPIO.output(self.pin_SCK, False)
-                
-                for j in range(self.num_mod):
-                    temp_binary_value[j] += str(GPIO.input(self.pin_DT[j]))
-
-            if self.debug_mode:
-                print(temp_binary_value)
-            
-            for i in range(self.num_mod):
-                self.prev_raw_value[i] = int(temp_binary_value[i][1:], 2) - int(int(temp_binary_value[i][0]) << (len(temp_binary_value[i]) - 1))
-                self.prev_vol_value[i] = self.prev_raw_value[i] / int(self.binary_max_value, 2) * (self.input_vol / self.chA_gain) * 1000
-
-            if self.chA_gain == 128:
-                num_pulse = 1
-            elif self.chA_gain == 64:
-                num_pulse = 3
-            else:
-                num_pulse = 1
-
-            for i in range(num_pulse):
-                GPIO.output(self.pin_SCK, True)
-                GPIO.output(self.pin_SCK, False)
+            # sample time is the start of clocking, closest to the end of conversion
+            now = time.monotonic_ns()
+            self._clock_out()
+            if self.metrics is not None:
+                self.metrics.observe(HX711_READ, time.monotonic_ns() - now)
+                self.metrics.add(HX711_SAMPLES, self.num_mod)
             
             for i in range(self.num_mod):
                 self.is_ch_updated[i] = False
             
+            read_mask = np.ones(self.num_mod, dtype=bool)
+            valid_mask = read_mask if self.sample_plan is None else self._tag_samples(read_mask)
+            accepted_mask = self.ch_updated_mask
+            accepted_mask[:] = self._check_samples(read_mask, valid_mask)
+            is_updated = bool(accepted_mask.any())
+            
+            np.copyto(self.prev_raw_value, self._raw_buffer, where=accepted_mask)
+            np.copyto(self.prev_vol_value, self._vol_buffer, where=accepted_mask)
+            self.ch_timestamp_ns[accepted_mask] = now
+            self.ch_seq[accepted_mask] += 1
+            
             self.readLock.release()
 
         if self.output_vol_correction:
@@ -134,9 +475,166 @@ class MultiHX711():
         else:
             return (is_updated, self.prev_raw_value)
     
+    
+    def read_available(self):
+        
+        # read modules independently : each sample is taken as soon as its module is ready
+        # and a stalled module only delays the others by max_skew
+        now = time.monotonic_ns()
+        ready_mask = self.ch_ready_mask
+        
+        for i in range(self.num_mod):
+            if not ready_mask[i] and self.gpio.input(self.pin_DT[i]) == 0:
+                ready_mask[i] = True
+                if self.ch_ready_ns[i] > 0:
+                    interval = now - self.ch_ready_ns[i]
+                    if self.ch_interval_ns[i] == 0:
+                        self.ch_interval_ns[i] = interval
+                    else:
+                        self.ch_interval_ns[i] += (interval - self.ch_interval_ns[i]) // 8
+                self.ch_ready_ns[i] = now
+        
+        self.ch_updated_mask[:] = False
+        
+        # clock groups are scheduled independently and clocked out together
+        if ready_mask.any():
+            group = [g for g in range(self.num_group)
+                     if ready_mask[self.group_mod[g]].any() and self._is_clock_scheduled(now, self.group_mod[g])]
+        else:
+            group = []
+        
+        if group:
+            self.readLock.acquire()
+            
+            read_mask = self.ch_updated_mask
+            for g in group:
+                read_mask[self.group_mod[g]] = ready_mask[self.group_mod[g]]
+            
+            now = time.monotonic_ns()
+            self._clock_out(group)
+            if self.metrics is not None:
+                self.metrics.observe(HX711_READ, time.monotonic_ns() - now)
+                self.metrics.add(HX711_SAMPLES, int(read_mask.sum()))
+            ready_mask[read_mask] = False
+            valid_mask = read_mask if self.sample_plan is None else self._tag_samples(read_mask)
+            read_mask &= self._check_samples(read_mask, valid_mask)
+            np.copyto(self.prev_raw_value, self._raw_buffer, where=read_mask)
+            np.copyto(self.prev_vol_value, self._vol_buffer, where=read_mask)
+            self.ch_timestamp_ns[read_mask] = now
+            self.ch_seq[read_mask] += 1
+            
+            self.readLock.release()
+        
+        # channels without sample for stale_timeout are reported, never waited for
+        np.greater(now - self.ch_timestamp_ns, self.stale_timeout * 1e9, out=self.ch_is_stale)
+        
+        if self.output_vol_correction:
+            return (self.ch_updated_mask, self.prev_vol_value)
+        else:
+            return (self.ch_updated_mask, self.prev_raw_value)
+    
+    
+    def _is_clock_scheduled(self, now, module):
+        
+        # modules of one clock group share SCK, so clocking out ready modules must not catch
+        # others becoming ready in the middle of the 24 bits. Wait for modules expected within
+        # max_skew, but never longer than max_skew after the first module got ready.
+        ready_mask = self.ch_ready_mask
+        if ready_mask[module].all():
+            return True
+        
+        max_skew_ns = self.max_skew * 1e9
+        if now - self.ch_ready_ns[module][ready_mask[module]].min() > max_skew_ns:
+            return True
+        
+        for i in module:
+            if ready_mask[i] or self.ch_interval_ns[i] == 0:
+                continue
+            expected_ns = self.ch_ready_ns[i] + self.ch_interval_ns[i]
+            if abs(expected_ns - now) < max_skew_ns:
+                return False
+        
+        return True
+    
+    
+    def wait_value(self, timeout=None):
+        
+        # block until all modules are read (rejected ones flagged in ch_updated_mask) or timeout (s) passes
+        return self._wait(self.read_value, timeout, lambda is_updated: is_updated)
+    
+    
+    def wait_available(self, timeout=None):
+        
+        # block until at least one module is read or timeout (s) passes
+        return self._wait(self.read_available, timeout, lambda updated_mask: updated_mask.any())
+    
+    
+    def _wait(self, read_func, timeout, is_done):
+        
+        if self.acquisition_mode == "edge" and self._edge_pid != os.getpid():
+            self._enable_edge_detection()
+        
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        
+        while True:
+            # clear before checking pins so that an edge during the check is not lost
+            self._ready_event.clear()
+            
+            is_updated, value = read_func()
+            if is_done(is_updated):
+                return (is_updated, value)
+            
+            if timeout is None:
+                remaining = None
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return (is_updated, value)
+            
+            # ready modules waiting for the others must be revisited within max_skew
+            if self.ch_ready_mask.any():
+                remaining = self.max_skew if remaining is None else min(self.max_skew, remaining)
+            
+            if self.acquisition_mode == "edge":
+                self._ready_event.wait(remaining)
+            elif self.poll_interval > 0:
+                time.sleep(self.poll_interval if remaining is None else min(self.poll_interval, remaining))
+
 
     def cleanup(self):
-        GPIO.cleanup()
+        if self._edge_pid is not None:
+            self._disable_edge_detection()
+        self.gpio.cleanup()
+
+
+def plan_bursts(sample_plan, conversion_rate, dead_periods):
+    
+    # shortest cycle of bursts meeting the rate of every input when each switch loses
+    # dead_periods conversions : cycle (s) = num_input * dead_periods / (conversion_rate - sum(rate))
+    rate = [p[2] for p in sample_plan]
+    spare_rate = conversion_rate - sum(rate)
+    if spare_rate <= 0:
+        raise ValueError("Sum of rates of sample_plan should be below conversion rate ({} Hz) with switching".format(conversion_rate))
+    
+    cycle = len(rate) * dead_periods / spare_rate
+    return [max(1, int(np.ceil(r * cycle))) for r in rate]
+
+
+def decode_words(word, out=None):
+    # convert 24 bit two's complement words to signed integers
+    word = np.asarray(word, dtype=np.int64)
+    if out is None:
+        out = np.empty(word.shape, dtype=np.int64)
+    np.subtract(word, (word & 0x800000) << 1, out=out)
+    return out
+
+
+def decode_bit_matrix(bits, out=None):
+    # decode a captured (24, num_mod) bit matrix (MSB first) for all modules at once
+    word = _BIT_WEIGHT @ np.asarray(bits, dtype=np.int64)
+    return decode_words(word, out)
+
 
 def main():
    hx = MultiHX711(num_mod=1, pin_DT=(5,), debug_mode=False)
@@ -0,0 +1,301 @@
+################################################################################################
+# Closed loop simulation of oedometer for control tuning (faster than real time)
+#
+# Plant : DAC value -> amplifier -> actuator (first order lag) -> load on specimen,
+#         specimen strain = primary consolidation (first order) + secondary compression (log t)
+# Sensor: phi_val -> voltage of HX711 (CH0 - CH2) / ADS1115 (CH3) with noise and quantization,
+#         sampled at conversion rate and filtered like Acquisition
+# Loop  : ControlLoop.tick and LoadingController run unchanged on simulated clock
+#
+# usage : python plant_simulator.py --grid '{"adc_amp_factor": [500, 1000, 2000]}' --workers 4
+################################################################################################
+
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import itertools
+import json
+import math
+import time
+import numpy as np
+
+from acquisition import SimulatedDAC
+from control import ControlLoop, LoadingController
+from derived import compute_specimen_parameter
+from filters import FilterChain
+from ringbuffer import SAMPLE_DTYPE
+from trajectory import STRESS
+
+
+# volts per code of HX711 (mV, channel A gain 128) and ADS1115 (V, gain 1)
+HX711_LSB = 5 / 128 * 1000 / 0xFFFFFF
+ADS1115_LSB = 4.096 / 32767
+
+DEFAULT_CONFIG = {
+    "duration": 600.,
+    # controller
+    "vol_out_interval": 0.5,
+    "adc_amp_factor": 1000.,
+    "base_elastic_modulus": 10000.,
+    "use_pid_engine": False,
+    "pid_gain": (0.5, 0.2, 0.),
+    "control_option": 1,
+    "control_param": (0., 300., 100., 1., 5., 10., 0., 0.),
+    # specimen and sensors
+    "specimen": (150., 150., 84., 2.69),
+    "slope": (250., -2., 250., 50.),
+    "intercept": (0., 150., 0., 0.),
+    "sample_rate": (10., 10., 10., 128.),
+    "noise": (5e-4, 5e-4, 5e-4, 5e-4),
+    "filter_setting": (("median", 15),),
+    # plant
+    "actuator_amp_factor": 1000.,
+    "actuator_time_constant": 0.5,
+    "constrained_modulus": 10000.,
+    "consolidation_time": 60.,
+    "creep_ratio": 0.05,
+    "tolerance": 2.,
+    "seed": 0,
+}
+
+
+class OedometerPlant():
+    # loading frame and specimen, state advanced by step(dac_value, dt)
+    def __init__(self, specimen_parameter, actuator_amp_factor=1000., actuator_time_constant=0.5,
+                 constrained_modulus=10000., consolidation_time=60., creep_ratio=0.05):
+
+        if actuator_time_constant <= 0 or consolidation_time <= 0:
+            raise ValueError("Time constants should be positive")
+
+        self.specimen_parameter = specimen_parameter
+        self.actuator_amp_factor = actuator_amp_factor
+        self.actuator_time_constant = actuator_time_constant
+        self.constrained_modulus = constrained_modulus
+        self.consolidation_time = consolidation_time
+        self.creep_ratio = creep_ratio
+
+        self.time = 0.
+        self.load = 0.
+        self.primary_strain = 0.
+        self.secondary_strain = 0.
+
+    @property
+    def stress(self):
+        return self.load / self.specimen_parameter[2] * 1000
+
+    @property
+    def strain(self):
+        return self.primary_strain + self.secondary_strain
+
+    def step(self, dac_value, dt):
+        # DAC value -> DAC output (V) -> load (N)
+        target_load = dac_value / 65536 * 5 * self.actuator_amp_factor
+        self.load += (target_load - self.load) * (1 - math.exp(-dt / self.actuator_time_constant))
+
+        # strain (%) approaches σ_a / M, secondary compression per log cycle of time
+        equilibrium_strain = max(self.stress, 0.) / self.constrained_modulus * 100
+        self.primary_strain += (equilibrium_strain - self.primary_strain) * (1 - math.exp(-dt / self.consolidation_time))
+        self.secondary_strain += self.creep_ratio * self.primary_strain / math.log(10) * dt / (self.time + self.consolidation_time)
+
+        self.time += dt
+
+    def phi_val(self):
+        # inverse of compute_output_param, discharged water = volume change of specimen
+        specimen_parameter = self.specimen_parameter
+        water = self.strain / 100 * specimen_parameter[3]
+        pressure = water * 9.81 * 0.998223 * 1000 / specimen_parameter[5]
+        return [self.load,
+                specimen_parameter[0] * (1 - self.strain / 100),
+                pressure * specimen_parameter[5] / 1000 + water * 9.81 * specimen_parameter[6],
+                pressure]
+
+
+class SimulatedAcquisition():
+    # stand-in for Acquisition in ControlLoop, samples plant on simulated clock
+    def __init__(self, plant, slope, intercept, sample_rate=(10., 10., 10., 128.), noise=(5e-4, 5e-4, 5e-4, 5e-4),
+                 filter_setting=(("median", 15),), seed=None):
+
+        self.plant = plant
+        self.num_module = len(slope)
+        self.slope = slope
+        self.intercept = intercept
+        self.period = [1. / x for x in sample_rate]
+        self.noise = noise
+        self.lsb = [HX711_LSB] * (self.num_module - 1) + [ADS1115_LSB]
+        self.random = np.random.default_rng(seed)
+
+        self.filter_chain = [FilterChain(filter_setting) for i in range(self.num_module)]
+        self.is_ch_filtered = np.array([False] * self.num_module)
+        self.current_vol = [0.] * self.num_module
+        self.next_sample_time = [0.] * self.num_module
+        self.seq = [0] * self.num_module
+        self.pending_record = []
+
+    def sample(self):
+        # convert channels whose conversion is due at current plant time
+        now = self.plant.time
+        phi_val = None
+
+        for i in range(self.num_module):
+            if now < self.next_sample_time[i]:
+                continue
+            if phi_val is None:
+                phi_val = self.plant.phi_val()
+
+            volts = (phi_val[i] - self.intercept[i]) / self.slope[i] + self.random.normal(0., self.noise[i])
+            volts = round(volts / self.lsb[i]) * self.lsb[i]
+            is_hx711 = i < self.num_module - 1
+            self.pending_record.append((i, self.seq[i], int(now * 1e9), int(volts / self.lsb[i]), volts,
+                                        i if is_hx711 else -1, 0, 128 if is_hx711 else 0, 0))
+            self.seq[i] += 1
+            self.next_sample_time[i] += self.period[i]
+
+    def filter_variable(self):
+        new_record = np.array(self.pending_record, dtype=SAMPLE_DTYPE)
+        self.pending_record = []
+
+        for i in range(self.num_module):
+            current_queue_value = new_record["volts"][new_record["channel"] == i]
+
+            if len(current_queue_value) != 0:
+                self.filter_chain[i].process_block(current_queue_value)
+
+                if self.filter_chain[i].value is not None:
+                    self.current_vol[i] = self.filter_chain[i].value
+                    self.is_ch_filtered[i] = True
+
+        return new_record
+
+
+def simulate(config=None):
+    # run one closed loop configuration, returns (history, metrics)
+    config = dict(DEFAULT_CONFIG, **(config or {}))
+    control_param = list(config["control_param"])
+    for key, value in config.items():
+        if key.startswith("param"):
+            control_param[int(key[5:])] = value
+
+    specimen_parameter = compute_specimen_parameter(*config["specimen"])
+    plant = OedometerPlant(specimen_parameter,
+                           actuator_amp_factor=config["actuator_amp_factor"],
+                           actuator_time_constant=config["actuator_time_constant"],
+                           constrained_modulus=config["constrained_modulus"],
+                           consolidation_time=config["consolidation_time"],
+                           creep_ratio=config["creep_ratio"])
+    acquisition = SimulatedAcquisition(plant, config["slope"], config["intercept"],
+                                       sample_rate=config["sample_rate"], noise=config["noise"],
+                                       filter_setting=config["filter_setting"], seed=config["seed"])
+
+    controller = LoadingController(SimulatedDAC(),
+                                   vol_out_interval=config["vol_out_interval"],
+                                   adc_amp_factor=config["adc_amp_factor"],
+                                   base_elastic_modulus=config["base_elastic_modulus"],
+                                   use_pid_engine=config["use_pid_engine"],
+                                   pid_gain=config["pid_gain"],
+                                   clock=lambda: plant.time)
+    controller.control_param[:, config["control_option"]] = control_param
+
+    current_phi_val = [0.] * acquisition.num_module
+    current_output_param = [0.] * 5
+    loop = ControlLoop(controller, acquisition, config["slope"], config["intercept"], specimen_parameter,
+                       current_phi_val, current_output_param, period=config["vol_out_interval"])
+
+    # plant is integrated at the fastest conversion period
+    period = config["vol_out_interval"]
+    num_tick = int(config["duration"] / period)
+    num_substep = max(1, int(math.ceil(period / min(acquisition.period))))
+    substep = period / num_substep
+
+    history = np.zeros(num_tick, dtype=[("time", "f8"), ("setpoint", "f8"), ("quantity", "i1"),
+                                        ("stress", "f8"), ("strain", "f8"), ("dac", "i4")])
+
+    start = time.perf_counter()
+    for tick in range(num_tick):
+        for i in range(num_substep):
+            plant.step(controller.dac.value, substep)
+            acquisition.sample()
+
+        # control starts after first tick, once filters hold a value
+        if tick == 1:
+            controller.set_control_option(config["control_option"])
+            controller.start()
+
+        setpoint, quantity = controller.current_setpoint()
+        loop.tick(period)
+        history[tick] = (plant.time, setpoint, quantity, plant.stress, plant.strain, controller.dac.value)
+
+    metrics = compute_metrics(history, config["tolerance"])
+    metrics["speed_factor"] = plant.time / (time.perf_counter() - start)
+    return history, metrics
+
+
+def compute_metrics(history, tolerance):
+    # settling time, overshoot and tracking error against final setpoint
+    is_active = ~np.isnan(history["setpoint"])
+    metrics = {"settling_time": np.nan, "overshoot": np.nan, "rms_error": np.nan, "max_error": np.nan}
+    if not np.any(is_active):
+        return metrics
+
+    history = history[is_active]
+    value = np.where(history["quantity"] == STRESS, history["stress"], history["strain"])
+    error = value - history["setpoint"]
+    metrics["rms_error"] = float(np.sqrt(np.mean(error ** 2)))
+    metrics["max_error"] = float(np.max(np.abs(error)))
+
+    target = history["setpoint"][-1]
+    step = target - value[0]
+    if step != 0:
+        metrics["overshoot"] = float(max(0., np.max((value - target) * np.sign(step))) / abs(step) * 100)
+
+    is_outside = np.abs(value - target) > tolerance
+    if not is_outside[-1]:
+        num_outside = np.flatnonzero(is_outside)
+        settled_index = num_outside[-1] + 1 if len(num_outside) else 0
+        metrics["settling_time"] = float(history["time"][settled_index] - history["time"][0])
+
+    return metrics
+
+
+def _simulate_metrics(config):
+    return simulate(config)[1]
+
+
+def run_sweep(grid, base_config=None, max_workers=None):
+    # all combinations of grid ({key: [values]}) on process pool, returns [(config, metrics)]
+    keys = list(grid)
+    config_list = [dict(base_config or {}, **dict(zip(keys, values)))
+                   for values in itertools.product(*[grid[key] for key in keys])]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        metrics_list = list(executor.map(_simulate_metrics, config_list))
+
+    return list(zip(config_list, metrics_list))
+
+
+def print_sweep(grid, result):
+    keys = list(grid)
+    print(" ".join("{:>20}".format(key) for key in keys) +
+          " {:>14} {:>10} {:>10} {:>10} {:>8}".format("settling (s)", "overshoot", "rms err", "max err", "speed"))
+    for config, metrics in result:
+        print(" ".join("{:>20}".format(str(config[key])) for key in keys) +
+              " {:>14.1f} {:>9.1f}% {:>10.3f} {:>10.3f} {:>7.0f}x".format(
+                  metrics["settling_time"], metrics["overshoot"], metrics["rms_error"],
+                  metrics["max_error"], metrics["speed_factor"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="closed loop simulation and parameter sweep of oedometer control")
+    parser.add_argument("--config", default="{}", help="JSON of keys of DEFAULT_CONFIG (param<row> sets one control_param)")
+    parser.add_argument("--grid", default='{"adc_amp_factor": [500, 1000, 2000], "param5": [5, 10, 20]}',
+                        help="JSON of {key: [values]} swept on process pool")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    grid = json.loads(args.grid)
+    start = time.perf_counter()
+    result = run_sweep(grid, json.loads(args.config), args.workers)
+    print_sweep(grid, result)
+    print("{} configurations in {:.1f} s".format(len(result), time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+################################################################################################
+# Adaptive recording of derived records for long-duration consolidation steps
+#
+# Records are offered every min_interval, AdaptiveRecorder keeps
+#   - log-time points after start of each load increment : interval grows geometrically
+#     (points_per_decade) from min_interval up to max_interval, dense at start of step
+#   - swinging door points : previous record is kept when no straight line from last kept
+#     record passes within deadband of every channel of phi_val of the records in between
+# so linear interpolation between kept records reproduces every offered phi_val within
+# deadband (and σ_a, ɛ_a within their linear image). Load increment starts when σ_a leaves
+# its reference by more than max(stress_tolerance, relative_tolerance x σ_a), the rule of
+# consolidation.py, so increments of the analysis start on a kept record.
+################################################################################################
+
+import numpy as np
+
+
+class AdaptiveRecorder():
+    def __init__(self, deadband, min_interval=0.1, points_per_decade=50, max_interval=600.,
+                 stress_tolerance=2., relative_tolerance=0.02):
+        # deadband : allowed error of phi_val per channel (physical units of channel)
+        self.deadband = np.array(deadband, dtype=float)
+        if np.any(self.deadband < 0):
+            raise ValueError("Deadband should be 0 or positive")
+        if not 0 < min_interval <= max_interval:
+            raise ValueError("Intervals should be 0 < min_interval <= max_interval")
+        if points_per_decade <= 0:
+            raise ValueError("points_per_decade should be positive")
+        self.min_interval = min_interval
+        self.points_per_decade = points_per_decade
+        self.max_interval = max_interval
+        self.stress_tolerance = stress_tolerance
+        self.relative_tolerance = relative_tolerance
+        self.growth = 10 ** (1 / points_per_decade) - 1
+
+        self.reference = None                   # σ_a of current increment
+        self.step_time = None
+        self.next_time = None                   # next log-time point
+        self.pivot_time = None                  # last kept record
+        self.pivot_value = None
+        self.lower = None                       # slopes of door from pivot
+        self.upper = None
+        self.pending = None                     # (t, value, record) of last offered, not kept
+
+        self.num_offered = 0
+        self.num_kept = 0
+        self.num_step = 0
+
+    def setting(self):
+        # for log headers, AdaptiveRecorder(**setting) rebuilds it
+        return {"deadband": self.deadband.tolist(),
+                "min_interval": self.min_interval,
+                "points_per_decade": self.points_per_decade,
+                "max_interval": self.max_interval,
+                "stress_tolerance": self.stress_tolerance,
+                "relative_tolerance": self.relative_tolerance}
+
+    def update(self, t, phi_val, stress, record):
+        # records to write (0 - 2, in time order) when record (snapshot) of time t (s) is offered
+        value = np.array(phi_val, dtype=float)
+        self.num_offered += 1
+        kept = []
+
+        if self.reference is None:
+            is_forced = True
+            self._start_step(t, stress)
+        elif abs(stress - self.reference) > max(self.stress_tolerance, self.relative_tolerance * abs(self.reference)):
+            is_forced = True
+            self._start_step(t, stress)
+        else:
+            is_forced = t >= self.next_time
+            while self.next_time <= t:
+                self.next_time += min(max((self.next_time - self.step_time) * self.growth, self.min_interval),
+                                      self.max_interval)
+
+        # line from pivot to this record must stay in door of records in between
+        if self.pending is not None:
+            slope = (value - self.pivot_value) / max(t - self.pivot_time, 1e-9)
+            if np.any(slope < self.lower) or np.any(slope > self.upper):
+                kept.append(self._keep(*self.pending))
+
+        if is_forced or self.pivot_time is None:
+            kept.append(self._keep(t, value, record))
+        else:
+            dt = max(t - self.pivot_time, 1e-9)
+            np.maximum(self.lower, (value - self.deadband - self.pivot_value) / dt, out=self.lower)
+            np.minimum(self.upper, (value + self.deadband - self.pivot_value) / dt, out=self.upper)
+            self.pending = (t, value, record)
+        return kept
+
+    def flush(self):
+        # last offered record, to close the curve at end of log
+        if self.pending is None:
+            return []
+        return [self._keep(*self.pending)]
+
+    def _start_step(self, t, stress):
+        self.reference = stress
+        self.step_time = t
+        self.next_time = t + self.min_interval
+        self.num_step += 1
+
+    def _keep(self, t, value, record):
+        self.pivot_time = t
+        self.pivot_value = value
+        self.lower = np.full(len(value), -np.inf)
+        self.upper = np.full(len(value), np.inf)
+        self.pending = None
+        self.num_kept += 1
+        return record
+
+    def print_statistics(self):
+        print("adaptive recording : {} of {} records kept ({:.1f}x), {} load increments".format(
+            self.num_kept, self.num_offered, self.num_offered / max(self.num_kept, 1), self.num_step))
@@ -0,0 +1,196 @@
+################################################################################################
+# Replay of recorded logs through acquisition pipeline
+#
+# ReplaySource streams raw samples of a log (datalogger.py) chunk by chunk in log time.
+#   - Acquisition(replay=path, replay_speed=N) uses it instead of HX711 / ADS1115 in the
+#     acquisition process (original timing x N, 0 = as fast as possible)
+#   - replay_pipeline() runs filters, derived values, control law and logger in lock step
+#     with log time (no threads), deterministic for regression tests and benchmarks
+#
+# Usage : python replay.py (log file) [--out new.odolog] [--period 0.5] [--filter JSON]
+################################################################################################
+
+import argparse
+import json
+import time
+import numpy as np
+from numpy.lib import recfunctions as rfn
+
+from acquisition import Acquisition, SimulatedDAC
+from calibration import load_calibration_set
+from control import ControlLoop, LoadingController
+from datalogger import DataLogger, iter_chunks, read_header
+from derived import OUTPUT_EXPRESSION, DerivedEngine
+from ringbuffer import SAMPLE_DTYPE
+
+
+class ReplaySource():
+    def __init__(self, path, stream="raw"):
+        self.path = path
+        self.stream = stream
+        self._chunks = (data for header, name, data in iter_chunks(path) if name == stream)
+        self._pending = np.zeros(0, dtype=SAMPLE_DTYPE)
+        self.is_exhausted = False
+        self.num_record = 0
+
+        # log time of first sample
+        self._pull()
+        self.start_t_ns = int(self._pending["t_ns"].min()) if len(self._pending) else 0
+
+    @property
+    def is_finished(self):
+        return self.is_exhausted and len(self._pending) == 0
+
+    def _pull(self):
+        try:
+            data = next(self._chunks)
+        except StopIteration:
+            self.is_exhausted = True
+            return
+        # fields are matched by name, logs written before source tags get zero tags
+        self._pending = np.concatenate([self._pending, rfn.require_fields(data, SAMPLE_DTYPE)])
+
+    def read_until(self, t_ns):
+        # samples stamped before t_ns (log time), in recorded order
+        while not self.is_exhausted and (len(self._pending) == 0 or self._pending["t_ns"].max() < t_ns):
+            self._pull()
+
+        is_due = self._pending["t_ns"] < t_ns
+        records = self._pending[is_due]
+        self._pending = self._pending[~is_due]
+        self.num_record += len(records)
+        return records
+
+    def read_next(self):
+        # next recorded chunk, regardless of time
+        if len(self._pending) == 0:
+            self._pull()
+        records = self._pending
+        self._pending = np.zeros(0, dtype=SAMPLE_DTYPE)
+        self.num_record += len(records)
+        return records
+
+
+def push_records(acquisition, records):
+    # samples of HX711 channels and ADS1115 channel to their ring buffers
+    is_ads = records["channel"] == acquisition.ads_channel
+    acquisition.read_value.push_many(records[~is_ads])
+    acquisition.read_value_ads.push_many(records[is_ads])
+
+
+def replay_pipeline(path, period=0.5, filter_setting=None, slope=None, intercept=None, specimen_parameter=None,
+                    control_option=0, control_param=None, use_pid_engine=False, out_path=None, full_rate=False):
+    # lock step replay, returns derived records (one per tick) as structured array,
+    # full_rate : also logs derived values of every sample (stream derived_full)
+    with open(path, "rb") as f:
+        info = read_header(f)["info"]
+
+    # calibration and specimen of the log unless given
+    filter_setting = [tuple(x) for x in (filter_setting or info.get("filter_setting", [("median", 15)]))]
+    slope = list(slope or info.get("slope", [1., 1., 1., 1.]))
+    intercept = list(intercept or info.get("intercept", [0., 0., 0., 0.]))
+    specimen_parameter = list(specimen_parameter or info["specimen_parameter"])
+
+    # channels and roles of recorded rig, logs written before rigs were configurable have the defaults
+    pin_DT = tuple(info.get("pin_DT", (5, 16, 17)))
+    channel_map = info.get("channel_map")
+
+    source = ReplaySource(path)
+    acquisition = Acquisition(pin_DT=pin_DT, filter_setting=filter_setting, replay=path,
+                              sample_plan=info.get("sample_plan"))
+    num_module = acquisition.num_module
+    slope += [1.] * (num_module - len(slope))
+    intercept += [0.] * (num_module - len(intercept))
+    replay_time = [source.start_t_ns * 1e-9]
+
+    # same calibration profiles (serial@version) as recorded run
+    calibration = None
+    if info.get("calibration"):
+        calibration = load_calibration_set(info.get("calibration_dir", "calibration"), info["calibration"],
+                                           slope, intercept)
+
+    controller = LoadingController(SimulatedDAC(), vol_out_interval=period, use_pid_engine=use_pid_engine,
+                                   clock=lambda: replay_time[0])
+    if control_param is not None:
+        controller.control_param[:] = control_param
+    if control_option:
+        controller.set_control_option(control_option)
+        controller.start()
+
+    derived_dtype = np.dtype([("t_ns", np.int64),
+                              ("time", np.float64),
+                              ("vol", np.float64, (num_module,)),
+                              ("phi_val", np.float64, (num_module,)),
+                              ("output_param", np.float64, (5,))])
+    derived_engine = None
+    if full_rate:
+        expression = [tuple(x) for x in info.get("derived_expression", OUTPUT_EXPRESSION)]
+        derived_engine = DerivedEngine(specimen_parameter, num_channel=num_module, channel_map=channel_map,
+                                       expression=expression)
+
+    logger = None
+    on_record = None
+    on_derived = None
+    if out_path is not None:
+        header_info = dict(info, replay_of=path, filter_setting=filter_setting, slope=slope, intercept=intercept,
+                           specimen_parameter=specimen_parameter)
+        streams = {"raw": SAMPLE_DTYPE, "derived": derived_dtype}
+        if derived_engine is not None:
+            streams["derived_full"] = derived_engine.dtype
+            on_derived = lambda derived: logger.log("derived_full", derived)
+        logger = DataLogger(out_path, streams, header_info=header_info)
+        on_record = lambda new_record: logger.log("raw", new_record)
+
+    current_phi_val = [0.] * num_module
+    current_output_param = [0.] * 5
+    loop = ControlLoop(controller, acquisition, slope, intercept, specimen_parameter,
+                       current_phi_val, current_output_param, period=period, on_record=on_record,
+                       channel_map=channel_map, calibration=calibration, derived_engine=derived_engine,
+                       on_derived=on_derived)
+
+    period_ns = int(period * 1e9)
+    t_ns = source.start_t_ns + period_ns
+    derived = []
+    try:
+        while not source.is_finished:
+            push_records(acquisition, source.read_until(t_ns))
+            replay_time[0] = t_ns * 1e-9
+            loop.tick(period)
+
+            # values of this tick, lists are updated in place by next tick
+            record = (t_ns, (t_ns - source.start_t_ns) * 1e-9, list(acquisition.current_vol),
+                      list(current_phi_val), list(current_output_param))
+            derived.append(record)
+            if logger is not None:
+                logger.log("derived", record)
+            t_ns += period_ns
+    finally:
+        if logger is not None:
+            logger.close()
+        acquisition.close()
+
+    return np.array(derived, dtype=derived_dtype)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="replay recorded log through filters, derived values and control law")
+    parser.add_argument("path")
+    parser.add_argument("--out", default=None, help="log file of replayed pipeline")
+    parser.add_argument("--period", type=float, default=0.5, help="control period (s)")
+    parser.add_argument("--filter", default=None, help='JSON, e.g. [["median", 15], ["ema", 0.2]]')
+    parser.add_argument("--full-rate", action="store_true", help="log derived values of every sample (stream derived_full)")
+    args = parser.parse_args()
+
+    filter_setting = json.loads(args.filter) if args.filter is not None else None
+    start = time.perf_counter()
+    derived = replay_pipeline(args.path, period=args.period, filter_setting=filter_setting, out_path=args.out,
+                              full_rate=args.full_rate)
+    wall_time = time.perf_counter() - start
+
+    duration = derived["time"][-1] if len(derived) else 0.
+    print("{} ticks, {:.1f} s of log in {:.2f} s ({:.0f}x real time)".format(
+        len(derived), duration, wall_time, duration / max(wall_time, 1e-9)))
+
+
+if __name__ == "__main__":
+    main()
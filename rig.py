@@ -0,0 +1,130 @@
+################################################################################################
+# Rig configuration of oedometer stations run from one host (see supervisor.py)
+#
+# One rig = HX711 bank (DT / SCK pins), ADS1115 and MCP4725 on an I2C bus, channel roles,
+# calibration, specimen and loading program. Rigs are given as JSON list of dicts holding
+# keys of DEFAULT_RIG; missing keys take the defaults.
+#
+# channel_role maps each role (slot of phi_val, see derived.py) to acquisition channel
+# CH0 - CH(n-1) : HX711, CHn : ADS1115, so rigs may be wired differently.
+################################################################################################
+
+import json
+import os
+
+
+ROLE = ("load", "displacement", "tank_load", "tank_pressure")
+
+ADS1115_ADDRESS = (0x48, 0x49, 0x4A, 0x4B)
+MCP4725_ADDRESS = tuple(range(0x60, 0x68))
+
+DEFAULT_RIG = {
+    "name": "rig0",
+    # hardware
+    "pin_DT": (5, 16, 17),
+    "pin_SCK": 6,
+    "i2c_bus": 1,
+    "ads_address": 0x48,
+    "dac_address": 0x60,
+    "ads_data_rate": 128,
+    "hx711_rate": 80,
+    "sample_plan": None,
+    "cpu": None,
+    # channels and calibration
+    "channel_role": {"load": 0, "displacement": 1, "tank_load": 2, "tank_pressure": 3},
+    "slope": (1., 1., 1., 1.),
+    "intercept": (0., 0., 0., 0.),
+    # multi-point profiles (calibration.py) per channel, {channel: "serial" or "serial@version"}
+    "calibration": {},
+    "calibration_dir": "calibration",
+    "filter_setting": (("median", 15),),
+    # specimen : height, diameter, drain tank diameter (mm), rho_s (g/cm3)
+    "specimen": (150., 150., 84., 2.69),
+    # loading
+    "vol_out_interval": 0.5,
+    "adc_amp_factor": 100.,
+    "control_option": 0,
+    "control_param": None,
+    "use_pid_engine": False,
+    "save_interval": 1.,
+    # adaptive recording of derived records (recording.py) instead of every save_interval,
+    # keyword arguments of AdaptiveRecorder, deadband per channel CH0 - CH(n-1),
+    # e.g. {"deadband": [0.5, 0.002, 0.5, 0.05]}
+    "adaptive_save": None,
+}
+
+
+def load_rig_config(path):
+    with open(path) as f:
+        rigs = json.load(f)
+    if isinstance(rigs, dict):
+        rigs = [rigs]
+    return check_rig_config([dict(DEFAULT_RIG, **rig) for rig in rigs])
+
+
+def rig_num_channel(rig):
+    # channels of Acquisition of rig (channel B inputs are extra channels)
+    sample_plan = rig["sample_plan"]
+    has_chB = sample_plan is not None and any(p[0] == "B" for p in sample_plan)
+    return len(rig["pin_DT"]) + 1 + (len(rig["pin_DT"]) if has_chB else 0)
+
+
+def rig_channel_map(rig):
+    # acquisition channel of each slot of phi_val
+    return [rig["channel_role"][role] for role in ROLE]
+
+
+def check_rig_config(rigs):
+    # rigs share the host : GPIO pins, I2C addresses on one bus and names must not collide
+    names = set()
+    pin_owner = {}
+    address_owner = {}
+
+    for rig in rigs:
+        name = rig["name"]
+        if name in names:
+            raise ValueError("Rig name {} is used twice".format(name))
+        names.add(name)
+
+        pin_SCK = rig["pin_SCK"]
+        pins = list(rig["pin_DT"]) + ([pin_SCK] if isinstance(pin_SCK, int) else sorted(set(pin_SCK)))
+        for pin in pins:
+            if pin in pin_owner:
+                raise ValueError("GPIO {} of rig {} is already used by rig {}".format(pin, name, pin_owner[pin]))
+            pin_owner[pin] = name
+
+        if rig["ads_address"] not in ADS1115_ADDRESS:
+            raise ValueError("ADS1115 address of rig {} should be 0x48 - 0x4B".format(name))
+        if rig["dac_address"] not in MCP4725_ADDRESS:
+            raise ValueError("MCP4725 address of rig {} should be 0x60 - 0x67".format(name))
+        for address in (rig["ads_address"], rig["dac_address"]):
+            key = (rig["i2c_bus"], address)
+            if key in address_owner:
+                raise ValueError("I2C address 0x{:02X} on bus {} of rig {} is already used by rig {}".format(
+                    address, rig["i2c_bus"], name, address_owner[key]))
+            address_owner[key] = name
+
+        num_channel = rig_num_channel(rig)
+        if sorted(rig["channel_role"]) != sorted(ROLE):
+            raise ValueError("channel_role of rig {} should map each of {}".format(name, ", ".join(ROLE)))
+        if any(not 0 <= channel < num_channel for channel in rig["channel_role"].values()):
+            raise ValueError("channel_role of rig {} should be channels 0 - {}".format(name, num_channel - 1))
+        if len(rig["slope"]) < num_channel or len(rig["intercept"]) < num_channel:
+            raise ValueError("slope / intercept of rig {} should have {} channels".format(name, num_channel))
+        if any(not 0 <= int(channel) < num_channel for channel in rig["calibration"]):
+            raise ValueError("calibration of rig {} should be channels 0 - {}".format(name, num_channel - 1))
+        if rig["adaptive_save"] is not None and len(rig["adaptive_save"].get("deadband", ())) != num_channel:
+            raise ValueError("adaptive_save of rig {} should give deadband of channels 0 - {}".format(name, num_channel - 1))
+
+    return rigs
+
+
+def assign_cpu(rigs, cpus=None):
+    # core of each rig worker : given cpu, else round robin over cores left to the supervisor
+    if cpus is None:
+        cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else [None]
+
+    # keep first core for supervisor (logger, dashboard) when there is more than one
+    worker_cpus = cpus[1:] if len(cpus) > 1 else cpus
+    return [rig["cpu"] if rig["cpu"] is not None else worker_cpus[i % len(worker_cpus)]
+            for i, rig in enumerate(rigs)]
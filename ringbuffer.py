@@ -0,0 +1,138 @@
+################################################################################################
+# Lock-free single producer / single consumer ring buffer in shared memory
+#
+# Records of fixed dtype are written by one process (acquisition) and read by another (GUI).
+# The producer never blocks : when the consumer falls behind, the oldest records are
+# overwritten and counted as overrun.
+################################################################################################
+
+from multiprocessing import shared_memory
+import numpy as np
+
+
+# record of one sample of one channel, stamped with time.monotonic_ns() at acquisition
+# and tagged with its source : HX711 module, input (0 : A, 1 : B) and gain (module -1,
+# gain 0 : not HX711), and samples of its module rejected so far by consistency check
+SAMPLE_DTYPE = np.dtype([("channel", np.int16),
+                         ("seq", np.int64),
+                         ("t_ns", np.int64),
+                         ("raw", np.int64),
+                         ("volts", np.float64),
+                         ("module", np.int16),
+                         ("input", np.int8),
+                         ("gain", np.int16),
+                         ("num_rejected", np.int32)])
+
+# header slots (int64)
+_WRITE_COUNT = 0            # written by producer only
+_NUM_OVERRUN = 1            # written by producer only
+_READ_COUNT = 2             # written by consumer only
+_NUM_LOST = 3               # written by consumer only
+_HEADER_SIZE = 64           # bytes, keeps records cache line aligned
+
+
+class SharedRingBuffer():
+    def __init__(self, dtype, capacity=4096, name=None, create=True):
+        
+        if capacity <= 0:
+            raise ValueError("Capacity of ring buffer (capacity) should be positive")
+        
+        self.dtype = np.dtype(dtype)
+        self.capacity = capacity
+        self.is_owner = create
+        
+        size = _HEADER_SIZE + self.capacity * self.dtype.itemsize
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        self.name = self.shm.name
+        
+        self.header = np.ndarray((_HEADER_SIZE // 8,), dtype=np.int64, buffer=self.shm.buf)
+        self.data = np.ndarray((self.capacity,), dtype=self.dtype, buffer=self.shm.buf, offset=_HEADER_SIZE)
+        
+        if create:
+            self.header[:] = 0
+
+    def __reduce__(self):
+        # attach to the same block when sent to another process
+        return (SharedRingBuffer, (self.dtype, self.capacity, self.name, False))
+
+    # ---------- producer side ----------
+
+    def push(self, record):
+        header = self.header
+        write_count = int(header[_WRITE_COUNT])
+        
+        if write_count - header[_READ_COUNT] >= self.capacity:
+            header[_NUM_OVERRUN] += 1
+        
+        self.data[write_count % self.capacity] = record
+        
+        # publish the record only after it is completely written
+        header[_WRITE_COUNT] = write_count + 1
+
+    def push_many(self, records):
+        # block of records, same overrun accounting as push
+        header = self.header
+        write_count = int(header[_WRITE_COUNT])
+        
+        num_overrun = write_count + len(records) - int(header[_READ_COUNT]) - self.capacity
+        if num_overrun > 0:
+            header[_NUM_OVERRUN] += min(num_overrun, len(records))
+        
+        # only last capacity records of oversized block can be kept
+        if len(records) > self.capacity:
+            write_count += len(records) - self.capacity
+            records = records[-self.capacity:]
+        num_record = len(records)
+        
+        start = write_count % self.capacity
+        num_first = min(num_record, self.capacity - start)
+        self.data[start:start + num_first] = records[:num_first]
+        self.data[:num_record - num_first] = records[num_first:]
+        
+        header[_WRITE_COUNT] = write_count + num_record
+
+    # ---------- consumer side ----------
+
+    def __len__(self):
+        return int(min(self.header[_WRITE_COUNT] - self.header[_READ_COUNT], self.capacity))
+
+    def read_views(self):
+        # views on all new records (1 or 2 slices because of wrap around), zero copy.
+        # views stay valid until the producer writes (capacity - len) more records.
+        header = self.header
+        write_count = int(header[_WRITE_COUNT])
+        read_count = int(header[_READ_COUNT])
+        
+        if write_count - read_count > self.capacity:
+            header[_NUM_LOST] += write_count - read_count - self.capacity
+            read_count = write_count - self.capacity
+        
+        header[_READ_COUNT] = write_count
+        
+        start = read_count % self.capacity
+        stop = start + (write_count - read_count)
+        
+        if stop <= self.capacity:
+            return [self.data[start:stop]]
+        else:
+            return [self.data[start:], self.data[:stop - self.capacity]]
+
+    def read(self):
+        # all new records, view when contiguous, copy only when wrapped around
+        views = self.read_views()
+        if len(views) == 1:
+            return views[0]
+        return np.concatenate(views)
+
+    @property
+    def num_overrun(self):
+        return int(self.header[_NUM_OVERRUN])
+
+    @property
+    def num_lost(self):
+        return int(self.header[_NUM_LOST])
+
+    def close(self):
+        self.shm.close()
+        if self.is_owner:
+            self.shm.unlink()
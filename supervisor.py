@@ -0,0 +1,289 @@
+################################################################################################
+# Supervisor of several oedometer rigs on one host
+#
+# One worker process per rig (see rig.py) pinned to its own core runs Acquisition (its
+# sampling process inherits the core), LoadingController and ControlLoop. Rigs on one I2C
+# bus share a lock. Workers stream raw samples and derived records through shared ring
+# buffers, the supervisor drains them into one log file per rig (<log_dir>/<rig>.odolog,
+# streams "raw" and "derived", header as main.py / headless.py so replay.py and
+# consolidation.py read it) and prints one dashboard of all rigs.
+#
+# Usage : python supervisor.py rigs.json --log-dir logs [--simulate] [--duration 3600]
+################################################################################################
+
+import argparse
+import multiprocessing as mp
+import os
+import signal
+import time
+import numpy as np
+
+from calibration import load_calibration_set
+from datalogger import DataLogger
+from derived import compute_specimen_parameter
+from rig import assign_cpu, load_rig_config, rig_channel_map, rig_num_channel
+from ringbuffer import SAMPLE_DTYPE, SharedRingBuffer
+
+
+def derived_dtype(num_channel):
+    return np.dtype([("t_ns", np.int64),
+                     ("time", np.float64),
+                     ("vol", np.float64, (num_channel,)),
+                     ("phi_val", np.float64, (num_channel,)),
+                     ("output_param", np.float64, (5,))])
+
+
+def rig_header_info(rig, start_time):
+    # header of log of one rig, calibration pinned to the versions loaded now
+    calibration = None
+    if rig["calibration"]:
+        calibration = load_calibration_set(rig["calibration_dir"], rig["calibration"],
+                                           rig["slope"], rig["intercept"]).version()
+    return {"slope": list(rig["slope"]),
+            "intercept": list(rig["intercept"]),
+            "specimen_parameter": compute_specimen_parameter(*rig["specimen"]),
+            "filter_setting": [list(x) for x in rig["filter_setting"]],
+            "sample_plan": rig["sample_plan"],
+            "calibration": calibration,
+            "calibration_dir": rig["calibration_dir"],
+            "pin_DT": list(rig["pin_DT"]),
+            "channel_map": rig_channel_map(rig),
+            "adaptive_save": rig["adaptive_save"],
+            "rig": rig,
+            "start_time": start_time}
+
+
+def run_rig(rig, cpu, raw_ring, derived_ring, i2c_lock, is_running, simulate=False):
+    # worker process of one rig, stopped by supervisor (Ctrl-C is left to supervisor)
+    from acquisition import Acquisition
+    from calibration import load_calibration_set
+    from control import ControlLoop, LoadingController
+    from recording import AdaptiveRecorder
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if cpu is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {cpu})
+
+    pin_SCK = rig["pin_SCK"] if isinstance(rig["pin_SCK"], int) else tuple(rig["pin_SCK"])
+    acquisition = Acquisition(pin_DT=tuple(rig["pin_DT"]), pin_SCK=pin_SCK,
+                              ads_address=rig["ads_address"], dac_address=rig["dac_address"],
+                              ads_data_rate=rig["ads_data_rate"],
+                              filter_setting=[tuple(x) for x in rig["filter_setting"]],
+                              simulate=simulate, sample_plan=rig["sample_plan"], hx711_rate=rig["hx711_rate"],
+                              i2c_bus=rig["i2c_bus"], i2c_lock=i2c_lock)
+    acquisition.initialize_devices()
+
+    current_phi_val = [0.] * acquisition.num_module
+    current_output_param = [0.] * 5
+    controller = LoadingController(acquisition.dac, vol_out_interval=rig["vol_out_interval"],
+                                   adc_amp_factor=rig["adc_amp_factor"], use_pid_engine=rig["use_pid_engine"])
+    if rig["control_param"] is not None:
+        controller.control_param[:] = rig["control_param"]
+    if rig["control_option"]:
+        controller.set_control_option(rig["control_option"])
+        controller.start()
+
+    slope = list(rig["slope"])
+    intercept = list(rig["intercept"])
+    calibration = None
+    if rig["calibration"]:
+        calibration = load_calibration_set(rig["calibration_dir"], rig["calibration"], slope, intercept)
+
+    control_loop = ControlLoop(controller, acquisition, slope, intercept,
+                               compute_specimen_parameter(*rig["specimen"]), current_phi_val, current_output_param,
+                               period=rig["vol_out_interval"], on_record=raw_ring.push_many,
+                               metrics=acquisition.metrics, channel_map=rig_channel_map(rig),
+                               calibration=calibration)
+
+    acquisition.start()
+    control_loop.start()
+
+    recorder = None
+    save_interval = rig["save_interval"]
+    if rig["adaptive_save"] is not None:
+        recorder = AdaptiveRecorder(**rig["adaptive_save"])
+        save_interval = recorder.min_interval
+
+    start_time = time.time()
+    next_save_time = time.monotonic()
+    while is_running.value:
+        if time.monotonic() >= next_save_time:
+            record = (time.monotonic_ns(), time.time() - start_time, list(acquisition.current_vol),
+                      list(current_phi_val), list(current_output_param))
+            if recorder is None:
+                derived_ring.push(record)
+            else:
+                for record in recorder.update(record[1], record[3], record[4][0], record):
+                    derived_ring.push(record)
+            next_save_time += save_interval
+        time.sleep(min(0.1, max(0., next_save_time - time.monotonic())))
+
+    control_loop.stop()
+    acquisition.close()
+    if recorder is not None:
+        for record in recorder.flush():
+            derived_ring.push(record)
+        recorder.print_statistics()
+    control_loop.print_loop_statistics()
+
+
+class Supervisor():
+    def __init__(self, rigs, log_dir=None, simulate=False, cpus=None, is_raw_saving=True,
+                 ring_buffer_capacity=65536, print_interval=5., loop_interval=0.1):
+        self.rigs = rigs
+        self.log_dir = log_dir
+        self.simulate = simulate
+        self.is_raw_saving = is_raw_saving
+        self.print_interval = print_interval
+        self.loop_interval = loop_interval
+        self.cpu = assign_cpu(rigs, cpus)
+        self.is_running = mp.Value("i", 0)
+        self.processes = []
+
+        # one lock per I2C bus
+        lock_by_bus = {}
+        self.i2c_lock = [lock_by_bus.setdefault(rig["i2c_bus"], mp.Lock()) for rig in rigs]
+
+        self.num_channel = [rig_num_channel(rig) for rig in rigs]
+        self.derived_dtype = [derived_dtype(n) for n in self.num_channel]
+        self.raw_ring = [SharedRingBuffer(SAMPLE_DTYPE, capacity=ring_buffer_capacity) for rig in rigs]
+        self.derived_ring = [SharedRingBuffer(dtype, capacity=1024) for dtype in self.derived_dtype]
+
+        # dashboard : samples per channel, last derived record of each rig
+        self.num_sample = [np.zeros(n, dtype=np.int64) for n in self.num_channel]
+        self.last_derived = [None] * len(rigs)
+        self.num_overrun = [0] * len(rigs)
+        self.logger = None                      # one DataLogger per rig
+
+    def start(self):
+        if self.log_dir is not None:
+            os.makedirs(self.log_dir, exist_ok=True)
+            start_time = time.time()
+            self.logger = [DataLogger(os.path.join(self.log_dir, rig["name"] + ".odolog"),
+                                      {"raw": SAMPLE_DTYPE, "derived": dtype},
+                                      header_info=rig_header_info(rig, start_time))
+                           for rig, dtype in zip(self.rigs, self.derived_dtype)]
+
+        self.is_running.value = 1
+        for i, rig in enumerate(self.rigs):
+            process = mp.Process(target=run_rig, name=rig["name"],
+                                 args=(rig, self.cpu[i], self.raw_ring[i], self.derived_ring[i],
+                                       self.i2c_lock[i], self.is_running, self.simulate))
+            process.start()
+            self.processes.append(process)
+
+        # supervisor (logger, dashboard) on first core when workers are spread over the others
+        if len(set(self.cpu)) > 1 and hasattr(os, "sched_setaffinity"):
+            cpus = sorted(os.sched_getaffinity(0))
+            if len(cpus) > 1:
+                os.sched_setaffinity(0, {cpus[0]})
+
+    def drain(self):
+        for i, rig in enumerate(self.rigs):
+            raw = self.raw_ring[i].read()
+            if len(raw):
+                self.num_sample[i] += np.bincount(raw["channel"], minlength=self.num_channel[i])[:self.num_channel[i]]
+                if self.logger is not None and self.is_raw_saving:
+                    self.logger[i].log("raw", raw)
+
+            derived = self.derived_ring[i].read()
+            if len(derived):
+                # records are views on shared memory
+                self.last_derived[i] = derived[-1].copy()
+                if self.logger is not None:
+                    self.logger[i].log("derived", derived)
+
+    def run(self, duration=None):
+        self.start()
+        start = time.monotonic()
+        temp_print_triggered_time = start
+        prev_num_sample = [n.copy() for n in self.num_sample]
+
+        try:
+            while self.is_running.value:
+                now = time.monotonic()
+                if duration is not None and now - start > duration:
+                    break
+                self.drain()
+
+                if now - temp_print_triggered_time > self.print_interval:
+                    self.print_dashboard(now - start, [(n - p) / (now - temp_print_triggered_time)
+                                                       for n, p in zip(self.num_sample, prev_num_sample)])
+                    prev_num_sample = [n.copy() for n in self.num_sample]
+                    temp_print_triggered_time = now
+
+                time.sleep(self.loop_interval)
+        finally:
+            self.elapsed = time.monotonic() - start
+            self.close()
+
+    def stop(self, *args):
+        self.is_running.value = 0
+
+    def print_dashboard(self, elapsed, sample_rate):
+        print("---- t={:8.1f} s ----".format(elapsed))
+        for i, rig in enumerate(self.rigs):
+            state = "running" if self.processes[i].is_alive() else "exited ({})".format(self.processes[i].exitcode)
+            record = self.last_derived[i]
+            if record is None:
+                value = "no record"
+            else:
+                value = "σ_a={:9.3f} kPa  ɛ_a={:8.4f} %".format(record["output_param"][0], record["output_param"][1])
+            print("{:10s} cpu {}  {:10s} samples/s {}  {}  overrun {}".format(
+                rig["name"], self.cpu[i], state, np.round(sample_rate[i], 1), value, self.raw_ring[i].num_overrun))
+
+    def summary(self):
+        # per rig samples/s of every channel over whole run and ring overrun
+        return [{"name": rig["name"],
+                 "cpu": self.cpu[i],
+                 "samples_per_sec": self.num_sample[i] / self.elapsed,
+                 "num_overrun": self.num_overrun[i],
+                 "exitcode": self.processes[i].exitcode}
+                for i, rig in enumerate(self.rigs)]
+
+    def close(self):
+        self.is_running.value = 0
+        for process in self.processes:
+            process.join(10.)
+            if process.is_alive():
+                print("worker {} does not stop, terminated".format(process.name))
+                process.terminate()
+                process.join()
+        self.drain()
+
+        if self.logger is not None:
+            for logger in self.logger:
+                logger.close()
+            self.logger = None
+        self.num_overrun = [ring.num_overrun for ring in self.raw_ring]
+        for ring in self.raw_ring + self.derived_ring:
+            ring.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="run several oedometer rigs from one host")
+    parser.add_argument("config", help="JSON list of rigs (keys of rig.DEFAULT_RIG)")
+    parser.add_argument("--log-dir", default=None, help="directory of log files, one <rig>.odolog per rig")
+    parser.add_argument("--simulate", action="store_true", help="use simulated HX711/ADS1115/DAC")
+    parser.add_argument("--duration", type=float, default=None, help="run time (s), default until Ctrl-C")
+    parser.add_argument("--no-raw", action="store_true", help="do not log raw samples")
+    parser.add_argument("--print-interval", type=float, default=5., help="interval of dashboard (s)")
+    parser.add_argument("--cpus", default=None, help="cores for supervisor and workers, e.g. 0,1,2,3")
+    args = parser.parse_args(argv)
+
+    rigs = load_rig_config(args.config)
+    cpus = None if args.cpus is None else [int(x) for x in args.cpus.split(",")]
+    supervisor = Supervisor(rigs, log_dir=args.log_dir, simulate=args.simulate, cpus=cpus,
+                            is_raw_saving=not args.no_raw, print_interval=args.print_interval)
+    signal.signal(signal.SIGINT, supervisor.stop)
+    signal.signal(signal.SIGTERM, supervisor.stop)
+    supervisor.run(args.duration)
+
+    for result in supervisor.summary():
+        print("{:10s} cpu {}  samples/s {}  overrun {}  exit {}".format(
+            result["name"], result["cpu"], np.round(result["samples_per_sec"], 1), result["num_overrun"],
+            result["exitcode"]))
+
+
+if __name__ == "__main__":
+    main()
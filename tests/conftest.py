@@ -0,0 +1,39 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# modules of the repository are top-level
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datalogger import DataLogger
+from derived import compute_specimen_parameter
+from ringbuffer import SAMPLE_DTYPE
+
+
+@pytest.fixture
+def raw_log(tmp_path):
+    # 4 s of raw samples : 3 HX711 channels at 80 Hz (ramp + sine), ADS1115 (CH3) at 128 Hz
+    records = []
+    for channel, rate in ((0, 80), (1, 80), (2, 80), (3, 128)):
+        t = np.arange(0., 4., 1 / rate)
+        record = np.zeros(len(t), dtype=SAMPLE_DTYPE)
+        record["channel"] = channel
+        record["seq"] = np.arange(len(t))
+        record["t_ns"] = (t * 1e9).astype(np.int64) + 1000000000
+        record["volts"] = 0.1 * (channel + 1) * t + 0.01 * np.sin(2 * np.pi * t)
+        record["module"] = channel if channel < 3 else -1
+        records.append(record)
+    records = np.concatenate(records)
+    records = records[np.argsort(records["t_ns"], kind="stable")]
+
+    path = str(tmp_path / "raw.odolog")
+    logger = DataLogger(path, {"raw": SAMPLE_DTYPE},
+                        header_info={"slope": [1., 1., 1., 1.], "intercept": [0., 0., 0., 0.],
+                                     "specimen_parameter": compute_specimen_parameter(150., 150., 84., 2.69),
+                                     "filter_setting": [["median", 5]]})
+    for i in range(0, len(records), 100):
+        logger.log("raw", records[i:i + 100])
+    logger.close()
+    return path
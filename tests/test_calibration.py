@@ -0,0 +1,27 @@
+import numpy as np
+
+from calibration import CalibrationSet, fit_profile
+
+
+def test_apply_matches_fitted_profiles():
+    volts = np.linspace(-1., 2., 13)
+    poly = fit_profile(volts, 3. + 40. * volts - 2.5 * volts ** 2, "LC-1", degree=2)
+    table = fit_profile(volts, 5. * volts + 0.1 * volts ** 3, "LVDT-1", kind="table")
+    np.testing.assert_allclose(poly["coefficients"], [-2.5, 40., 3.])
+    assert poly["max_residual"] < 1e-9
+    slope, intercept = [10., 1., 1., 1.], [0.5, -1., 2., 0.]
+    calibration = CalibrationSet({1: poly, 2: table}, slope, intercept)
+
+    channel = np.tile(np.arange(4), 20)
+    sample = np.repeat(np.linspace(-0.8, 1.9, 20), 4)
+    value = calibration.apply(channel, sample)
+
+    # profiled channels : profile plus intercept as offset, others : linear
+    np.testing.assert_allclose(value[channel == 0], 10. * sample[channel == 0] + 0.5)
+    np.testing.assert_allclose(value[channel == 1], np.polyval(poly["coefficients"], sample[channel == 1]) - 1.)
+    np.testing.assert_allclose(value[channel == 2], np.interp(sample[channel == 2], *table["table"]["up"]) + 2.)
+    np.testing.assert_allclose(value[channel == 3], sample[channel == 3])
+
+    # tare update is picked up
+    intercept[1] = 0.
+    np.testing.assert_allclose(calibration.apply([1], [0.3]), np.polyval(poly["coefficients"], 0.3))
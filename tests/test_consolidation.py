@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+
+from consolidation import casagrande_t50
+
+
+def _terzaghi_settlement(t, t50, initial, final):
+    # Sivakugan approximation of U(Tv)
+    Tv = 0.197 * t / t50
+    degree = np.sqrt(4 * Tv / np.pi) / (1 + (4 * Tv / np.pi) ** 2.8) ** 0.179
+    return initial + final * degree
+
+
+@pytest.mark.parametrize("t_start", [0.1, 3.])
+def test_casagrande_t50_with_offset_and_late_first_point(t_start):
+    # d0 read at first grid point must not be pulled toward zero by smoothing
+    t = np.logspace(np.log10(t_start), 4, 200)
+    assert casagrande_t50(t, _terzaghi_settlement(t, 60., 0.5, 2.)) == pytest.approx(60., rel=0.02)
@@ -0,0 +1,65 @@
+import time
+
+import numpy as np
+
+from hx711_simulator import create_simulated_bank
+from multihx711 import MultiHX711, decode_bit_matrix, decode_words
+
+
+def _bank(num_mod=3, rate=80, **kwargs):
+    pin_DT = tuple(range(2, 2 + num_mod))
+    input_mV = [0.1 * (i + 1) for i in range(num_mod)]
+    backend = create_simulated_bank(pin_DT, 1, rate=rate, input_mV=input_mV, seed=0)
+    hx = MultiHX711(num_mod=num_mod, pin_DT=pin_DT, pin_SCK=1, backend=backend, **kwargs)
+    return hx, [backend.chip_by_DT[pin] for pin in pin_DT]
+
+
+def _read(hx, num_read, timeout=5.):
+    # (updated mask, seq) of num_read updated reads
+    result = []
+    deadline = time.monotonic() + timeout
+    while len(result) < num_read and time.monotonic() < deadline:
+        is_updated, value = hx.read_value()
+        if is_updated:
+            result.append((hx.ch_updated_mask.copy(), hx.ch_seq.copy()))
+    assert len(result) == num_read
+    return result
+
+
+def test_rejected_module_does_not_drop_other_modules():
+    hx, chips = _bank(max_sck_high=None)
+    _read(hx, 4)
+
+    # step on module 1 only : its first sample is held as outlier, then confirmed
+    chips[1].input_mV = 15.
+    result = _read(hx, 3)
+    np.testing.assert_array_equal([mask for mask, seq in result], [[True, False, True], [True, True, True], [True, True, True]])
+    assert result[-1][1][0] - result[-1][1][1] == 1
+    np.testing.assert_array_equal(hx.ch_num_rejected, [0, 1, 0])
+    assert abs(hx.prev_vol_value[1] - 15.) < 0.01
+
+
+def _code(input_mV, gain=128, input_vol=5):
+    # signed code of simulated chip for input_mV
+    code = int(round(input_mV / (input_vol / gain * 1000) * 0xFFFFFF))
+    return max(-0x800000, min(0x7FFFFF, code))
+
+
+def test_decode_words_two_complement():
+    word = np.array([0x000000, 0x000001, 0x7FFFFF, 0x800000, 0x800001, 0xFFFFFF])
+    np.testing.assert_array_equal(decode_words(word), [0, 1, 0x7FFFFF, -0x800000, -0x7FFFFF, -1])
+
+    # MSB first bit matrix, one column per module
+    bits = (word[np.newaxis, :] >> np.arange(23, -1, -1)[:, np.newaxis]) & 1
+    np.testing.assert_array_equal(decode_bit_matrix(bits), decode_words(word))
+
+
+def test_read_value_decodes_simulated_chip():
+    hx, chips = _bank(max_sck_high=None)
+    input_mV = [-12.3, 0.05, 19.]
+    for chip, value in zip(chips, input_mV):
+        chip.input_mV = value
+    _read(hx, 6)
+
+    np.testing.assert_array_equal(hx.prev_raw_value, [_code(value) for value in input_mV])
+    np.testing.assert_allclose(hx.prev_vol_value, input_mV, atol=1e-5)
@@ -0,0 +1,18 @@
+import numpy as np
+
+from derived import compute_output_param, compute_specimen_parameter
+from plant_simulator import OedometerPlant
+
+
+def test_phi_val_round_trips_plant_state():
+    specimen_parameter = compute_specimen_parameter(150., 150., 84., 2.69)
+    plant = OedometerPlant(specimen_parameter)
+    for i in range(200):
+        plant.step(30000, 0.5)
+
+    output_param = compute_output_param(plant.phi_val(), specimen_parameter)
+    water = plant.strain / 100 * specimen_parameter[3]
+    np.testing.assert_allclose(output_param[0], plant.stress)
+    np.testing.assert_allclose(output_param[1], plant.strain)
+    np.testing.assert_allclose(output_param[2:4], [water, water])
+    assert abs(output_param[4]) < 1e-9
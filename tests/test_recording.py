@@ -0,0 +1,35 @@
+import numpy as np
+
+from recording import AdaptiveRecorder
+
+
+def _consolidation(t):
+    # 2 load increments of 200 s : stress steps, settlement ~ sqrt(t) to t50 = 20 s, small noise
+    rng = np.random.default_rng(0)
+    step_time = np.where(t < 200, t, t - 200)
+    stress = np.where(t < 200, 50., 100.)
+    settlement = np.where(t < 200, 0., 0.4) + 0.4 * np.sqrt(step_time / (step_time + 20.))
+    water = 2. * settlement + rng.normal(0, 0.002, len(t))
+    return stress, np.column_stack([stress + rng.normal(0, 0.05, len(t)), settlement, water])
+
+
+def test_interpolation_error_within_deadband():
+    deadband = [0.5, 0.005, 0.01]
+    recorder = AdaptiveRecorder(deadband, min_interval=0.1, max_interval=30.)
+    t = np.arange(0., 400., 0.1)
+    stress, phi_val = _consolidation(t)
+
+    kept = []
+    for i in range(len(t)):
+        kept += recorder.update(t[i], phi_val[i], stress[i], i)
+    kept += recorder.flush()
+
+    assert kept[0] == 0 and kept[-1] == len(t) - 1
+    assert kept == sorted(set(kept))
+    assert recorder.num_step == 2
+    assert 2000 in kept
+    assert len(kept) < len(t) / 5
+
+    for channel in range(phi_val.shape[1]):
+        interpolated = np.interp(t, t[kept], phi_val[kept, channel])
+        assert np.max(np.abs(interpolated - phi_val[:, channel])) <= deadband[channel] + 1e-12
@@ -0,0 +1,25 @@
+import numpy as np
+
+from datalogger import iter_chunks
+from replay import replay_pipeline
+
+
+def _logged_derived(path):
+    return np.concatenate([data for header, name, data in iter_chunks(path) if name == "derived"])
+
+
+def test_replay_rows_are_values_of_each_tick(raw_log, tmp_path):
+    out_path = str(tmp_path / "replayed.odolog")
+    derived = replay_pipeline(raw_log, out_path=out_path)
+
+    assert len(derived) >= 8
+    assert len(np.unique(derived["vol"][:, 0])) == len(derived)
+    logged = _logged_derived(out_path)
+    for name in ("t_ns", "time", "vol", "phi_val", "output_param"):
+        np.testing.assert_array_equal(derived[name], logged[name])
+
+
+def test_replay_is_deterministic(raw_log):
+    first = replay_pipeline(raw_log)
+    second = replay_pipeline(raw_log)
+    np.testing.assert_array_equal(first, second)
@@ -0,0 +1,43 @@
+import numpy as np
+
+from ringbuffer import SAMPLE_DTYPE, SharedRingBuffer
+
+
+def _records(start, num):
+    records = np.zeros(num, dtype=SAMPLE_DTYPE)
+    records["seq"] = np.arange(start, start + num)
+    return records
+
+
+def test_push_counts_overrun_and_keeps_newest():
+    ring = SharedRingBuffer(SAMPLE_DTYPE, capacity=8)
+    try:
+        for record in _records(0, 20):
+            ring.push(record)
+        assert ring.num_overrun == 12
+        assert len(ring) == 8
+
+        np.testing.assert_array_equal(ring.read()["seq"], np.arange(12, 20))
+        assert ring.num_lost == 12
+        assert len(ring) == 0
+    finally:
+        ring.close()
+
+
+def test_push_many_matches_push_accounting():
+    ring = SharedRingBuffer(SAMPLE_DTYPE, capacity=8)
+    try:
+        ring.push_many(_records(0, 5))
+        np.testing.assert_array_equal(ring.read()["seq"], np.arange(5))
+        assert ring.num_overrun == 0
+
+        # wraps around, 2 over capacity, then a block larger than capacity
+        ring.push_many(_records(5, 10))
+        assert ring.num_overrun == 2
+        ring.push_many(_records(15, 11))
+        assert ring.num_overrun == 13
+
+        np.testing.assert_array_equal(ring.read()["seq"], np.arange(18, 26))
+        assert ring.num_lost == 13
+    finally:
+        ring.close()
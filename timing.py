@@ -0,0 +1,105 @@
+################################################################################################
+# Timing statistics of acquisition
+#
+# IntervalStatistics : inter-sample interval (mean, std = jitter, min, max) per channel,
+#                      updated block by block from timestamped records (t_ns)
+# LoopStatistics     : period, lateness against absolute deadline and missed deadlines
+#                      of fixed-rate loop
+################################################################################################
+
+import numpy as np
+
+
+class IntervalStatistics():
+    def __init__(self, num_channel):
+        self.num_channel = num_channel
+        self.reset()
+
+    def reset(self):
+        self.last_t_ns = np.full(self.num_channel, -1, dtype=np.int64)
+        self.count = np.zeros(self.num_channel, dtype=np.int64)
+        self.mean = np.zeros(self.num_channel, dtype=np.float64)
+        self.m2 = np.zeros(self.num_channel, dtype=np.float64)
+        self.min = np.full(self.num_channel, np.inf)
+        self.max = np.zeros(self.num_channel, dtype=np.float64)
+
+    def update(self, channel, t_ns):
+        # channel, t_ns : arrays of one block of records (ordered in time per channel)
+        channel = np.asarray(channel)
+        t_ns = np.asarray(t_ns, dtype=np.int64)
+        
+        for i in range(self.num_channel):
+            t_ch = t_ns[channel == i]
+            if len(t_ch) == 0:
+                continue
+            
+            if self.last_t_ns[i] >= 0:
+                interval = np.diff(t_ch, prepend=self.last_t_ns[i])
+            else:
+                interval = np.diff(t_ch)
+            self.last_t_ns[i] = t_ch[-1]
+            
+            if len(interval) == 0:
+                continue
+            
+            self._merge(i, interval * 1e-9)
+
+    def _merge(self, i, interval):
+        # combine block statistics with running ones (Chan et al.)
+        n_b = len(interval)
+        mean_b = interval.mean()
+        m2_b = ((interval - mean_b) ** 2).sum()
+        
+        n_a = self.count[i]
+        n = n_a + n_b
+        delta = mean_b - self.mean[i]
+        
+        self.mean[i] += delta * n_b / n
+        self.m2[i] += m2_b + delta ** 2 * n_a * n_b / n
+        self.count[i] = n
+        self.min[i] = min(self.min[i], interval.min())
+        self.max[i] = max(self.max[i], interval.max())
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / np.maximum(self.count - 1, 1))
+
+    def summary(self):
+        # interval statistics per channel (s)
+        std = self.std
+        return [{"count": int(self.count[i]),
+                 "mean": self.mean[i],
+                 "std": std[i],
+                 "min": self.min[i] if self.count[i] else 0.,
+                 "max": self.max[i]} for i in range(self.num_channel)]
+
+
+class LoopStatistics():
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.period = IntervalStatistics(1)
+        self.num_tick = 0
+        self.num_missed_deadline = 0
+        self.lateness_sum = 0.
+        self.lateness_max = 0.
+
+    def update(self, t_ns, lateness_ns, num_missed=0):
+        self.period.update((0,), (t_ns,))
+        self.num_tick += 1
+        self.num_missed_deadline += num_missed
+        lateness = lateness_ns * 1e-9
+        self.lateness_sum += lateness
+        self.lateness_max = max(self.lateness_max, lateness)
+
+    def summary(self):
+        period = self.period.summary()[0]
+        return {"num_tick": self.num_tick,
+                "period_mean": period["mean"],
+                "period_std": period["std"],
+                "period_min": period["min"],
+                "period_max": period["max"],
+                "lateness_mean": self.lateness_sum / max(self.num_tick, 1),
+                "lateness_max": self.lateness_max,
+                "num_missed_deadline": self.num_missed_deadline}
@@ -0,0 +1,98 @@
+################################################################################################
+# Setpoint trajectories of loading stages
+#
+# A test program (list of stages) is compiled once into arrays sampled every dt, so that
+# the control loop only looks up setpoint by index at every tick.
+#   Ramp  : from previous value to target at rate (per s)
+#   Hold  : keep previous value for duration (s)
+#   Cycle : num_cycle sinusoidal / triangular cycles around mean
+# quantity : STRESS (σ_a, kPa) or STRAIN (ɛ_a, %)
+################################################################################################
+
+import numpy as np
+
+
+STRESS = 0
+STRAIN = 1
+
+
+class Ramp():
+    def __init__(self, target, rate, quantity=STRESS):
+        if rate <= 0:
+            raise ValueError("Rate of ramp (rate) should be positive")
+        self.target = target
+        self.rate = rate
+        self.quantity = quantity
+
+    def compile(self, start, dt):
+        num = max(1, int(np.ceil(abs(self.target - start) / self.rate / dt)))
+        return np.linspace(start, self.target, num + 1)[1:]
+
+
+class Hold():
+    def __init__(self, duration, quantity=STRESS, value=None):
+        self.duration = duration
+        self.quantity = quantity
+        self.value = value
+
+    def compile(self, start, dt):
+        num = max(1, int(round(self.duration / dt)))
+        return np.full(num, start if self.value is None else self.value)
+
+
+class Cycle():
+    def __init__(self, mean, amplitude, period, num_cycle, shape="sine", quantity=STRESS):
+        if period <= 0:
+            raise ValueError("Period of cycle (period) should be positive")
+        if shape not in ("sine", "triangle"):
+            raise ValueError("Shape of cycle (shape) should be 'sine' or 'triangle'")
+        self.mean = mean
+        self.amplitude = amplitude
+        self.period = period
+        self.num_cycle = num_cycle
+        self.shape = shape
+        self.quantity = quantity
+
+    def compile(self, start, dt):
+        num = max(1, int(round(self.period * self.num_cycle / dt)))
+        phase = np.arange(1, num + 1) * dt / self.period
+        if self.shape == "sine":
+            wave = np.sin(2 * np.pi * phase)
+        else:
+            # starts at mean going up, same phase as sine
+            wave = 2 / np.pi * np.arcsin(np.sin(2 * np.pi * phase))
+        return self.mean + self.amplitude * wave
+
+
+class Trajectory():
+    def __init__(self, setpoint, quantity, dt):
+        self.setpoint = setpoint
+        self.quantity = quantity
+        self.dt = dt
+        self.num = len(setpoint)
+        self.duration = self.num * dt
+
+    def lookup(self, elapsed_time):
+        # (setpoint, quantity, is_finished) at elapsed time (s) from program start
+        index = int(elapsed_time / self.dt)
+        if index >= self.num:
+            return self.setpoint[-1], self.quantity[-1], True
+        return self.setpoint[index], self.quantity[index], False
+
+
+def compile_program(stages, start_stress, start_strain, dt):
+    # compile list of stages into one trajectory sampled every dt (s)
+    last_value = {STRESS: start_stress, STRAIN: start_strain}
+    setpoint = []
+    quantity = []
+    
+    for stage in stages:
+        values = stage.compile(last_value[stage.quantity], dt)
+        setpoint.append(values)
+        quantity.append(np.full(len(values), stage.quantity, dtype=np.int8))
+        last_value[stage.quantity] = values[-1]
+    
+    if not setpoint:
+        raise ValueError("Program should have at least one stage")
+    
+    return Trajectory(np.concatenate(setpoint), np.concatenate(quantity), dt)
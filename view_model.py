@@ -0,0 +1,42 @@
+################################################################################################
+# View model of GUI window
+#
+# Caches element handles and the text last pushed to each element, so that refresh only
+# calls Update() for values whose formatted text changed.
+################################################################################################
+
+
+class ViewModel():
+    def __init__(self, window, default_format="{:.6f}"):
+        self.window = window
+        self.default_format = default_format
+        self.element_by_key = {}
+        self.text_by_key = {}
+        self.num_push = 0
+        self.num_skip = 0
+
+    def element(self, key):
+        element = self.element_by_key.get(key)
+        if element is None:
+            element = self.window.Element(key)
+            self.element_by_key[key] = element
+        return element
+
+    def set(self, key, value, value_format=None):
+        # returns True if element was updated
+        text = (value_format or self.default_format).format(value)
+        if self.text_by_key.get(key) == text:
+            self.num_skip += 1
+            return False
+
+        self.element(key).Update(value=text)
+        self.text_by_key[key] = text
+        self.num_push += 1
+        return True
+
+    def invalidate(self, key=None):
+        # text of element edited by user is unknown, push next value
+        if key is None:
+            self.text_by_key.clear()
+        else:
+            self.text_by_key.pop(key, None)